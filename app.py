@@ -1,22 +1,298 @@
 
+import gzip
 import os
 import re
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+import secrets
+import threading
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for
+from flask.json.provider import DefaultJSONProvider
 
-from ictu_service import ICTUService
+import log_config
+import tracing
+from ictu_service import ICTUService, transport_stats
+from metrics import CONTENT_TYPE, REGISTRY, TIMETABLE_FALLBACKS
+from portal_guard import STATE_VALUES, portal_guard
+from refresh_scheduler import RefreshScheduler
+from result_cache import DEFAULT_TTLS, ResultCache, SharedResult
+from session_pool import SessionPool
+from session_store import session_store
+from shared_cache import shared_cache
+from timetable_reader import compact_rows
+
+# LOG_LEVEL / LOG_LEVELS / LOG_DEBUG_SAMPLE_RATE, xem log_config
+log_config.configure()
+log = log_config.get_logger(__name__)
+if session_store.disabled_reason:
+    log.warning("Session store tắt: %s. Người dùng phải đăng nhập lại sau mỗi lần restart/deploy",
+                session_store.disabled_reason)
+
+# Mỗi người dùng (Flask session) có một ICTUService riêng trong pool
+session_pool = SessionPool(
+    ICTUService,
+    max_sessions=int(os.environ.get('SESSION_POOL_MAX', 500)),
+    idle_ttl=int(os.environ.get('SESSION_POOL_IDLE_TTL', 1800)),
+)
+
+# Số tuần lớn nhất nhận trong tham số week nhiều tuần (portal chỉ có vài chục tuần mỗi học kỳ),
+# các tuần không có trong drpTuan của portal bị bỏ ở ICTUService._timetable_weeks
+TIMETABLE_MAX_WEEK = int(os.environ.get('TIMETABLE_MAX_WEEK', 60))
+
+# Nén gzip response /api/* từ kích thước này (byte) khi client gửi Accept-Encoding: gzip
+GZIP_MIN_BYTES = int(os.environ.get('GZIP_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+
+# Kết quả đã parse (điểm, lịch thi, TKB) theo từng user, dùng chung giữa các worker qua shared_cache
+result_cache = ResultCache(shared=shared_cache)
+# Học kỳ / năm học / tuần giống nhau với mọi sinh viên: cache chung, mỗi TTL gọi portal một lần
+timetable_options = SharedResult(DEFAULT_TTLS['timetable_options'], shared=shared_cache,
+                                 key=('*', 'timetable_options', ()))
+# Lấy trước sau khi đăng nhập và làm mới ở nền các kết quả sắp hết hạn, xem refresh_scheduler
+refresher = RefreshScheduler(result_cache)
+# Service bị loại khỏi pool thì bỏ luôn các job làm mới nền của nó
+session_pool.on_remove = refresher.forget_service
+# Các request đầu tiên của cùng một người chỉ khôi phục phiên từ session_store một lần
+_restore_lock = threading.Lock()
+
+
+def _collect_pool_metrics():
+    """Số liệu của session pool và result cache, đọc từ stats() mỗi lần scrape /metrics"""
+    pool, cache, options = session_pool.stats(), result_cache.stats(), timetable_options.stats()
+    refresh = refresher.stats()
+    guard = portal_guard.stats()
+    transport = transport_stats()
+    store = session_store.stats()
+    shared = shared_cache.stats()
+    return [
+        ('tkb_sessions_live', 'gauge', 'Số ICTUService đang sống trong session pool', [({}, pool['liveSessions'])]),
+        ('tkb_session_pool_lookups_total', 'counter', 'Lấy service từ session pool: hit = dùng lại, miss = tạo mới',
+         [({'result': 'hit'}, pool['hits']), ({'result': 'miss'}, pool['misses'])]),
+        ('tkb_session_pool_removals_total', 'counter', 'Service bị loại khỏi pool (LRU hoặc hết idle TTL)',
+         [({'reason': 'evicted'}, pool['evictions']), ({'reason': 'expired'}, pool['expirations'])]),
+        ('tkb_result_cache_lookups_total', 'counter', 'Tra result cache (điểm, lịch thi, TKB)',
+         [({'result': 'hit'}, cache['hits']), ({'result': 'stale'}, cache['staleHits']),
+          ({'result': 'coalesced'}, cache['coalesced']), ({'result': 'miss'}, cache['misses'])]),
+        ('tkb_result_cache_stale_on_error_total', 'counter',
+         'Portal lỗi/timeout nên trả kết quả cũ còn trong max stale', [({}, cache['staleOnError'])]),
+        ('tkb_result_cache_evictions_total', 'counter', 'Kết quả bị loại khỏi result cache khi vượt giới hạn byte',
+         [({}, cache['evictions'])]),
+        ('tkb_result_cache_entries', 'gauge', 'Số kết quả đang nằm trong result cache', [({}, cache['entries'])]),
+        ('tkb_result_cache_bytes', 'gauge', 'Kích thước (JSON) các kết quả trong result cache', [({}, cache['bytes'])]),
+        ('tkb_timetable_options_lookups_total', 'counter',
+         'Lấy tùy chọn TKB dùng chung: hit = có sẵn, coalesced = chờ lần lấy đang chạy, fetch = gọi portal',
+         [({'result': 'hit'}, options['hits']), ({'result': 'coalesced'}, options['coalesced']),
+          ({'result': 'fetch'}, options['fetches'])]),
+        ('tkb_cache_refresh_total', 'counter',
+         'Lấy kết quả ở nền: prefetched = sau login, refreshed = trước khi hết TTL, failed = lỗi, '
+         'deferred = hàng đợi đầy, để lượt sau',
+         [({'result': name}, refresh[name]) for name in ('prefetched', 'refreshed', 'failed', 'deferred')]),
+        ('tkb_cache_refresh_in_flight', 'gauge', 'Số lần lấy nền đang chạy hoặc chờ thread',
+         [({}, refresh['inFlight'])]),
+        ('tkb_shared_cache_total', 'counter',
+         'Cache dùng chung giữa các worker: hit = lấy được kết quả worker khác đã lưu, write = lưu kết quả mới',
+         [({'result': 'hit'}, shared['hits']), ({'result': 'miss'}, shared['misses']),
+          ({'result': 'write'}, shared['writes']), ({'result': 'error'}, shared['errors'])]),
+        ('tkb_session_store_total', 'counter',
+         'Phiên portal lưu/khôi phục qua session store: restored = không phải đăng nhập lại, '
+         'miss = không có bản lưu hoặc quá hạn',
+         [({'result': 'saved'}, store['saved']), ({'result': 'restored'}, store['restored']),
+          ({'result': 'miss'}, store['misses']), ({'result': 'error'}, store['errors'])]),
+        ('tkb_portal_connections_opened_total', 'counter',
+         'Kết nối TCP tới portal đã mở qua pool dùng chung (bản sync)', [({}, transport['connectionsOpened'])]),
+        ('tkb_portal_connections_idle', 'gauge', 'Kết nối keep-alive đang rảnh trong pool dùng chung',
+         [({}, transport['idleConnections'])]),
+        ('tkb_portal_breaker_state', 'gauge', 'Circuit breaker tới portal: 0 = closed, 1 = half_open, 2 = open',
+         [({}, STATE_VALUES[guard['state']])]),
+        ('tkb_portal_timeout_seconds', 'gauge', 'Timeout hiện tại theo latency của từng trang portal',
+         [({'method': name.split(' ', 1)[0], 'page': name.split(' ', 1)[1]}, value)
+          for name, value in guard['timeouts'].items()]),
+    ]
+
+
+REGISTRY.register_collector(_collect_pool_metrics)
+
+class TracedJSONProvider(DefaultJSONProvider):
+    """jsonify() ghi thời gian tạo JSON thành span 'serialize' của trace request"""
+
+    def response(self, *args, **kwargs):
+        with tracing.span('serialize'):
+            return super().response(*args, **kwargs)
 
-# Biến toàn cục cho ICTUService
-ictu_service = None
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'  # Thay đổi thành secret key của bạn
+app.json = TracedJSONProvider(app)
+
+
+@app.before_request
+def _start_request_logging():
+    # Quyết định request này có được ghi log debug (lấy mẫu) hay không
+    log_config.sample_request()
+    # Mỗi request /api/* có trace riêng, các request khác không ghi span
+    tracing.start_request(request.path.startswith('/api/'))
+    log.debug("%s %s route called", request.method, request.path)
+
+
+@app.after_request
+def _add_server_timing(response):
+    """Header Server-Timing cho mọi response /api/*, thêm khối 'trace' vào JSON khi có ?trace=1,
+    rồi nén gzip nếu client nhận (span 'compress')"""
+    trace = tracing.current()
+    if trace is None:
+        return response
+    if request.args.get('trace') == '1' and response.is_json:
+        data = response.get_json(silent=True)
+        if isinstance(data, dict):
+            data['trace'] = trace.as_dict()
+            response.set_data(app.json.dumps(data))
+    with tracing.span('compress'):
+        _gzip(response)
+    response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+
+def _gzip(response):
+    """Nén body JSON bằng gzip khi client gửi Accept-Encoding: gzip và body từ GZIP_MIN_BYTES trở lên"""
+    if response.status_code != 200 or response.direct_passthrough or not response.is_json \
+            or 'Content-Encoding' in response.headers:
+        return
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return
+    data = response.get_data()
+    if len(data) < GZIP_MIN_BYTES:
+        return
+    response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+
+
+def _get_service(create=True):
+    """Lấy ICTUService của người dùng hiện tại từ pool"""
+    sid = session.get('sid')
+    if not sid:
+        if not create:
+            return None
+        sid = secrets.token_urlsafe(16)
+        session['sid'] = sid
+    # Người dùng đã đăng nhập nhưng worker chưa có service (restart, worker khác, bị loại khỏi pool):
+    # tạo service và khôi phục phiên portal từ session_store thay vì bắt đăng nhập lại
+    logged_in = bool(session.get('logged_in'))
+    service = session_pool.get(sid, create=create or logged_in)
+    if service is not None and service.store_id is None:
+        with _restore_lock:
+            if service.store_id is None:
+                if logged_in:
+                    service._load_session(sid)
+                service.store_id = sid
+    return service
+
+
+def _logged_in_service():
+    """ICTUService đã đăng nhập của người dùng hiện tại, None nếu chưa đăng nhập.
+    Không tạo entry mới trong pool: chỉ /login tạo service cho người dùng chưa đăng nhập."""
+    if not session.get('logged_in'):
+        return None
+    service = _get_service(create=False)
+    if service is None or not service.is_logged_in:
+        return None
+    return service
+
+
+def _not_logged_in():
+    return jsonify({"error": True, "message": "Chưa đăng nhập vào hệ thống"}), 401
+
+
+def _portal_error(result):
+    """Response cho kết quả lỗi của ICTUService khi không có kết quả cũ để trả thay (timeout 408,
+    portal lỗi 503...): trả nguyên body lỗi với status của nó thay vì danh sách rỗng. 401 (phiên
+    portal hết hạn mà không tự đăng nhập lại được) đưa người dùng về đăng nhập như chưa đăng nhập."""
+    if result.get('status') == 401:
+        return _not_logged_in()
+    return jsonify(result), result.get('status', 500)
+
 
+def _cached(ictu_service, resource, fetch, **params):
+    """Lấy kết quả qua result cache (key = user + tham số), ?refresh=1 để bỏ qua cache. Các request
+    trùng key đang chạy cùng lúc dùng chung một lần gọi portal.
+    Trả về (kết quả, CacheEntry hoặc None nếu kết quả không được cache)"""
+    user = ictu_service.last_username
+    if not user or not ictu_service.is_logged_in:
+        return fetch(), None
+    refresh = request.args.get('refresh') == '1'
+    refresher.touch(ictu_service, resource, params, fetch)
+    # Kết quả đã hết TTL (còn trong max stale) được trả ngay và lấy lại ở nền
+    revalidate = None
+    if refresher.enabled:
+        revalidate = lambda: refresher.revalidate(ictu_service, resource, params, fetch)
+    return result_cache.fetch_entry(user, resource, params, fetch, refresh=refresh, revalidate=revalidate)
 
 
+def _freshness(payload, entry):
+    """Đánh dấu response trả kết quả cũ (hết TTL, portal chậm/lỗi): stale=True và age (giây)"""
+    if entry is not None and entry.stale:
+        payload['stale'] = True
+        payload['age'] = int(entry.age)
+    return payload
+
+
+def _prefetch_after_login(ictu_service):
+    """Lấy trước điểm, lịch thi và TKB tuần hiện tại (cùng key với route khi không có tham số)"""
+    refresher.prefetch(ictu_service, [
+        ('scores', {}, ictu_service.get_scores),
+        ('exams', {}, ictu_service.get_exam_schedule),
+        ('timetable', {}, ictu_service.get_student_timetable_excel),
+    ])
+
+
+def _not_modified(entry, variant=None):
+    """304 nếu client đã có đúng kết quả này (If-None-Match khớp ETag lưu trên entry), không cần
+    chuẩn hóa hay serialize lại gì"""
+    if entry is not None and request.if_none_match.contains_weak(_etag(entry, variant)):
+        return _with_etag(Response(status=304), entry, variant)
+    return None
+
+
+def _with_etag(response, entry, variant=None):
+    """Gắn ETag (weak: cùng kết quả thì cùng nội dung JSON) để client poll bằng If-None-Match"""
+    if entry is not None:
+        response.set_etag(_etag(entry, variant), weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _etag(entry, variant):
+    """ETag của kết quả; mỗi cách trình bày khác (ví dụ format=compact) có ETag riêng"""
+    return f"{entry.etag}-{variant}" if variant else entry.etag
+
+
+def _parse_weeks(value):
+    """Tham số week nhiều tuần: 'all', khoảng '3-8' hoặc danh sách '3,5,7' (trộn được: '1-3,7').
+    Trả về 'all' / danh sách tuần, None nếu chỉ là một tuần (hoặc không có).
+    ValueError nếu có phần không phải số tuần / khoảng tuần, hoặc tuần nằm ngoài 1..TIMETABLE_MAX_WEEK."""
+    if not value:
+        return None
+    value = value.strip().lower()
+    if value == 'all':
+        return 'all'
+    if '-' not in value and ',' not in value:
+        return None
+    weeks = []
+    for part in value.split(','):
+        start, sep, end = (bound.strip() for bound in part.partition('-'))
+        if not part.strip():
+            continue
+        if not start.isdigit() or (sep and not end.isdigit()):
+            raise ValueError(f"Tuần không hợp lệ: {part.strip()}")
+        first, last = int(start), int(end) if sep else int(start)
+        if not 1 <= first <= last <= TIMETABLE_MAX_WEEK:
+            raise ValueError(f"Tuần phải nằm trong khoảng 1-{TIMETABLE_MAX_WEEK}: {part.strip()}")
+        weeks.extend(str(week) for week in range(first, last + 1))
+    if not weeks:
+        raise ValueError("Danh sách tuần rỗng")
+    return list(dict.fromkeys(weeks))
+
 
 @app.route('/scores')
 def scores():
-    print('[DEBUG] /scores route called')
     return jsonify({'error': True, 'message': 'Not implemented'}), 501
 
 
@@ -27,46 +303,33 @@ def page_not_found(e):
 @app.route('/')
 def index():
     """Trang chủ"""
-    global ictu_service
-    print('[DEBUG] / route called')
-    # Nếu chưa có service, khởi tạo và thử restore session
-    if not ictu_service:
-        print('[DEBUG] Khởi tạo ICTUService')
-        ictu_service = ICTUService()
-        # Nếu service đã restore session thành công, cập nhật Flask session
-        if ictu_service.is_logged_in and ictu_service.last_username:
-            print('[DEBUG] Đã restore session thành công')
-            session['logged_in'] = True
-            session['user_info'] = {
-                'name': 'Auto-restored',  # Tên sẽ được cập nhật khi gọi API
-                'studentId': 'Đang tải...',
-                'studentDuration': 'Đang tải...'
-            }
+    # Người dùng đã đăng nhập mà worker chưa có service: khôi phục từ session_store (không tạo
+    # service cho người chưa đăng nhập)
+    _get_service(create=False)
     if 'logged_in' not in session:
-        print('[DEBUG] Chưa đăng nhập, chuyển hướng login')
+        log.debug('Chưa đăng nhập, chuyển hướng login')
         return redirect(url_for('login'))
-    print(f"[DEBUG] user_info: {session.get('user_info')}")
+    log.debug("user_info: %s", session.get('user_info'))
     return jsonify({'user_info': session.get('user_info')})
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     """Trang đăng nhập"""
-    print(f"[DEBUG] /login route called, method={request.method}")
     if request.method == 'GET':
         return jsonify({'message': 'Login page'})
     try:
         data = request.get_json() if request.is_json else request.form
-        print(f"[DEBUG] Login data: {data}")
         username = data.get('username')
         password = data.get('password')
         if not username or not password:
-            print('[DEBUG] Thiếu username hoặc password')
+            log.debug('Thiếu username hoặc password')
             return jsonify({"error": True, "message": "Vui lòng nhập đầy đủ thông tin"})
-        # Đăng nhập thật qua ICTUService
-        global ictu_service
-        ictu_service = ICTUService()
+        # Đăng nhập thật qua ICTUService của người dùng (giữ lại session đã warm)
+        ictu_service = _get_service()
+        if ictu_service.is_logged_in and ictu_service.last_username != username:
+            ictu_service.logout()
         result = ictu_service.login(username, password)
-        print(f"[DEBUG] Kết quả login: {result}")
+        log.debug("Kết quả login cho %s: error=%s", username, result.get('error'))
         if not result["error"]:
             session['logged_in'] = True
             session['user_info'] = {
@@ -78,186 +341,244 @@ def login():
             }
             # Luôn trả về avatar mặc định
             result['avatar_url'] = 'https://cdn-icons-png.flaticon.com/512/3135/3135715.png'
-            print(f"[DEBUG] Đăng nhập thành công, session user_info: {session['user_info']}")
+            log.debug("Đăng nhập thành công, session user_info: %s", session['user_info'])
+            _prefetch_after_login(ictu_service)
             return jsonify(result)
         else:
-            print('[DEBUG] Đăng nhập thất bại')
+            log.info("Đăng nhập thất bại: %s", result.get('message'))
             return jsonify(result)
     except Exception as e:
-        print(f"[ERROR] Lỗi server khi login: {str(e)}")
+        log.exception("Lỗi server khi login: %s", e)
         return jsonify({"error": True, "message": f"Lỗi server: {str(e)}"})
 
 @app.route('/logout')
 def logout():
     """Đăng xuất"""
-    print('[DEBUG] /logout route called')
-    global ictu_service
-    # Gọi logout trên service để xóa session file
+    # Gọi logout trên service và bỏ service khỏi pool
+    ictu_service = _get_service(create=False)
     if ictu_service:
-        print('[DEBUG] Gọi ictu_service.logout()')
+        if ictu_service.last_username:
+            refresher.forget(ictu_service.last_username)
+            result_cache.invalidate_user(ictu_service.last_username)
+        log.debug('Gọi ictu_service.logout()')
         ictu_service.logout()
+    session_pool.discard(session.get('sid'))
     session.clear()
-    ictu_service = None
-    print('[DEBUG] Đã logout, chuyển hướng login')
+    log.debug('Đã logout, chuyển hướng login')
     return redirect(url_for('login'))
 
 @app.route('/api/lichthi')
 def api_lichthi():
     """API lấy lịch thi từ ICTUService"""
-    print('[DEBUG] /api/lichthi route called')
-    global ictu_service
-    if not ictu_service:
-        print('[DEBUG] Khởi tạo ICTUService')
-        ictu_service = ICTUService()
+    ictu_service = _logged_in_service()
+    if ictu_service is None:
+        return _not_logged_in()
     try:
-        result = ictu_service.get_exam_schedule()
-        print(f"[DEBUG] Kết quả get_exam_schedule: {result}")
+        result, entry = _cached(ictu_service, 'exams', ictu_service.get_exam_schedule)
+        log.debug("Kết quả get_exam_schedule: error=%s, %d lịch thi", result.get('error'), len(result.get('lichthiData', [])))
+        if result.get('error'):
+            log.warning("Lỗi khi lấy lịch thi: %s", result.get('message'))
+            return _portal_error(result)
+        not_modified = _not_modified(entry)
+        if not_modified:
+            return not_modified
         # Chuẩn hóa dữ liệu trả về cho frontend
-        lichthiData = []
-        for row in result.get('lichthiData', []):
-            lichthiData.append({
-                'maHP': row.get('maHP', ''),
-                'tenHP': row.get('tenHP', ''),
-                'soTC': row.get('soTC', ''),
-                'ngayThi': row.get('ngayThi', ''),
-                'caThi': row.get('caThi', ''),
-                'hinhThucThi': row.get('hinhThucThi', ''),
-                'soBaoDanh': row.get('soBaoDanh', ''),
-                'phongThi': row.get('phongThi', ''),
-                'ghiChu': row.get('ghiChu', '')
-            })
-        return jsonify({
+        with tracing.span('normalize', 'lichthi'):
+            lichthiData = []
+            for row in result.get('lichthiData', []):
+                lichthiData.append({
+                    'maHP': row.get('maHP', ''),
+                    'tenHP': row.get('tenHP', ''),
+                    'soTC': row.get('soTC', ''),
+                    'ngayThi': row.get('ngayThi', ''),
+                    'caThi': row.get('caThi', ''),
+                    'hinhThucThi': row.get('hinhThucThi', ''),
+                    'soBaoDanh': row.get('soBaoDanh', ''),
+                    'phongThi': row.get('phongThi', ''),
+                    'ghiChu': row.get('ghiChu', '')
+                })
+        return _with_etag(jsonify(_freshness({
             'error': False,
             'lichthiData': lichthiData
-        })
+        }, entry)), entry)
     except Exception as e:
-        print(f"[ERROR] Lỗi server khi lấy lịch thi: {str(e)}")
+        log.exception("Lỗi server khi lấy lịch thi: %s", e)
         return jsonify({"error": True, "message": f"Lỗi server: {str(e)}"})
 
 @app.route('/api/dangkihoc')
 def api_dangkihoc():
-    print('[DEBUG] /api/dangkihoc route called')
     return jsonify({'error': True, 'message': 'Not implemented'}), 501
 
 @app.route('/api/scores')
 def api_scores():
     """API lấy điểm số từ ICTUService, chuẩn hóa dữ liệu trả về cho frontend"""
-    print('[DEBUG] /api/scores route called')
-    global ictu_service
-    if not ictu_service:
-        print('[DEBUG] Khởi tạo ICTUService')
-        ictu_service = ICTUService()
+    ictu_service = _logged_in_service()
+    if ictu_service is None:
+        return _not_logged_in()
     try:
-        result = ictu_service.get_scores()
+        result, entry = _cached(ictu_service, 'scores', ictu_service.get_scores)
+        if result.get('error'):
+            log.warning("Lỗi khi lấy điểm số: %s", result.get('message'))
+            return _portal_error(result)
+        not_modified = _not_modified(entry)
+        if not_modified:
+            return not_modified
         diemSoData = result.get('diemSoData', [])
         tongKetData = result.get('tongKetData', [])
-        print(f"[DEBUG] Số môn học: {len(diemSoData)}")
-        for i, row in enumerate(diemSoData):
-            print(f"[DEBUG] {i+1}. {row.get('maHP','')} - {row.get('tenHP','')} | TC: {row.get('soTC','')} | TK: {row.get('tongKet','')} | ĐG: {row.get('danhGia','')}")
-        print(f"[DEBUG] Tổng kết học kỳ: {tongKetData}")
+        log.debug("Số môn học: %d, số học kỳ tổng kết: %d", len(diemSoData), len(tongKetData))
         # Chuẩn hóa diemSoData
-        diemSoData_out = []
-        for i, row in enumerate(diemSoData):
-            diemSoData_out.append({
-                'maHP': row.get('maHP', ''),
-                'tenHP': row.get('tenHP', ''),
-                'soTC': row.get('soTC', ''),
-                'CC': row.get('chuyenCan', ''),
-                'THI': row.get('thi', ''),
-                'KTHP': row.get('tongKet', ''),
-                'diemChu': row.get('diemChu', ''),
-                'danhGia': row.get('danhGia', '')
-            })
-        return jsonify({
+        with tracing.span('normalize', 'scores'):
+            diemSoData_out = []
+            for i, row in enumerate(diemSoData):
+                diemSoData_out.append({
+                    'maHP': row.get('maHP', ''),
+                    'tenHP': row.get('tenHP', ''),
+                    'soTC': row.get('soTC', ''),
+                    'CC': row.get('chuyenCan', ''),
+                    'THI': row.get('thi', ''),
+                    'KTHP': row.get('tongKet', ''),
+                    'diemChu': row.get('diemChu', ''),
+                    'danhGia': row.get('danhGia', '')
+                })
+        return _with_etag(jsonify(_freshness({
             'error': False,
             'message': 'Success',
             'diemSoData': diemSoData_out,
             'tongKetData': tongKetData
-        })
+        }, entry)), entry)
     except Exception as e:
-        print(f"[ERROR] Lỗi server khi lấy điểm số: {str(e)}")
+        log.exception("Lỗi server khi lấy điểm số: %s", e)
         return jsonify({"error": True, "message": f"Lỗi server: {str(e)}"})
 
 @app.route('/api/search')
 def api_search():
-    print('[DEBUG] /api/search route called')
     return jsonify({'error': True, 'message': 'Not implemented'}), 501
 
 @app.route('/api/timetable')
 def api_timetable():
     """API lấy thời khóa biểu từ ICTUService, chuẩn hóa dữ liệu trả về cho frontend"""
-    print('[DEBUG] /api/timetable route called')
-    global ictu_service
-    if not ictu_service:
-        print('[DEBUG] Khởi tạo ICTUService')
-        ictu_service = ICTUService()
+    ictu_service = _logged_in_service()
+    if ictu_service is None:
+        return _not_logged_in()
+    week = request.args.get('week')
+    try:
+        weeks = _parse_weeks(week)
+    except ValueError as e:
+        return jsonify({"error": True, "message": str(e)}), 400
     try:
         semester = request.args.get('semester')
         academic_year = request.args.get('academic_year')
-        week = request.args.get('week')
-        print(f"[DEBUG] Params: semester={semester}, academic_year={academic_year}, week={week}")
-        # Ưu tiên lấy từ Excel, nếu lỗi thì fallback sang HTML
-        result = ictu_service.get_student_timetable_excel(semester=semester, academic_year=academic_year, week=week)
-        if result.get('error'):
-            print(f"[WARNING] Failed to get timetable from Excel: {result.get('message')}. Trying HTML...")
-            result = ictu_service.get_student_timetable(semester=semester, academic_year=academic_year, week=week)
+        log.debug("Params: semester=%s, academic_year=%s, week=%s", semester, academic_year, week)
+        # Ưu tiên lấy từ Excel, nếu lỗi thì fallback sang HTML (chỉ với một tuần)
+        params = {'semester': semester, 'academic_year': academic_year, 'week': week}
+        if weeks is not None:
+            # Nhiều tuần: các lần xuất Excel chạy song song, kết quả gộp theo ngày
+            fetch = lambda: ictu_service.get_student_timetable_weeks(semester, academic_year, weeks)
+        else:
+            fetch = lambda: ictu_service.get_student_timetable_excel(**params)
+        result, entry = _cached(ictu_service, 'timetable', fetch, **params)
+        # Trang HTML chỉ hiển thị một tuần: nhiều tuần (kể cả 400 do không có tuần hợp lệ) trả lỗi luôn
+        if result.get('error') and weeks is None:
+            log.warning("Failed to get timetable from Excel: %s. Trying HTML...", result.get('message'))
+            TIMETABLE_FALLBACKS.inc()
+            result, entry = _cached(ictu_service, 'timetable_html',
+                                    lambda: ictu_service.get_student_timetable(**params), **params)
         if result.get('error'):
-            print(f"[ERROR] Lỗi khi lấy thời khóa biểu: {result}")
-            return jsonify(result)
+            log.error("Lỗi khi lấy thời khóa biểu: %s", result.get('message'))
+            return _portal_error(result)
         timetable = result.get('timetableData', [])
-        print(f"[DEBUG] Số dòng thời khoá biểu: {len(timetable)}")
-        for i, row in enumerate(timetable):
-            print(f"[DEBUG] {i+1}. {row.get('tenHP','')} | {row.get('phong','')} | {row.get('ca','')} | {row.get('thu','')} {row.get('tuan','')}")
+        log.debug("Số dòng thời khoá biểu: %d", len(timetable))
         # Cập nhật thông tin ngành vào session nếu có
         if 'major' in result and session.get('user_info'):
             session['user_info']['major'] = result['major']
             session.modified = True # Đánh dấu session đã thay đổi để lưu lại
-            print(f"[DEBUG] Session major updated from timetable API: {session['user_info']['major']}")
-        return jsonify({
+            log.debug("Session major updated from timetable API: %s", session['user_info']['major'])
+        # format=compact: bảng dạng cột với từ điển giá trị lặp lại, xem compact_rows
+        layout = 'compact' if request.args.get('format') == 'compact' else None
+        not_modified = _not_modified(entry, layout)
+        if not_modified:
+            return not_modified
+        if layout:
+            with tracing.span('normalize', 'compact_rows'):
+                timetable = compact_rows(timetable)
+        response = {
             'error': False,
             'timetable': timetable,
             'source': result.get('source', 'unknown'),
             'totalRows': result.get('totalRows', 0),
             'major': result.get('major', 'Chưa cập nhật') # Thêm major vào response cho frontend
-        })
+        }
+        if 'weeks' in result:
+            response['weeks'] = result['weeks']
+            response['failedWeeks'] = result.get('failedWeeks', [])
+        if layout:
+            response['format'] = layout
+        return _with_etag(jsonify(_freshness(response, entry)), entry, layout)
     except Exception as e:
-        print(f"[ERROR] API Timetable exception: {str(e)}")
+        log.exception("API Timetable exception: %s", e)
         return jsonify({"error": True, "message": f"Lỗi server khi lấy thời khóa biểu: {str(e)}"})
 
 @app.route('/api/timetable_options')
 def api_timetable_options():
     """API lấy các tùy chọn lọc thời khóa biểu (học kỳ, năm học, tuần)"""
-    print('[DEBUG] /api/timetable_options route called')
-    global ictu_service
+    ictu_service = _get_service(create=False)
     if 'logged_in' not in session or not ictu_service:
-        print('[DEBUG] Chưa đăng nhập hoặc chưa có ictu_service')
+        log.debug('Chưa đăng nhập hoặc chưa có ictu_service')
         return jsonify({"error": True, "message": "Chưa đăng nhập"})
     try:
-        result = ictu_service.get_timetable_options()
-        print(f"[DEBUG] Kết quả get_timetable_options: {result}")
+        # Không nhận ?refresh=1: dữ liệu dùng chung, mỗi TTL chỉ gọi portal một lần
+        result = timetable_options.get_or_fetch(ictu_service.get_timetable_options)
+        log.debug("Kết quả get_timetable_options: error=%s", result.get('error'))
         return jsonify(result)
     except Exception as e:
-        print(f"[ERROR] API Timetable Options exception: {str(e)}")
+        log.exception("API Timetable Options exception: %s", e)
         return jsonify({"error": True, "message": f"Lỗi server khi lấy tùy chọn thời khóa biểu: {str(e)}"})
 
+@app.route('/api/pool_stats')
+def api_pool_stats():
+    """Thống kê session pool và result cache (hits, evictions, số session đang sống)"""
+    stats = session_pool.stats()
+    stats['resultCache'] = result_cache.stats()
+    stats['timetableOptions'] = timetable_options.stats()
+    stats['refresh'] = refresher.stats()
+    stats['transport'] = transport_stats()
+    stats['sessionStore'] = session_store.stats()
+    stats['sharedCache'] = shared_cache.stats()
+    return jsonify(stats)
+
+@app.route('/api/portal_status')
+def api_portal_status():
+    """Trạng thái circuit breaker tới portal và timeout đang dùng cho từng trang"""
+    return jsonify(portal_guard.stats())
+
+@app.route('/metrics')
+def metrics():
+    """Metrics của worker này dạng Prometheus text: latency portal, thời gian parse, relogin, cache..."""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 # Routes cho các trang
 @app.route('/api/session_status')
 def api_session_status():
-    print('[DEBUG] /api/session_status route called')
-    return jsonify({'error': True, 'message': 'Not implemented'}), 501
+    """Trạng thái phiên portal của người dùng và số probe đã tiết kiệm"""
+    ictu_service = _get_service(create=False)
+    if 'logged_in' not in session or not ictu_service:
+        return jsonify({"error": True, "message": "Chưa đăng nhập"})
+    return jsonify({
+        'error': False,
+        'loggedIn': ictu_service.is_logged_in,
+        'validation': ictu_service.validation_stats()
+    })
 
 @app.route('/thoikhoabieu')
 def thoikhoabieu():
-    print('[DEBUG] /thoikhoabieu route called')
     return jsonify({'error': True, 'message': 'Not implemented'}), 501
 
 @app.route('/debug-help')
 def debug_help():
-    print('[DEBUG] /debug-help route called')
     return jsonify({'error': True, 'message': 'Not implemented'}), 501
 
 # Chạy bằng waitress nếu chạy trực tiếp
 if __name__ == '__main__':
     from waitress import serve
-    print('Serving with waitress on http://0.0.0.0:5000 ...')
+    log.info('Serving with waitress on http://0.0.0.0:5000 ...')
     serve(app, host='0.0.0.0', port=5000)
@@ -0,0 +1,118 @@
+"""Đo chi phí khởi động: thời gian import app, lần parse đầu tiên (nguội/nóng), thời gian tới
+response đầu tiên và bộ nhớ mỗi worker gunicorn với các chế độ của gunicorn.conf.py.
+
+    python bench/bench_coldstart.py --workers 4
+
+Các chế độ gunicorn:
+  lazy     GUNICORN_PRELOAD=0 GUNICORN_WARMUP=0  (như trước: worker tự import, parse lần đầu khi có request)
+  warmup   GUNICORN_PRELOAD=0                    (mỗi worker tự import và warmup)
+  preload  GUNICORN_PRELOAD=1                    (import + warmup trong master, gc.freeze, fork)
+Bộ nhớ đo bằng /proc/<pid>/smaps_rollup (Linux): USS là phần riêng của worker, PSS chia đều
+phần dùng chung. Worker của chế độ lazy chưa parse gì nên nhỏ hơn lúc đã phục vụ request thật.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from warmup import memory_usage  # noqa: E402
+
+MODES = {
+    'lazy': {'GUNICORN_PRELOAD': '0', 'GUNICORN_WARMUP': '0'},
+    'warmup': {'GUNICORN_PRELOAD': '0', 'GUNICORN_WARMUP': '1'},
+    'preload': {'GUNICORN_PRELOAD': '1', 'GUNICORN_WARMUP': '1'},
+}
+
+FIRST_PARSE = """
+import json, os, sys, time
+sys.stdout = open(os.devnull, 'w')
+started = time.perf_counter()
+import app
+import warmup
+imported = time.perf_counter() - started
+cold = warmup.warm_up()
+warm = warmup.warm_up()
+sys.__stdout__.write(json.dumps({'import': imported, 'cold': cold, 'warm': warm}))
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def run_gunicorn(mode, workers):
+    port = free_port()
+    env = dict(os.environ, **MODES[mode])
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn.conf.py', '-w', str(workers),
+         '-b', f'127.0.0.1:{port}'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        first_response = None
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/pool_stats', timeout=1) as resp:
+                    resp.read()
+                first_response = time.perf_counter() - started
+                break
+            except OSError:
+                time.sleep(0.01)
+        # Chờ tất cả worker khởi động xong rồi mới đo bộ nhớ
+        deadline = time.monotonic() + 30
+        while len(children(process.pid)) < workers and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(1.0)
+        worker_usage = [memory_usage(pid) for pid in children(process.pid)]
+        return first_response, memory_usage(process.pid), worker_usage
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def average(usages, key):
+    values = [u.get(key, 0) for u in usages]
+    return sum(values) / len(values) / 1024 if values else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    result = json.loads(subprocess.run([sys.executable, '-c', FIRST_PARSE], cwd=ROOT, capture_output=True,
+                                       text=True).stdout)
+    print(f"import app: {result['import'] * 1000:.0f} ms")
+    print(f"{'bước':<16}{'lần đầu':>10}{'lần sau':>10}")
+    for name, cold in result['cold'].items():
+        print(f"{name:<16}{cold * 1000:>8.1f}ms{result['warm'][name] * 1000:>8.1f}ms")
+    print(f"{'tổng':<16}{sum(result['cold'].values()) * 1000:>8.1f}ms{sum(result['warm'].values()) * 1000:>8.1f}ms")
+
+    print(f"\ngunicorn {args.workers} workers: thời gian tới response đầu tiên, bộ nhớ trung bình mỗi worker (MB)")
+    for mode in MODES:
+        first_response, master, workers = run_gunicorn(mode, args.workers)
+        ttfr = f"{first_response * 1000:.0f} ms" if first_response is not None else "timeout"
+        print(f"{mode:>8}: first response {ttfr:>8} | RSS {average(workers, 'rss'):5.1f} PSS {average(workers, 'pss'):5.1f}"
+              f" USS {average(workers, 'uss'):5.1f} | master RSS {master.get('rss', 0) / 1024:5.1f}")
+
+
+if __name__ == '__main__':
+    main()
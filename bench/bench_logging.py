@@ -0,0 +1,74 @@
+"""Chi phí log trên đường parse: LOG_LEVEL=DEBUG (tương đương các print [DEBUG] trước đây, mỗi
+dòng điểm/lịch thi một dòng log) so với mặc định production (INFO, không lấy mẫu) và lấy mẫu 1%.
+
+Log được ghi qua một pipe tới process `cat > /dev/null` như stdout của gunicorn. Đo thời gian
+parse các fixture (median) và số dòng log mỗi lần.
+
+    python bench/bench_logging.py --repeat 50
+"""
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import log_config  # noqa: E402
+from ictu_service import ICTUService  # noqa: E402
+from warmup import _read  # noqa: E402
+
+MODES = [
+    ('DEBUG', logging.DEBUG, 0.0),
+    ('INFO', logging.INFO, 0.0),
+    ('INFO + 1%', logging.INFO, 0.01),
+]
+
+
+class CountingHandler(logging.StreamHandler):
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+        super().emit(record)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    sink = subprocess.Popen(['cat'], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True)
+    handler = CountingHandler(sink.stdin)
+    handler.setFormatter(logging.Formatter(log_config.LOG_FORMAT))
+    root = logging.getLogger()
+    root.addHandler(handler)
+
+    service = ICTUService()
+    pages = [(service._parse_scores, _read('StudentMark.html')),
+             (service._parse_exam_schedule, _read('StudentViewExamList.html')),
+             (service._parse_timetable_excel, _read('timetable.xls', 'rb'))]
+    try:
+        for name, level, rate in MODES:
+            root.setLevel(level)
+            timings = []
+            handler.count = 0
+            for _ in range(args.repeat):
+                log_config.sample_request(rate)
+                started = time.perf_counter()
+                for parse, content in pages:
+                    parse(content)
+                timings.append(time.perf_counter() - started)
+            print(f"{name:>10}: {statistics.median(timings) * 1000:7.2f} ms/lượt | "
+                  f"{handler.count / args.repeat:6.1f} dòng log/lượt")
+    finally:
+        sink.stdin.close()
+        sink.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Bộ benchmark các hàm parse của ICTUService, không gửi request nào.
+
+Chạy phần parse của get_scores, get_exam_schedule, get_student_timetable,
+get_student_timetable_excel (gồm cả tạo form xuất Excel) và phần lấy thông tin sinh viên
+của login trên:
+  - fixtures/ (trang ghi lại từ portal)
+  - trang sinh bởi portal_pages, phóng to theo tham số (ví dụ bảng điểm 200 môn, TKB Excel
+    20 tuần, lịch thi 1000 dòng) để thấy hàm parse tăng theo kích thước dữ liệu thế nào
+
+Mỗi trường hợp in thời gian (median / min), bộ nhớ cấp phát đỉnh trong lúc parse và phần còn
+giữ lại sau khi parse (kết quả trả về), cả hai đo bằng tracemalloc ở một lượt chạy riêng để không
+làm chậm số đo thời gian. --save lưu kết quả ra JSON, --compare so với một lần lưu trước để thấy
+regression. Cần xlwt để sinh file Excel.
+
+    python bench/bench_parsers.py --courses 40,200 --exams 12,1000 --weeks 16,20 --repeat 20
+    python bench/bench_parsers.py --save before.json
+    python bench/bench_parsers.py --compare before.json
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import portal_pages  # noqa: E402
+from ictu_service import ICTUService  # noqa: E402
+from warmup import _read  # noqa: E402
+
+TIMETABLE_URL = "http://portal.invalid/kcntt/Reports/Form/StudentTimeTable.aspx"
+
+
+def _sizes(value):
+    return [int(size) for size in value.split(',') if size]
+
+
+def build_cases(args):
+    """[(hàm, dữ liệu, kích thước, hàm parse, nội dung)]"""
+    service = ICTUService()
+    parsers = {
+        'scores': service._parse_scores,
+        'exams': service._parse_exam_schedule,
+        'timetable_html': service._parse_timetable_html,
+        'timetable_form': lambda html: service._build_timetable_form(html, TIMETABLE_URL),
+        'timetable_excel': service._parse_timetable_excel,
+        'login_form': lambda html: service._build_login_form(html, 'bench', 'bench'),
+        'profile': service._parse_profile,
+        'duration': service._parse_duration,
+    }
+    cases = [
+        ('scores', 'fixture', '', _read('StudentMark.html')),
+        ('exams', 'fixture', '', _read('StudentViewExamList.html')),
+        ('timetable_html', 'fixture', '', _read('StudentTimeTable.html')),
+        ('timetable_form', 'fixture', '', _read('StudentTimeTable.html')),
+        ('timetable_excel', 'fixture', '', _read('timetable.xls', 'rb')),
+        ('login_form', 'fixture', '', _read('login.html')),
+        ('profile', 'fixture', '', _read('Home.html')),
+    ]
+    vs = args.viewstate
+    for n in args.courses:
+        cases.append(('scores', 'synthetic', f'{n} môn', portal_pages.mark_page(n_courses=n, viewstate_kb=vs)))
+    for n in args.exams:
+        cases.append(('exams', 'synthetic', f'{n} dòng', portal_pages.exam_page(n_exams=n, viewstate_kb=vs)))
+    for n in args.timetable_rows:
+        page = portal_pages.timetable_page(n_rows=n, viewstate_kb=vs)
+        cases.append(('timetable_html', 'synthetic', f'{n} dòng', page))
+        cases.append(('timetable_form', 'synthetic', f'{n} dòng', page))
+    for n in args.weeks:
+        workbook = portal_pages.timetable_workbook(n_weeks=n, rows_per_week=args.rows_per_week)
+        cases.append(('timetable_excel', 'synthetic', f'{n} tuần x {args.rows_per_week}', workbook))
+    cases.append(('login_form', 'synthetic', '', portal_pages.login_page(viewstate_kb=vs)))
+    cases.append(('profile', 'synthetic', '', portal_pages.home_page(viewstate_kb=vs)))
+    cases.append(('duration', 'synthetic', '', portal_pages.study_register_page(viewstate_kb=vs)))
+    return [(name, source, size, parsers[name], content) for name, source, size, content in cases]
+
+
+def measure_time(parse, content, repeat):
+    parse(content)  # lần đầu: import, biên dịch regex...
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parse(content)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), min(timings)
+
+
+def measure_memory(parse, content):
+    """(KB cấp phát đỉnh trong lúc parse, KB còn giữ lại sau khi parse)"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = parse(content)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return (peak - baseline) / 1024, (current - baseline) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--courses', type=_sizes, default=[40, 200], help='Số môn trong bảng điểm, ví dụ 40,200')
+    parser.add_argument('--exams', type=_sizes, default=[12, 1000], help='Số dòng lịch thi')
+    parser.add_argument('--timetable-rows', type=_sizes, default=[10, 100], help='Số dòng bảng TKB HTML')
+    parser.add_argument('--weeks', type=_sizes, default=[16, 20], help='Số tuần trong file Excel TKB')
+    parser.add_argument('--rows-per-week', type=int, default=10)
+    parser.add_argument('--viewstate', type=int, default=60, help='Kích thước ViewState trang sinh ra (KB)')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--only', help='Chỉ chạy các hàm này, ví dụ scores,exams')
+    parser.add_argument('--save', help='Lưu kết quả ra file JSON')
+    parser.add_argument('--compare', help='So sánh thời gian với file JSON đã lưu bằng --save')
+    args = parser.parse_args()
+
+    cases = build_cases(args)
+    if args.only:
+        only = set(args.only.split(','))
+        cases = [case for case in cases if case[0] in only]
+    previous = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = {(r['parser'], r['source'], r['size']): r for r in json.load(f)}
+
+    print(f"{'hàm':<16}{'dữ liệu':<11}{'kích thước':<14}{'KB vào':>8}{'median':>11}{'min':>11}"
+          f"{'cấp phát':>12}{'giữ lại':>11}" + ('   so với trước' if previous else ''))
+    results = []
+    for name, source, size, parse, content in cases:
+        median, fastest = measure_time(parse, content, args.repeat)
+        peak_kb, retained_kb = measure_memory(parse, content)
+        row = {'parser': name, 'source': source, 'size': size, 'inputKb': round(len(content) / 1024, 1),
+               'medianMs': round(median * 1000, 3), 'minMs': round(fastest * 1000, 3),
+               'peakKb': round(peak_kb, 1), 'retainedKb': round(retained_kb, 1)}
+        results.append(row)
+        line = (f"{name:<16}{source:<11}{size:<14}{row['inputKb']:>8.0f}{row['medianMs']:>9.2f}ms"
+                f"{row['minMs']:>9.2f}ms{peak_kb:>9.0f} KB{retained_kb:>8.0f} KB")
+        before = previous.get((name, source, size))
+        if before:
+            line += f"   {row['medianMs'] / before['medianMs']:>5.2f}x ({before['medianMs']:.2f}ms)"
+        print(line)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Đã lưu {len(results)} kết quả vào {args.save}")
+
+
+if __name__ == '__main__':
+    main()
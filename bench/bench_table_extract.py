@@ -0,0 +1,93 @@
+"""So sánh parse bảng điểm / lịch thi / TKB HTML: extract_table (chỉ tokenize bảng cần đọc, dừng khi
+bảng đóng) với cách cũ (BeautifulSoup parse toàn bộ trang rồi soup.find) và với BeautifulSoup +
+SoupStrainer (chỉ dựng cây cho bảng cần đọc nhưng vẫn tokenize cả trang).
+
+Cả hai chạy qua các hàm _parse_* của ICTUService; cách cũ được gắn vào bằng cách thay
+ictu_service.extract_table bằng một hàm dựng BeautifulSoup (mỗi trang parse một lần như
+code cũ). Đo trên trang sinh bởi portal_pages (ViewState cỡ trang thật) và trên fixtures/,
+kiểm tra hai kết quả giống hệt nhau.
+
+    python bench/bench_table_extract.py --viewstate 60 --courses 60 --repeat 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bs4 import BeautifulSoup, SoupStrainer  # noqa: E402
+
+import portal_pages  # noqa: E402
+import ictu_service  # noqa: E402
+from html_tables import extract_table  # noqa: E402
+from ictu_service import ICTUService  # noqa: E402
+from warmup import _read  # noqa: E402
+
+
+class SoupExtractor:
+    """Cách cũ: BeautifulSoup(html, 'html.parser') cho cả trang, các lần tìm bảng sau dùng lại soup"""
+
+    def __init__(self):
+        self._html = self._soup = None
+
+    def __call__(self, html, table_id):
+        if html is not self._html:
+            self._html, self._soup = html, BeautifulSoup(html, 'html.parser')
+        return self._soup.find('table', {'id': table_id})
+
+
+def strained(html, table_id):
+    """BeautifulSoup(html, 'html.parser', parse_only=SoupStrainer(...)) cho từng bảng"""
+    soup = BeautifulSoup(html, 'html.parser', parse_only=SoupStrainer('table', id=table_id))
+    return soup.find('table', id=table_id)
+
+
+def parse_with(extractor, method, html):
+    ictu_service.extract_table = extractor() if extractor is SoupExtractor else extractor
+    try:
+        return getattr(ICTUService(), method)(html)
+    finally:
+        ictu_service.extract_table = extract_table
+
+
+def measure(extractor, method, html, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parse_with(extractor, method, html)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--viewstate', type=int, default=60, help='Kích thước ViewState (KB)')
+    parser.add_argument('--courses', type=int, default=60, help='Số môn trong bảng điểm')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    pages = [
+        ('điểm', '_parse_scores', portal_pages.mark_page(n_courses=args.courses, viewstate_kb=args.viewstate)),
+        ('lịch thi', '_parse_exam_schedule', portal_pages.exam_page(viewstate_kb=args.viewstate)),
+        ('TKB html', '_parse_timetable_html', portal_pages.timetable_page(viewstate_kb=args.viewstate)),
+        ('fixture điểm', '_parse_scores', _read('StudentMark.html')),
+        ('fixture lịch thi', '_parse_exam_schedule', _read('StudentViewExamList.html')),
+        ('fixture TKB', '_parse_timetable_html', _read('StudentTimeTable.html')),
+    ]
+    report = sys.stdout.write
+
+    report(f"{'trang':<18}{'KB':>6}{'bs4':>11}{'strainer':>11}{'extract':>11}{'':>8}  giống nhau\n")
+    for name, method, html in pages:
+        expected = parse_with(SoupExtractor, method, html)
+        same = parse_with(strained, method, html) == expected == parse_with(extract_table, method, html)
+        legacy = measure(SoupExtractor, method, html, args.repeat)
+        strainer = measure(strained, method, html, args.repeat)
+        targeted = measure(extract_table, method, html, args.repeat)
+        report(f"{name:<18}{len(html) / 1024:>6.0f}{legacy * 1000:>9.2f}ms{strainer * 1000:>9.2f}ms"
+               f"{targeted * 1000:>9.2f}ms{legacy / targeted:>7.1f}x  {same}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""So sánh bước chuẩn hóa timetableData: build_timetable_data (theo cột, nhớ kết quả theo giá trị)
+với vòng lặp từng dòng cũ (re.search mỗi ô, dựng lại TIET_TIMES mỗi dòng).
+
+Cả hai nhận cùng một TimetableSheet đã đọc sẵn nên chỉ đo bước chuẩn hóa. Bản cũ được giữ
+nguyên logic nhưng bỏ các print [DEBUG] từng dòng. Cần xlwt để sinh file mẫu.
+
+    python bench/bench_timetable_normalize.py --weeks 18 --rows 12 --repeat 20
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import portal_pages  # noqa: E402
+import timetable_reader  # noqa: E402
+from timetable_reader import TimetableSheet, build_timetable_data  # noqa: E402
+
+
+def legacy_normalize(sheet):
+    """Vòng lặp từng dòng như trước khi chuyển sang xử lý theo cột"""
+    mapped_data = []
+    current_week_info = {"from_date": "", "to_date": "", "week_number": ""}
+    last_thu = ""
+    for row_dict in sheet.rows():
+        current_thu = row_dict.get('Thứ', '').strip()
+        if current_thu:
+            last_thu = current_thu
+        else:
+            row_dict['Thứ'] = last_thu
+
+        stt = row_dict.get('STT', '').strip()
+        lop_hoc_phan = row_dict.get('Lớp học phần', '').strip()
+        thoi_gian = row_dict.get('Thời gian', '').strip()
+
+        if 'tuần' in lop_hoc_phan.lower() and 'đến' in lop_hoc_phan.lower():
+            week_match = re.search(r'Tuần (\d+) \(((\d{2}/\d{2}/\d{4}) đến (\d{2}/\d{2}/\d{4}))\)', lop_hoc_phan)
+            if week_match:
+                current_week_info['week_number'] = week_match.group(1)
+                current_week_info['from_date'] = week_match.group(3)
+                current_week_info['to_date'] = week_match.group(4)
+                try:
+                    current_week_info['start_datetime'] = datetime.strptime(current_week_info['from_date'], '%d/%m/%Y')
+                except ValueError:
+                    current_week_info['start_datetime'] = None
+            continue
+
+        is_valid_stt = False
+        if stt:
+            try:
+                float(stt)
+                is_valid_stt = True
+            except ValueError:
+                pass
+        if not is_valid_stt or not lop_hoc_phan:
+            continue
+
+        mapped_item = {
+            "stt": row_dict.get('STT', ''), "lopHocPhan": lop_hoc_phan, "maHP": '', "tenHP": '',
+            "soTC": row_dict.get('Số TC', ''), "thu": row_dict.get('Thứ', ''), "tiet": row_dict.get('Tiết học', ''),
+            "phong": row_dict.get('Phòng', ''), "giangVien": '', "meetLink": '', "siSo": row_dict.get('Sĩ số', ''),
+            "soDK": row_dict.get('Số ĐK', ''), "hocPhi": row_dict.get('Học phí', ''),
+            "ghiChu": row_dict.get('Ghi chú', ''), "from_date": '', "to_date": '',
+            "week_number": current_week_info['week_number'], "lesson_type": '',
+        }
+
+        all_matches = list(re.finditer(r'\(([^)]+)\)|\[([^\]]+)\]', lop_hoc_phan))
+        if all_matches:
+            ma_hp_match = all_matches[-1]
+            mapped_item['maHP'] = (ma_hp_match.group(1) or ma_hp_match.group(2)).strip()
+            potential_ten_hp = lop_hoc_phan[:ma_hp_match.start()].strip()
+            mapped_item['tenHP'] = re.sub(r'-\d+-\d+.*$', '', potential_ten_hp).strip()
+        else:
+            mapped_item['tenHP'] = lop_hoc_phan.strip()
+
+        giang_vien_raw = row_dict.get('Giảng viên/ link meet', '')
+        meet_link_found = False
+        if '\n' in giang_vien_raw:
+            parts = giang_vien_raw.split('\n', 1)
+            potential_link_part = parts[1].strip() if len(parts) > 1 else ''
+            url_match = re.search(r'(https?://)?(?:www\.)?meet\.google\.com/[^\s]+', potential_link_part)
+            if url_match:
+                full_link = url_match.group(0)
+                if not full_link.startswith('http'):
+                    full_link = 'https://' + full_link
+                mapped_item['meetLink'] = full_link
+                mapped_item['giangVien'] = parts[0].strip()
+                meet_link_found = True
+        if not meet_link_found:
+            url_match = re.search(r'(https?://)?(?:www\.)?meet\.google\.com/[^\s]+', giang_vien_raw)
+            if url_match:
+                full_link = url_match.group(0)
+                if not full_link.startswith('http'):
+                    full_link = 'https://' + full_link
+                mapped_item['meetLink'] = full_link
+                mapped_item['giangVien'] = giang_vien_raw.replace(url_match.group(0), '').strip()
+            else:
+                mapped_item['giangVien'] = giang_vien_raw.strip()
+
+        thu_value = mapped_item['thu'].strip()
+        if thu_value and thu_value.replace('.', '', 1).isdigit():
+            try:
+                mapped_item['thu'] = f"Thứ {int(float(thu_value))}"
+            except ValueError:
+                mapped_item['thu'] = thu_value
+        else:
+            mapped_item['thu'] = thu_value
+
+        mapped_item['tiet'] = mapped_item['tiet'].replace(' --> ', '-').replace('-->', '-').strip()
+        mapped_item['thoiGian'] = mapped_item['thu'].strip()
+
+        TIET_TIMES = {k: dict(v) for k, v in timetable_reader.TIET_TIMES.items()}  # dựng lại mỗi dòng như cũ
+        buoi_hoc = "Không xác định"
+        tiet_str = mapped_item['tiet']
+        if tiet_str:
+            tiet_numbers = [int(s) for s in re.findall(r'\d+', tiet_str) if s.isdigit()]
+            if tiet_numbers:
+                start_time = TIET_TIMES.get(min(tiet_numbers), {}).get("start", "")
+                end_time = TIET_TIMES.get(max(tiet_numbers), {}).get("end", "")
+                if start_time and end_time:
+                    buoi_hoc = f"{start_time} - {end_time}"
+        mapped_item['buoiHoc'] = buoi_hoc
+
+        if current_week_info.get('start_datetime') and mapped_item['thu']:
+            thu_digit_match = re.search(r'\d+', mapped_item['thu'])
+            if thu_digit_match:
+                day_of_week_index = int(thu_digit_match.group(0)) - 2
+                if 'chủ nhật' in mapped_item['thu'].lower():
+                    day_of_week_index = 6
+                if 0 <= day_of_week_index <= 6:
+                    week_start_weekday = current_week_info['start_datetime'].weekday()
+                    days_to_add = (day_of_week_index - week_start_weekday + 7) % 7
+                    subject_date = current_week_info['start_datetime'] + timedelta(days=days_to_add)
+                    mapped_item['from_date'] = subject_date.strftime('%d/%m/%Y')
+                    mapped_item['to_date'] = subject_date.strftime('%d/%m/%Y')
+
+        lesson_type_match = re.search(r'\(([A-Z]{2,3})\)', thoi_gian)
+        if lesson_type_match:
+            mapped_item['lesson_type'] = lesson_type_match.group(1)
+        else:
+            note_match = re.search(r'\(([A-Z]{2,3})\)', row_dict.get('Ghi chú', ''))
+            if note_match:
+                mapped_item['lesson_type'] = note_match.group(1)
+        mapped_data.append(mapped_item)
+    return mapped_data
+
+
+def clear_caches():
+    for func in (timetable_reader.split_course, timetable_reader.split_lecturer, timetable_reader.normalize_thu,
+                 timetable_reader.normalize_tiet, timetable_reader.subject_date, timetable_reader.lesson_type):
+        func.cache_clear()
+
+
+def measure(func, sheet, repeat, cold=False):
+    timings = []
+    for _ in range(repeat):
+        if cold:
+            clear_caches()
+        started = time.perf_counter()
+        func(sheet)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weeks', type=int, default=18, help='Số tuần (một học kỳ ~ 15-20 tuần)')
+    parser.add_argument('--rows', type=int, default=12, help='Số buổi học mỗi tuần')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    content = portal_pages.timetable_workbook(n_weeks=args.weeks, rows_per_week=args.rows)
+    sheet = TimetableSheet(content)
+
+    expected = legacy_normalize(sheet)
+    actual = build_timetable_data(sheet)
+    print(f"{args.weeks} tuần x {args.rows} buổi: {len(actual)} bản ghi, kết quả giống nhau: {expected == actual}")
+
+    legacy = measure(legacy_normalize, sheet, args.repeat)
+    cold = measure(build_timetable_data, sheet, args.repeat, cold=True)
+    warm = measure(build_timetable_data, sheet, args.repeat)
+    print(f"  từng dòng              : {legacy * 1000:7.2f} ms")
+    print(f"  theo cột (cache trống): {cold * 1000:7.2f} ms ({legacy / cold:.1f}x)")
+    print(f"  theo cột (cache ấm)   : {warm * 1000:7.2f} ms ({legacy / warm:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""So sánh parse file Excel TKB: TimetableSheet (xlrd, một lượt) với cách cũ (pandas đọc hai lần).
+
+Cả hai chạy qua ICTUService._parse_timetable_excel; bản pandas được gắn vào bằng cách thay
+ictu_service.TimetableSheet. Đo thời gian parse (median), bộ nhớ đỉnh (tracemalloc), thời
+gian import lần đầu, và kiểm tra hai kết quả giống hệt nhau. Cần cài thêm pandas (bản cũ)
+và xlwt (sinh file mẫu).
+
+    python bench/bench_timetable_reader.py --weeks 16 --rows 10 --repeat 20
+
+--save-expected ghi kết quả của bản pandas (major, cột, các dòng) cho các file trong fixtures/
+vào file JSON mà tests/test_timetable_reader.py dùng để so:
+
+    python bench/bench_timetable_reader.py --save-expected fixtures/timetable_reader_expected.json
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fixtures')
+# timetable_dtypes.xls / timetable_numeric.xls sinh bằng portal_pages.timetable_dtype_workbook()
+EXPECTED_FIXTURES = ('timetable.xls', 'timetable_dtypes.xls', 'timetable_numeric.xls')
+
+import portal_pages  # noqa: E402
+import ictu_service  # noqa: E402
+from ictu_service import ICTUService  # noqa: E402
+from timetable_reader import TIMETABLE_KEYWORDS, MAJOR_PATTERN, TimetableSheet  # noqa: E402
+
+
+class PandasTimetableSheet:
+    """Cách đọc cũ: pd.read_excel 15 dòng để tìm header, seek(0) rồi đọc lại toàn bộ"""
+
+    def __init__(self, content):
+        import pandas as pd
+
+        excel_data = io.BytesIO(content)
+        df_temp = pd.read_excel(excel_data, engine='xlrd', header=None, nrows=15)
+        header_row_idx = 0
+        for i, row in df_temp.iterrows():
+            row_text = ' '.join(str(cell) for cell in row.values if pd.notna(cell)).upper()
+            if sum(1 for keyword in TIMETABLE_KEYWORDS if keyword.upper() in row_text) >= 3:
+                header_row_idx = i
+                break
+        excel_data.seek(0)
+        df = pd.read_excel(excel_data, engine='xlrd', header=header_row_idx)
+
+        thu_col_name = next((col for col in df.columns if 'thứ' in str(col).lower()), None)
+        rename_dict = {'Địa điểm': 'Phòng'}
+        if thu_col_name:
+            rename_dict[thu_col_name] = 'Thứ'
+        df.rename(columns=rename_dict, inplace=True)
+
+        self.major = ""
+        for frame, limit in ((df_temp, 15), (df, 5)):
+            for i in range(min(limit, len(frame))):
+                row_text = ' '.join(str(cell) for cell in frame.iloc[i].values if pd.notna(cell)).strip()
+                match = MAJOR_PATTERN.search(row_text)
+                if match:
+                    self.major = match.group(1).strip()
+                    break
+            if self.major:
+                break
+        self.columns = list(df.columns)
+        self._df = df
+        self._rows = None
+
+    def __len__(self):
+        return len(self._df)
+
+    def rows(self):
+        # Duyệt iterrows một lần như vòng lặp cũ, các lần gọi column() dùng lại kết quả
+        if self._rows is None:
+            import pandas as pd
+            self._rows = [{key: "" if pd.isna(value) else str(value).strip() for key, value in row.to_dict().items()}
+                          for _, row in self._df.iterrows()]
+        return self._rows
+
+    def column(self, name):
+        return [row.get(name, '') for row in self.rows()]
+
+
+def parse_with(reader, content):
+    ictu_service.TimetableSheet = reader
+    try:
+        return ICTUService()._parse_timetable_excel(content)
+    finally:
+        ictu_service.TimetableSheet = TimetableSheet
+
+
+def measure(reader, content, repeat):
+    parse_with(reader, content)  # warmup (import pandas/xlrd)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parse_with(reader, content)
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    parse_with(reader, content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+def import_time(module):
+    """Thời gian import module trong process mới (chi phí của request đầu tiên)"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    return float(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True).stdout)
+
+
+def save_expected(path):
+    expected = {}
+    for name in EXPECTED_FIXTURES:
+        with open(os.path.join(FIXTURES, name), 'rb') as f:
+            sheet = PandasTimetableSheet(f.read())
+        expected[name] = {"major": sheet.major, "columns": sheet.columns, "rows": sheet.rows()}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(expected, f, ensure_ascii=False, indent=1, sort_keys=True)
+        f.write('\n')
+    print(f"Đã ghi kết quả pandas của {len(expected)} file vào {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weeks', type=int, default=16)
+    parser.add_argument('--rows', type=int, default=10, help='Số môn mỗi tuần')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--save-expected', metavar='PATH', help='Ghi kết quả pandas của fixtures/*.xls rồi thoát')
+    args = parser.parse_args()
+
+    if args.save_expected:
+        save_expected(args.save_expected)
+        return
+
+    content = portal_pages.timetable_workbook(n_weeks=args.weeks, rows_per_week=args.rows)
+    report = sys.stdout.write
+
+    expected = parse_with(PandasTimetableSheet, content)
+    actual = parse_with(TimetableSheet, content)
+    report(f"file {len(content) / 1024:.0f} KB, {actual['totalRows']} môn, kết quả giống nhau: {expected == actual}\n")
+
+    for name, reader, module in (("pandas", PandasTimetableSheet, "pandas"), ("xlrd", TimetableSheet, "xlrd")):
+        elapsed, peak = measure(reader, content, args.repeat)
+        report(f"{name:>6}: {elapsed * 1000:7.2f} ms/file | peak {peak / 1024:8.1f} KB"
+               f" | import {module} {import_time(module) * 1000:6.0f} ms\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""Fake portal ICTU chạy local (aiohttp) để benchmark và load test mà không gọi tới portal thật.
+
+Giả lập các trang ICTUService dùng: login.aspx (Form1/ViewState, kiểm tra mật khẩu MD5),
+Home.aspx, StudyRegister.aspx, StudentMark.aspx, StudentViewExamList.aspx và
+StudentTimeTable.aspx (GET trang, POST nút "Xuất file Excel" trả về file .xls, cần xlwt).
+Cấu hình được độ trễ (+ jitter ngẫu nhiên), tỉ lệ lỗi HTTP 500 và thời gian session hết hạn
+khi không dùng (giống session ASP.NET).
+
+Chạy độc lập: python bench/fake_portal.py --port 8081 --latency 0.2 --error-rate 0.01 --session-ttl 600
+rồi trỏ app vào: ICTU_BASE_URL=http://127.0.0.1:8081/kcntt gunicorn app:app ...
+(hoặc ICTUService(base_url="http://127.0.0.1:8081/kcntt")).
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from aiohttp import web
+
+import portal_pages as pages
+
+PASSWORD = "123456"
+COOKIE = "ASP.NET_SessionId"
+
+
+class FakePortal:
+    def __init__(self, latency=0.1, password=PASSWORD, jitter=0.0, error_rate=0.0, session_ttl=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.session_ttl = session_ttl
+        self.password_md5 = hashlib.md5(password.encode()).hexdigest()
+        self.sessions = {}  # session id -> username (None khi chưa đăng nhập)
+        self._last_seen = {}  # session id -> thời điểm request cuối
+        self._pages = {}
+        self._random = random.Random(seed)
+        # __EVENTVALIDATION hiện tại của trang TKB, POST với giá trị cũ bị từ chối như ASP.NET
+        self.event_validation = secrets.token_hex(16)
+        self.stats = {'requests': 0, 'errors': 0, 'expired': 0, 'logins': 0, 'excelExports': 0,
+                      'timetablePages': 0, 'rejectedForms': 0}
+
+    def page(self, name, **kwargs):
+        # Render trước một lần, các request sau chỉ trả về chuỗi có sẵn
+        key = (name, *sorted(kwargs.items()))
+        if key not in self._pages:
+            self._pages[key] = getattr(pages, name)(**kwargs)
+        return self._pages[key]
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get('/kcntt/login.aspx', self.login_get)
+        app.router.add_post('/kcntt/login.aspx', self.login_post)
+        app.router.add_get('/kcntt/Home.aspx', self.protected('home_page'))
+        app.router.add_get('/kcntt/StudyRegister/StudyRegister.aspx', self.protected('study_register_page'))
+        app.router.add_get('/kcntt/StudentMark.aspx', self.protected('mark_page'))
+        app.router.add_get('/kcntt/StudentViewExamList.aspx', self.protected('exam_page'))
+        app.router.add_get('/kcntt/Reports/Form/StudentTimeTable.aspx', self.timetable_get)
+        app.router.add_post('/kcntt/Reports/Form/StudentTimeTable.aspx', self.timetable_post)
+        return app
+
+    async def _delay(self):
+        self.stats['requests'] += 1
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.stats['errors'] += 1
+            raise web.HTTPInternalServerError(text="Server Error in '/kcntt' Application.")
+
+    def _session_user(self, request):
+        """Username của session trong cookie, None nếu chưa đăng nhập hoặc đã hết hạn (sliding TTL)"""
+        sid = request.cookies.get(COOKIE)
+        if not self.sessions.get(sid):
+            return None
+        now = time.monotonic()
+        if self.session_ttl and now - self._last_seen.get(sid, now) > self.session_ttl:
+            self.stats['expired'] += 1
+            self.sessions[sid] = None
+            return None
+        self._last_seen[sid] = now
+        return self.sessions[sid]
+
+    def expire_sessions(self):
+        """Cho mọi session đã đăng nhập hết hạn ngay (giả lập portal restart / timeout)"""
+        for sid in self.sessions:
+            self.sessions[sid] = None
+
+    def _html(self, text, sid=None):
+        response = web.Response(text=text, content_type='text/html', charset='utf-8')
+        if sid:
+            response.set_cookie(COOKIE, sid, path='/')
+        return response
+
+    async def login_get(self, request):
+        await self._delay()
+        sid = request.cookies.get(COOKIE)
+        if sid not in self.sessions:
+            sid = secrets.token_hex(12)
+            self.sessions[sid] = None
+        return self._html(self.page('login_page'), sid)
+
+    async def login_post(self, request):
+        await self._delay()
+        form = await request.post()
+        sid = request.cookies.get(COOKIE)
+        if sid not in self.sessions or form.get('txtPassword') != self.password_md5:
+            return self._html(pages.login_page(error="Tên đăng nhập hoặc mật khẩu không đúng"))
+        self.sessions[sid] = form.get('txtUserName')
+        self._last_seen[sid] = time.monotonic()
+        self.stats['logins'] += 1
+        raise web.HTTPFound('/kcntt/Home.aspx')
+
+    def protected(self, page_name):
+        async def handler(request):
+            await self._delay()
+            if not self._session_user(request):
+                raise web.HTTPFound('/kcntt/login.aspx')
+            return self._html(self.page(page_name))
+        return handler
+
+    def rotate_event_validation(self):
+        """Đổi __EVENTVALIDATION của trang TKB (giả lập portal deploy lại), form cũ bị từ chối"""
+        self.event_validation = secrets.token_hex(16)
+
+    def _timetable_html(self):
+        self.stats['timetablePages'] += 1
+        return self._html(self.page('timetable_page', event_validation=self.event_validation))
+
+    async def timetable_get(self, request):
+        await self._delay()
+        if not self._session_user(request):
+            raise web.HTTPFound('/kcntt/login.aspx')
+        return self._timetable_html()
+
+    async def timetable_post(self, request):
+        """Postback của StudentTimeTable.aspx: nút btnView trả về file Excel, còn lại trả về trang"""
+        await self._delay()
+        if not self._session_user(request):
+            raise web.HTTPFound('/kcntt/login.aspx')
+        form = await request.post()
+        if form.get('__EVENTVALIDATION') != self.event_validation:
+            self.stats['rejectedForms'] += 1
+            raise web.HTTPInternalServerError(text="Invalid postback or callback argument.")
+        if 'btnView' not in form:
+            return self._timetable_html()
+        self.stats['excelExports'] += 1
+        week = form.get('drpTuan', '')
+        workbook = self.page('timetable_workbook', only_week=int(week) if week.isdigit() else None)
+        return web.Response(body=workbook, headers={
+            'Content-Type': 'application/vnd.ms-excel',
+            'Content-Disposition': 'attachment; filename=ThoiKhoaBieu.xls',
+        })
+
+
+def start_in_thread(host='127.0.0.1', port=0, **kwargs):
+    """Chạy fake portal trên thread nền, trả về (base_url, portal)"""
+    portal = FakePortal(**kwargs)
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    address = {}
+
+    async def start():
+        runner = web.AppRunner(portal.make_app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port, backlog=1024)
+        await site.start()
+        address['port'] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(start())
+        loop.run_forever()
+
+    threading.Thread(target=run, name='fake-portal', daemon=True).start()
+    ready.wait()
+    return f"http://{host}:{address['port']}/kcntt", portal
+
+
+def free_port(host='127.0.0.1'):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(host, port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.2).close()
+            return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def start_subprocess(host='127.0.0.1', port=None, latency=0.1, jitter=0.0, error_rate=0.0, session_ttl=None):
+    """Chạy fake portal ở process riêng (không tranh GIL với code được đo), trả về (base_url, process)"""
+    port = port or free_port(host)
+    command = [sys.executable, os.path.abspath(__file__), '--host', host, '--port', str(port),
+               '--latency', str(latency), '--jitter', str(jitter), '--error-rate', str(error_rate)]
+    if session_ttl:
+        command += ['--session-ttl', str(session_ttl)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port(host, port)
+    return f"http://{host}:{port}/kcntt", process
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.1, help='Độ trễ mỗi request (giây)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Độ trễ thêm ngẫu nhiên 0..jitter (giây)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Tỉ lệ request trả về HTTP 500')
+    parser.add_argument('--session-ttl', type=float, help='Session hết hạn sau bấy nhiêu giây không dùng')
+    args = parser.parse_args()
+    portal = FakePortal(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                        session_ttl=args.session_ttl)
+    web.run_app(portal.make_app(), host=args.host, port=args.port, access_log=None, print=None)
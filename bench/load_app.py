@@ -0,0 +1,180 @@
+"""Load test app Flask (chạy bằng gunicorn thật) trên fake portal, so sánh nhiều cấu hình worker/thread.
+
+Với mỗi cấu hình WORKERSxTHREADS trong --configs: chạy gunicorn app:app -c gunicorn.conf.py
+với ICTU_BASE_URL trỏ vào fake portal (process riêng), rồi --users người dùng ảo (aiohttp, mỗi
+người một cookie jar) cùng đăng nhập qua /login và gọi liên tục các API trong --paths trong
+--duration giây (closed loop, không có thời gian nghỉ trừ khi đặt --think). In throughput và
+latency p50/p90/p99/max của các request API.
+
+Request trả về lỗi "đăng nhập" (ví dụ người dùng rơi vào worker không giữ session của mình, hoặc
+session portal hết hạn mà không relogin được) được đếm riêng và người dùng ảo đăng nhập lại như
+frontend. --refresh thêm ?refresh=1 để bỏ qua result cache và luôn gọi tới portal.
+
+--modes gthread,gevent chạy mỗi cấu hình hai lần (ICTU_ASYNC=0 rồi 1, xem gunicorn.conf.py) để so
+sánh worker gthread (mỗi request một thread, THREADS request cùng lúc) với worker gevent (THREADS bị
+bỏ qua, mỗi request một greenlet). Fake portal và người dùng ảo cần aiohttp (chỉ dùng cho bench).
+
+    python bench/load_app.py --configs 1x8,2x4,4x2 --users 50 --duration 20 --latency 0.2
+    python bench/load_app.py --configs 1x4,1x32 --modes gthread,gevent --users 200 --refresh --latency 0.5
+    python bench/load_app.py --configs 2x16 --gevent --error-rate 0.01 --session-ttl 30
+"""
+import argparse
+import asyncio
+import collections
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import fake_portal  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def start_app(base_url, workers, threads, use_gevent, host='127.0.0.1'):
+    """Chạy gunicorn với cấu hình của repo, trả về (url, process)"""
+    port = fake_portal.free_port(host)
+    env = dict(os.environ, ICTU_BASE_URL=base_url, ICTU_ASYNC='1' if use_gevent else '0',
+               LOG_LEVEL=os.environ.get('LOG_LEVEL', 'WARNING'))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn.conf.py', '--bind', f'{host}:{port}',
+         '--workers', str(workers), '--threads', str(threads)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not fake_portal.wait_for_port(host, port, timeout=60):
+        process.terminate()
+        raise RuntimeError(f"gunicorn {workers}x{threads} không khởi động được")
+    return f"http://{host}:{port}", process
+
+
+def stop(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+class VirtualUser:
+    def __init__(self, index, app_url, args, stats):
+        self.username = f"sv{index:04d}"
+        self.app_url = app_url
+        self.args = args
+        self.stats = stats
+        self.index = index
+
+    async def login(self, client):
+        async with client.post(f"{self.app_url}/login",
+                               json={'username': self.username, 'password': fake_portal.PASSWORD}) as resp:
+            data = await resp.json(content_type=None)
+        self.stats['logins'] += 1
+        return not data.get('error')
+
+    async def run(self, deadline):
+        paths = self.args.paths
+        suffix = '?refresh=1' if self.args.refresh else ''
+        async with aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar(unsafe=True),
+                                         timeout=aiohttp.ClientTimeout(total=self.args.timeout)) as client:
+            logged_in = False
+            i = self.index
+            while time.monotonic() < deadline:
+                if not logged_in:
+                    try:
+                        logged_in = await self.login(client)
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        logged_in = False
+                    if not logged_in:
+                        self.stats['login_failures'] += 1
+                        await asyncio.sleep(0.1)
+                        continue
+                path = paths[i % len(paths)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    async with client.get(f"{self.app_url}{path}{suffix}") as resp:
+                        data = await resp.json(content_type=None)
+                        status = resp.status
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    data, status = {'error': True, 'message': type(e).__name__}, 0
+                elapsed = time.perf_counter() - started
+                if time.monotonic() > deadline:
+                    break
+                self.stats['latencies'].append(elapsed)
+                if status != 200 or data.get('error'):
+                    message = str(data.get('message') or f'HTTP {status}')
+                    self.stats['errors'][message[:60]] += 1
+                    if 'đăng nhập' in message.lower():
+                        logged_in = False
+                if self.args.think:
+                    await asyncio.sleep(self.args.think)
+
+
+async def drive(app_url, args):
+    stats = {'latencies': [], 'errors': collections.Counter(), 'logins': 0, 'login_failures': 0}
+    users = [VirtualUser(i, app_url, args, stats) for i in range(args.users)]
+    started = time.monotonic()
+    await asyncio.gather(*(user.run(started + args.duration) for user in users))
+    return stats, time.monotonic() - started
+
+
+def report(name, stats, elapsed):
+    latencies = stats['latencies']
+    errors = sum(stats['errors'].values())
+    if not latencies:
+        print(f"{name:>12}: không có request nào hoàn thành")
+        return
+    print(f"{name:>12}: {len(latencies) / elapsed:8.1f} req/s | p50 {percentile(latencies, 50) * 1000:7.1f} ms"
+          f" | p90 {percentile(latencies, 90) * 1000:7.1f} ms | p99 {percentile(latencies, 99) * 1000:7.1f} ms"
+          f" | max {max(latencies) * 1000:7.1f} ms | lỗi {errors}/{len(latencies)} | login {stats['logins']}")
+    if stats['login_failures']:
+        print(f"{'':>13}{stats['login_failures']:>6} x đăng nhập thất bại")
+    for message, count in stats['errors'].most_common(3):
+        print(f"{'':>13}{count:>6} x {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--configs', default='1x8,2x4,4x2', help='Các cấu hình WORKERSxTHREADS của gunicorn')
+    parser.add_argument('--modes', type=lambda v: v.split(','), default=['gthread'],
+                        help='gthread (ICTU_ASYNC=0), gevent (ICTU_ASYNC=1) hoặc gthread,gevent để so sánh')
+    parser.add_argument('--gevent', dest='modes', action='store_const', const=['gevent'], help='Như --modes gevent')
+    parser.add_argument('--users', type=int, default=50, help='Số người dùng ảo gửi request cùng lúc')
+    parser.add_argument('--duration', type=float, default=20, help='Thời gian đo mỗi cấu hình (giây)')
+    parser.add_argument('--paths', type=lambda v: v.split(','), default=['/api/scores', '/api/lichthi', '/api/timetable'])
+    parser.add_argument('--refresh', action='store_true', help='Thêm ?refresh=1, bỏ qua result cache')
+    parser.add_argument('--think', type=float, default=0.0, help='Thời gian nghỉ giữa hai request của một người (giây)')
+    parser.add_argument('--timeout', type=float, default=60, help='Timeout mỗi request tới app (giây)')
+    parser.add_argument('--latency', type=float, default=0.1, help='Độ trễ của fake portal (giây)')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--session-ttl', type=float)
+    args = parser.parse_args()
+
+    base_url, portal = fake_portal.start_subprocess(latency=args.latency, jitter=args.jitter,
+                                                    error_rate=args.error_rate, session_ttl=args.session_ttl)
+    print(f"fake portal {base_url} | {args.users} người dùng | {args.duration:.0f}s mỗi cấu hình"
+          f"{' | refresh' if args.refresh else ''}")
+    try:
+        for config in args.configs.split(','):
+            workers, threads = (int(n) for n in config.lower().split('x'))
+            for mode in args.modes:
+                app_url, app_process = start_app(base_url, workers, threads, mode == 'gevent')
+                try:
+                    stats, elapsed = asyncio.run(drive(app_url, args))
+                finally:
+                    stop(app_process)
+                report(f"{config} {mode}", stats, elapsed)
+    finally:
+        stop(portal)
+
+
+if __name__ == '__main__':
+    main()
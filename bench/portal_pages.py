@@ -0,0 +1,253 @@
+"""Sinh các trang HTML giống portal ICTU (ASP.NET) dùng cho fake portal và benchmark"""
+import base64
+import functools
+import html
+import random
+
+COURSES = [
+    ("Cơ sở dữ liệu", "CSDL"),
+    ("Lập trình hướng đối tượng", "LTHDT"),
+    ("Mạng máy tính", "MMT"),
+    ("Cấu trúc dữ liệu và giải thuật", "CTDLGT"),
+    ("Hệ điều hành", "HDH"),
+    ("Trí tuệ nhân tạo", "TTNT"),
+    ("Kỹ thuật phần mềm", "KTPM"),
+    ("Toán rời rạc", "TRR"),
+]
+LECTURERS = ["Nguyễn Văn An", "Trần Thị Bình", "Lê Văn Cường", "Phạm Thị Dung", "Hoàng Văn Em"]
+ROOMS = ["C1.101", "C1.205", "C2.302", "C3.104", "Online"]
+SELECTED = ' selected="selected"'
+
+
+@functools.lru_cache(maxsize=None)
+def viewstate(size_kb=40, seed=0):
+    """ViewState ngẫu nhiên (base64) có kích thước xấp xỉ size_kb"""
+    return base64.b64encode(random.Random(seed).randbytes(size_kb * 768)).decode()
+
+
+def _page(title, body, viewstate_kb=40, form_action=""):
+    return f"""<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head><title>{title}</title>
+<script type="text/javascript">function __doPostBack(eventTarget, eventArgument) {{ return true; }}</script>
+</head>
+<body>
+<form name="Form1" method="post" action="{form_action}" id="Form1">
+<input type="hidden" name="__EVENTTARGET" id="__EVENTTARGET" value="" />
+<input type="hidden" name="__EVENTARGUMENT" id="__EVENTARGUMENT" value="" />
+<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{viewstate(viewstate_kb)}" />
+<input type="hidden" name="__VIEWSTATEGENERATOR" id="__VIEWSTATEGENERATOR" value="C2EE9ABB" />
+{body}
+</form>
+</body>
+</html>"""
+
+
+def _table(table_id, header_rows, rows):
+    out = [f'<table id="{table_id}" class="grid" cellspacing="0" border="1">']
+    for header in header_rows:
+        out.append("<tr class=\"DataGridFixedHeader\">" + "".join(f"<td>{html.escape(str(c))}</td>" for c in header) + "</tr>")
+    for row in rows:
+        out.append("<tr>" + "".join(f"<td>&nbsp;{html.escape(str(c))}</td>" for c in row) + "</tr>")
+    out.append("</table>")
+    return "\n".join(out)
+
+
+def login_page(error="", viewstate_kb=10):
+    body = f"""<input name="txtUserName" type="text" id="txtUserName" />
+<input name="txtPassword" type="password" id="txtPassword" />
+<input type="submit" name="btnSubmit" value="Đăng nhập" id="btnSubmit" />
+<span id="lblErrorInfo">{html.escape(error)}</span>"""
+    return _page("Đăng nhập", body, viewstate_kb, form_action="login.aspx")
+
+
+def home_page(name="Nguyễn Văn A", student_id="DTC245200672", major="Công nghệ thông tin", viewstate_kb=20):
+    body = f"""<span id="PageHeader1_lblUserFullName">{html.escape(name)} ({student_id})</span>
+<div class="info"><span id="lblNganh">{html.escape(major)}</span></div>"""
+    return _page("Trang chủ", body, viewstate_kb)
+
+
+def study_register_page(duration="2024 - 2028", viewstate_kb=30):
+    options = "".join(f'<option value="{i}">Học kỳ {i}</option>' for i in range(1, 9))
+    body = f"""<span id="lblDuration">{duration}</span>
+<select name="drpCourse" id="drpCourse"><option value="">-- Chọn --</option>{options}</select>"""
+    return _page("Đăng ký học", body, viewstate_kb)
+
+
+def mark_page(n_courses=40, n_terms=8, seed=1, viewstate_kb=60):
+    """Trang StudentMark.aspx: tblStudentMark (2 dòng header, 14 cột) + tblSumMark"""
+    rnd = random.Random(seed)
+    detail = []
+    for i in range(n_courses):
+        name, code = COURSES[i % len(COURSES)]
+        cc, thi = rnd.randint(5, 10), round(rnd.uniform(3, 10), 1)
+        tk = round(cc * 0.3 + thi * 0.7, 1)
+        detail.append([i + 1, f"{code}{i:03d}", f"{name} {i // len(COURSES) + 1}", rnd.choice([2, 3, 4]),
+                       "", "", "", "", "Đạt" if tk >= 4 else "Học lại", "", cc, thi, tk, "A" if tk >= 8.5 else "B"])
+    summary = []
+    for t in range(n_terms):
+        year = f"{2021 + t // 2}_{2022 + t // 2}"
+        summary.append([year, t % 2 + 1, round(rnd.uniform(6, 9), 2), "", round(rnd.uniform(2.5, 3.8), 2), "",
+                        rnd.randint(12, 22), "", round(rnd.uniform(6, 9), 2), "", round(rnd.uniform(2.5, 3.8), 2), "", "", ""])
+    detail_header = [["STT", "Mã HP", "Tên HP", "Số TC", "", "", "", "", "Đánh giá", "", "Điểm", "", "", ""],
+                     ["", "", "", "", "", "", "", "", "", "", "CC", "THI", "TKHP", "Chữ"]]
+    sum_header = [["Năm học", "Học kỳ", "TBTL hệ 10", "", "TBTL hệ 4", "", "Số TC", "", "TBC hệ 10", "", "TBC hệ 4", "", "", ""],
+                  [""] * 14]
+    body = _table("tblStudentMark", detail_header, detail) + "\n" + _table("tblSumMark", sum_header, summary)
+    return _page("Điểm học tập", body, viewstate_kb)
+
+
+def exam_page(n_exams=12, seed=2, viewstate_kb=40):
+    """Trang StudentViewExamList.aspx: bảng tblCourseList 10 cột"""
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(n_exams):
+        name, code = COURSES[i % len(COURSES)]
+        rows.append([i + 1, f"{code}{i:03d}", name, rnd.choice([2, 3]), f"{rnd.randint(1, 28):02d}/06/2025",
+                     f"Ca {rnd.randint(1, 4)}", rnd.choice(["Viết", "Trắc nghiệm", "Vấn đáp"]),
+                     f"SBD{i:04d}", rnd.choice(ROOMS), ""])
+    header = [["STT", "Mã HP", "Tên học phần", "Số TC", "Ngày thi", "Ca thi", "Hình thức thi", "SBD", "Phòng thi", "Ghi chú"]]
+    return _page("Lịch thi", _table("tblCourseList", header, rows), viewstate_kb)
+
+
+def timetable_page(n_rows=10, semesters=("1", "2", "3"), years=("2024_2025", "2025_2026"), n_weeks=20,
+                   selected=None, major="Công nghệ thông tin", seed=3, viewstate_kb=80, event_validation=None):
+    """Trang Reports/Form/StudentTimeTable.aspx: form xuất Excel + bảng grdStudentTimeTable"""
+    selected = selected or {}
+    event_validation = event_validation or viewstate(4, seed=9)
+    rnd = random.Random(seed)
+
+    def select(name, values, labels):
+        current = selected.get(name, values[0])
+        opts = "".join(
+            f'<option{SELECTED if v == current else ""} value="{v}">{html.escape(l)}</option>'
+            for v, l in zip(values, labels))
+        return f'<select name="{name}" id="{name}">{opts}</select>'
+
+    weeks = [str(w) for w in range(1, n_weeks + 1)]
+    body = f"""<div><span id="lblStudent">DTC245200672 - Nguyễn Văn A - Ngành: {html.escape(major)}</span></div>
+{select("drpHocKy", list(semesters), [f"Học kỳ {s}" for s in semesters])}
+{select("drpNamHoc", list(years), [y.replace("_", "-") for y in years])}
+{select("drpTuan", weeks, [f"Tuần {w}" for w in weeks])}
+<input type="radio" name="rdoType" value="0" checked="checked" />
+<input type="radio" name="rdoType" value="1" />
+<input type="submit" name="btnView" value="Xuất file Excel" id="btnView" />
+<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="{event_validation}" />
+"""
+    rows = []
+    for i in range(n_rows):
+        name, code = COURSES[i % len(COURSES)]
+        rows.append([i + 1, f"{name}-1-25 ({code}{i:03d})", f"{code}{i:03d}", name, rnd.choice([2, 3]),
+                     rnd.randint(2, 7), f"{rnd.randint(1, 6)}-->{rnd.randint(7, 10)}", rnd.choice(ROOMS),
+                     rnd.choice(LECTURERS), 60, 55, "1.200.000", ""])
+    header = [["STT", "Lớp học phần", "Mã HP", "Tên HP", "Số TC", "Thứ", "Tiết học", "Phòng", "Giảng viên",
+               "Sĩ số", "Số ĐK", "Học phí", "Ghi chú"]]
+    body += _table("grdStudentTimeTable", header, rows)
+    return _page("Thời khóa biểu", body, viewstate_kb, form_action="StudentTimeTable.aspx")
+
+
+def timetable_workbook(n_weeks=16, rows_per_week=10, major="Công nghệ thông tin", seed=4, only_week=None):
+    """File .xls mà nút "Xuất file Excel" trả về (cần xlwt): tiêu đề, dòng Ngành, header,
+    dòng "Tuần N (dd/mm/yyyy đến dd/mm/yyyy)" rồi các môn trong tuần, cột Thứ để trống khi
+    trùng môn phía trên (merged cell). only_week: chỉ ghi tuần đó (dữ liệu giống hệt bản đủ)"""
+    import datetime
+    import io
+
+    import xlwt
+
+    rnd = random.Random(seed)
+    book = xlwt.Workbook(encoding="utf-8")
+    sheet = book.add_sheet("TKB")
+    sheet.write(0, 0, "TRƯỜNG ĐẠI HỌC CÔNG NGHỆ THÔNG TIN VÀ TRUYỀN THÔNG")
+    sheet.write(1, 0, "THỜI KHÓA BIỂU SINH VIÊN")
+    sheet.write(2, 0, "Họ tên: Nguyễn Văn A - Mã SV: DTC245200672")
+    sheet.write(3, 0, f"Ngành: {major}")
+    header = ["STT", "Lớp học phần", "Số TC", "Thứ", "Tiết học", "Địa điểm", "Giảng viên/ link meet",
+              "Sĩ số", "Số ĐK", "Học phí", "Thời gian", "Ghi chú"]
+    for col, title in enumerate(header):
+        sheet.write(5, col, title)
+
+    row = 6
+    start = datetime.date(2024, 9, 2)
+    stt = 0
+    for week in range(n_weeks):
+        week_start = start + datetime.timedelta(weeks=week)
+        week_end = week_start + datetime.timedelta(days=6)
+        # Vẫn sinh số ngẫu nhiên cho các tuần bị bỏ qua để dữ liệu tuần được ghi không đổi
+        write = only_week is None or week + 1 == only_week
+        if write:
+            sheet.write(row, 1, f"Tuần {week + 1} ({week_start:%d/%m/%Y} đến {week_end:%d/%m/%Y})")
+            row += 1
+        days = sorted(rnd.randint(2, 8) for _ in range(rows_per_week))
+        last_day = None
+        for i, day in enumerate(days):
+            stt += 1
+            name, code = COURSES[(week + i) % len(COURSES)]
+            lecturer = rnd.choice(LECTURERS)
+            if rnd.random() < 0.4:
+                lecturer += f"\nhttps://meet.google.com/{code.lower()}-{rnd.randint(100, 999)}-xyz"
+            first = rnd.choice([1, 4, 6, 7, 11])
+            values = [stt, f"{name}-1-25 (K23{code}.{i % 3 + 1:02d})", rnd.choice([2, 3]),
+                      day if day != last_day else "", f"{first} --> {first + rnd.randint(1, 3)}",
+                      rnd.choice(ROOMS), lecturer, 60, rnd.randint(30, 60), "1.200.000",
+                      f"{week_start:%d/%m/%Y} đến {week_end:%d/%m/%Y} ({rnd.choice(['LT', 'TH'])})", ""]
+            last_day = day
+            if not write:
+                continue
+            for col, value in enumerate(values):
+                if value != "":
+                    sheet.write(row, col, value)
+            row += 1
+
+    buffer = io.BytesIO()
+    book.save(buffer)
+    return buffer.getvalue()
+
+
+def timetable_dtype_workbook(numeric_only=False):
+    """File .xls nhỏ gom các trường hợp suy ra kiểu của pandas.read_excel mà TimetableSheet phải
+    làm giống (cần xlwt): cột số có ô trống (1 -> "1.0"), chuỗi số trong cột số, "NA"/"nan" là ô
+    trống, cột bool, cột object lẫn 1 và True, số nguyên vượt int64, dòng chỉ gồm ngày giờ, cột
+    không tên và tên cột trùng. numeric_only: chỉ giữ các cột số (iterrows đổi int sang float).
+    Được lưu sẵn ở fixtures/timetable_dtypes.xls và fixtures/timetable_numeric.xls."""
+    import datetime
+    import io
+
+    import xlwt
+
+    book = xlwt.Workbook(encoding="utf-8")
+    sheet = book.add_sheet("TKB")
+    date_style = xlwt.easyxf(num_format_str="DD/MM/YYYY")
+    sheet.write(0, 0, "THỜI KHÓA BIỂU SINH VIÊN")
+    sheet.write(1, 0, "Ngành: Kỹ thuật phần mềm")
+    header = ["STT", "Lớp học phần", "Số TC", "Thứ", "Tiết học", "Địa điểm", "Giảng viên", "Học phí",
+              "Thời gian", "Ghi chú", "", "Ghi chú", "Mã"]
+    day = datetime.datetime(2024, 9, 2)
+    rows = [
+        [1, "Lập trình Python-1-25 (K23CNTT.01)", "3", 2, "1 --> 3", "C1.101", 1, 1500000.5, day, True, "x", "True", 2 ** 70],
+        [2, "Cơ sở dữ liệu-1-25 (K23CNTT.02)", 2, "", "4 --> 6", "NA", True, 1200000, day, False, "", "false", 7],
+        ["", "Mạng máy tính-1-25 (K23CNTT.03)", " 4 ", 3, "7 --> 9", "nan", "Trần Thị Bình", "", day, True, 3, "", "A1"],
+        ["", "", "", "", "", "", "", "", day + datetime.timedelta(days=1), "", "", "", ""],
+        [5, "Toán rời rạc-1-25 (K23CNTT.05)", "2.5", "", "1 --> 2", "C2.202", "Lê Văn Cường", "NULL", day, False, "", "TRUE", 9],
+    ]
+    if numeric_only:
+        # STT (có ô trống), Số TC (chuỗi số), Thứ, Tiết học (tiết bắt đầu): cột float và cột int
+        # trong cùng frame toàn số
+        keep = [0, 2, 3]
+        header = [header[c] for c in keep] + ["Tiết học"]
+        rows = [[row[c] for c in keep] + [first] for row, first in zip(rows, [1, 4, 7, "", 1])
+                if any(row[c] != "" for c in keep)]
+    for col, title in enumerate(header):
+        if title:
+            sheet.write(3, col, title)
+    for r, values in enumerate(rows, start=4):
+        for col, value in enumerate(values):
+            if value == "":
+                continue
+            if isinstance(value, datetime.datetime):
+                sheet.write(r, col, value, date_style)
+            else:
+                sheet.write(r, col, value)
+    buffer = io.BytesIO()
+    book.save(buffer)
+    return buffer.getvalue()
@@ -0,0 +1,55 @@
+"""Cấu hình gunicorn (Procfile: gunicorn app:app -c gunicorn.conf.py).
+
+GUNICORN_PRELOAD=1 (mặc định): app được import trong master, warmup parse fixtures
+rồi gc.freeze() trước khi fork, nên mọi worker nhận request đầu tiên khi đã "nóng"
+và dùng chung phần bộ nhớ của thư viện/regex với master.
+GUNICORN_PRELOAD=0: mỗi worker tự import app và warmup trước khi nhận request.
+GUNICORN_WARMUP=0 tắt hẳn bước warmup.
+
+Worker gthread với GUNICORN_THREADS thread mỗi worker (mặc định 4): view Flask là WSGI đồng bộ
+và chờ portal bằng requests, nên số request một worker phục vụ cùng lúc chính là số thread.
+
+ICTU_ASYNC=1: worker gevent. Socket, lock, thread... được monkey patch ngay khi nạp file cấu hình
+này, trước khi master import app (preload), nên chính ICTUService (requests) chạy không chặn: mỗi
+request là một greenlet, một worker giữ được tới GUNICORN_WORKER_CONNECTIONS (mặc định 500)
+request cùng lúc chờ portal. Kết nối tới portal đi qua pool dùng chung (ICTU_HTTP_POOL_SIZE,
+ICTU_HTTP_POOL_BLOCK=1 để không mở quá số đó), còn phần parse chạy trong threadpool của gevent
+để không giữ hub (xem ictu_service._parse_step).
+
+Số worker, bind... vẫn lấy từ WEB_CONCURRENCY, PORT như mặc định của gunicorn.
+"""
+import os
+
+USE_GEVENT = os.environ.get('ICTU_ASYNC', '0') == '1'
+if USE_GEVENT:
+    from gevent import monkey
+    monkey.patch_all()
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+WARMUP = os.environ.get('GUNICORN_WARMUP', '1') == '1'
+
+if USE_GEVENT:
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 500))
+else:
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+
+def when_ready(server):
+    # Gọi trong master sau khi load app (preload) và trước khi fork worker đầu tiên
+    if not preload_app:
+        return
+    import warmup
+    if WARMUP:
+        warmup.warm_up()
+    frozen = warmup.freeze_heap()
+    server.log.info("Master ready: %d objects frozen, %s", frozen, warmup.format_memory(warmup.memory_usage()))
+
+
+def post_worker_init(worker):
+    # Gọi trong worker sau khi load app, trước khi worker nhận request
+    import warmup
+    if WARMUP and not preload_app:
+        warmup.warm_up()
+    worker.log.info("Worker %s ready: %s", worker.pid, warmup.format_memory(warmup.memory_usage()))
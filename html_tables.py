@@ -0,0 +1,369 @@
+"""Trích xuất bảng theo id từ HTML của portal mà không parse toàn bộ trang bằng BeautifulSoup.
+
+Trang điểm/lịch thi/TKB của portal có ViewState, menu, script... lớn hơn nhiều so với bảng
+cần đọc. extract_table() tìm vị trí thẻ <table id="..."> bằng regex, chỉ tokenize từ đó
+bằng html.parser và dừng ngay khi bảng đóng, rồi dựng một cây Element tối giản
+(find_all, get_text) đủ cho các hàm _parse_* của ICTUService.
+
+Cây dựng ra khớp với BeautifulSoup(html, 'html.parser') trên cùng bảng: thẻ không đóng
+lồng vào nhau, thẻ đóng lạc bị bỏ qua hoặc đóng tới thẻ mở gần nhất cùng tên (kể cả thẻ
+bao ngoài bảng), thẻ rỗng (br, img...), entity/charref và chuỗi trong script/style/
+template/rt/rp hay comment không tính vào get_text().
+
+Để khớp bs4, module dùng hằng số và hàm nội bộ của bs4 (HTMLTreeBuilder.DEFAULT_*,
+UnicodeDammit.numeric_character_reference...) vốn đổi giữa các bản: 4.12 thiếu hằng số,
+4.13/4.14 khác cách xử lý charref và thẻ rỗng. Vì vậy requirements.txt ghim đúng bản bs4
+đã kiểm tra; khi nâng bản phải chạy lại tests/test_html_tables.py (so sánh trực tiếp với
+BeautifulSoup). SoupStrainer không thay được: html.parser/lxml vẫn tokenize cả trang, chậm
+hơn extract_table 1,7-6 lần (bench/bench_table_extract.py).
+"""
+import html
+import re
+from html.parser import HTMLParser
+
+from bs4.builder import HTMLTreeBuilder
+from bs4.dammit import EntitySubstitution, UnicodeDammit
+
+FEED_CHUNK_SIZE = 16 * 1024
+VOID_ELEMENTS = frozenset(HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS)
+# Chuỗi nằm trong các thẻ này không phải text thường (bs4 dùng Script, Stylesheet, ...)
+STRING_CONTAINERS = frozenset(HTMLTreeBuilder.DEFAULT_STRING_CONTAINERS)
+PRESERVE_WHITESPACE = frozenset(HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS)
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+TITLE_PATTERN = re.compile(r'<title\b[^>]*>(.*?)</title\s*>', re.IGNORECASE | re.DOTALL)
+DECIMAL_REFERENCE = re.compile(r'^([0-9]+)(.*)')
+HEX_REFERENCE = re.compile(r'^([0-9a-f]+)(.*)')
+# Đường nhanh: markup "đơn giản" (thẻ có thuộc tính trong ngoặc kép, text và entity thường)
+# được tokenize bằng regex; gặp bất kỳ thứ gì khác (comment, script, charref lạ...) thì
+# parse lại bảng bằng html.parser để giữ đúng kết quả như bs4
+SIMPLE_TOKEN = re.compile(r"""
+    ([^<]*)
+    (?:<(/?)([a-zA-Z][-.:a-zA-Z0-9_]*)
+       ((?:[ \t\n\r\f]+[a-zA-Z_:][-.:a-zA-Z0-9_]*
+           (?:[ \t\n\r\f]*=[ \t\n\r\f]*(?:"[^"]*"|'[^']*'|[-.:a-zA-Z0-9_#%;,+]+(?=[ \t\n\r\f>])))?)*)
+       [ \t\n\r\f]*(/?)>)?
+""", re.VERBOSE)
+SIMPLE_ATTRIBUTE = re.compile(r"""[ \t\n\r\f]+([a-zA-Z_:][-.:a-zA-Z0-9_]*)"""
+                              r"""(?:[ \t\n\r\f]*=[ \t\n\r\f]*("[^"]*"|'[^']*'|[-.:a-zA-Z0-9_#%;,+]+))?""")
+SIMPLE_REFERENCE = re.compile(r'&(?:#([0-9]+);|#[xX]([0-9a-fA-F]+);|([a-zA-Z][-.a-zA-Z0-9]*)(;?)|(#))')
+# Thẻ có nội dung dạng raw text trong html.parser (và các bản Python mới hơn)
+RAW_TEXT_ELEMENTS = frozenset(['script', 'style', 'textarea', 'title', 'xmp', 'iframe', 'noembed', 'noframes',
+                               'noscript', 'plaintext'])
+# Token của phần HTML đứng trước bảng, chỉ dùng khi cần biết thẻ nào đang mở bên ngoài bảng
+PREFIX_TOKEN = re.compile(r"""
+    <!--.*?(?:-->|\Z)
+  | <(script|style)\b(?:[^>"']|"[^"]*"|'[^']*')*>.*?(?:</\1\s*>|\Z)
+  | </([a-zA-Z][^\t\n\r\f />]*)[^>]*>
+  | <([a-zA-Z][^\t\n\r\f />]*)(?:[^>"']|"[^"]*"|'[^']*')*?(/?)>
+  | <[!?][^>]*>
+""", re.IGNORECASE | re.DOTALL | re.VERBOSE)
+
+
+def _table_start_pattern(table_id):
+    return re.compile(r'<table\b[^>]*?\bid\s*=\s*(["\']?)%s\1[\s/>]' % re.escape(table_id), re.IGNORECASE)
+
+
+class Element:
+    """Một thẻ HTML: tên, thuộc tính và con (Element hoặc chuỗi text)"""
+    __slots__ = ('name', 'attrs', 'children')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.children = []
+
+    def get(self, key, default=None):
+        return self.attrs.get(key, default)
+
+    def iter_descendants(self):
+        """Duyệt các thẻ con cháu theo thứ tự trong tài liệu (như soup.descendants, bỏ text)"""
+        stack = [iter(self.children)]
+        while stack:
+            for child in stack[-1]:
+                if isinstance(child, Element):
+                    yield child
+                    stack.append(iter(child.children))
+                    break
+            else:
+                stack.pop()
+
+    def find_all(self, names):
+        """Các thẻ con cháu có tên là names (chuỗi hoặc list), giống Tag.find_all"""
+        if isinstance(names, str):
+            names = (names,)
+        return [element for element in self.iter_descendants() if element.name in names]
+
+    def strings(self):
+        stack = [iter(self.children)]
+        while stack:
+            for child in stack[-1]:
+                if isinstance(child, Element):
+                    stack.append(iter(child.children))
+                    break
+                yield child
+            else:
+                stack.pop()
+
+    def get_text(self, strip=False):
+        if strip:
+            return ''.join(text for text in (s.strip() for s in self.strings()) if text)
+        return ''.join(self.strings())
+
+    @property
+    def text(self):
+        return self.get_text()
+
+    def __repr__(self):
+        return f"<Element {self.name} {self.attrs!r} ({len(self.children)} children)>"
+
+
+def _open_tags_before(html_text, end):
+    """Tên các thẻ còn mở tại vị trí end theo cách bs4 dựng cây (thẻ đóng pop tới thẻ mở gần nhất cùng tên)"""
+    stack = []
+    for match in PREFIX_TOKEN.finditer(html_text, 0, end):
+        end_name, start_name, self_closing = match.group(2), match.group(3), match.group(4)
+        if match.group(1):
+            continue
+        if end_name:
+            name = end_name.lower()
+            if name in stack:
+                del stack[len(stack) - 1 - stack[::-1].index(name):]
+        elif start_name:
+            name = start_name.lower()
+            if name not in VOID_ELEMENTS and not self_closing:
+                stack.append(name)
+    return stack
+
+
+def _inside_raw_text(html_text, pos):
+    """Vị trí pos có nằm trong comment hay script/style (khi đó không phải thẻ thật)"""
+    comment = html_text.rfind('<!--', 0, pos)
+    if comment != -1 and html_text.find('-->', comment + 4, pos) == -1:
+        return True
+    lowered = html_text[:pos].lower()
+    for name in ('script', 'style'):
+        opened = lowered.rfind('<' + name)
+        if opened != -1 and lowered.find('</' + name, opened) == -1:
+            return True
+    return False
+
+
+class _TableParser(HTMLParser):
+    """Dựng cây cho một bảng, bắt đầu ngay tại thẻ <table> và dừng khi bảng đóng"""
+
+    def __init__(self, html_text, start, table_id):
+        super().__init__(convert_charrefs=False)
+        self.html_text = html_text
+        self.start = start
+        self.table_id = table_id
+        self.root = None
+        self.stack = []
+        self.containers = []
+        self.preserved = []
+        self.pending = []
+        self.already_closed = []
+        self.outer_tags = None
+        self.done = False
+
+    def run_simple(self):
+        """Dựng cây bằng SIMPLE_TOKEN, trả về False nếu gặp markup cần html.parser xử lý"""
+        html_text = self.html_text
+        position = self.start
+        while not self.done:
+            match = SIMPLE_TOKEN.match(html_text, position)
+            text, closing, tag, attributes, self_closing = match.groups()
+            if text and not self._simple_text(text):
+                return False
+            if tag is None:
+                # '<' không tạo thành thẻ đơn giản, hoặc hết trang mà bảng chưa đóng
+                return False
+            position = match.end()
+            tag = tag.lower()
+            if tag in RAW_TEXT_ELEMENTS:
+                return False
+            if closing:
+                if attributes or self_closing:
+                    return False
+                self.handle_endtag(tag)
+                continue
+            attrs = []
+            for name, value in SIMPLE_ATTRIBUTE.findall(attributes):
+                if value[:1] in ('"', "'"):
+                    value = value[1:-1]
+                attrs.append((name.lower(), html.unescape(value)))
+            if self_closing:
+                self.handle_startendtag(tag, attrs)
+            else:
+                self.handle_starttag(tag, attrs)
+        return True
+
+    def _simple_text(self, text):
+        if '&' not in text:
+            self.handle_data(text)
+            return True
+        position = 0
+        for match in SIMPLE_REFERENCE.finditer(text):
+            decimal, hexadecimal, name, semicolon, bad_charref = match.groups()
+            if bad_charref:
+                return False
+            if match.start() > position:
+                self.handle_data(text[position:match.start()])
+            if name:
+                self.handle_entityref(name)
+            else:
+                self.handle_charref(decimal or 'x' + hexadecimal)
+            position = match.end()
+        if position < len(text):
+            self.handle_data(text[position:])
+        return True
+
+    def run(self):
+        position = self.start
+        while not self.done and position < len(self.html_text):
+            self.feed(self.html_text[position:position + FEED_CHUNK_SIZE])
+            position += FEED_CHUNK_SIZE
+        if not self.done:
+            self.close()
+            self._flush()
+        return self.root
+
+    def _flush(self, text_type=None):
+        if not self.pending:
+            return
+        text = ''.join(self.pending)
+        self.pending = []
+        if not self.preserved and not text.strip(ASCII_SPACES):
+            # Chuỗi chỉ gồm khoảng trắng được rút gọn như bs4
+            text = '\n' if '\n' in text else ' '
+        if self.stack and (text_type == 'cdata' or (text_type is None and not self.containers)):
+            self.stack[-1].children.append(text)
+
+    def _push(self, element):
+        if self.stack:
+            self.stack[-1].children.append(element)
+        self.stack.append(element)
+        if element.name in STRING_CONTAINERS:
+            self.containers.append(element)
+        if element.name in PRESERVE_WHITESPACE:
+            self.preserved.append(element)
+
+    def _pop_to(self, name):
+        if not any(element.name == name for element in self.stack):
+            if self.stack and self._closes_outer(name):
+                self._finish()
+            return
+        while self.stack:
+            element = self.stack.pop()
+            if self.containers and self.containers[-1] is element:
+                self.containers.pop()
+            if self.preserved and self.preserved[-1] is element:
+                self.preserved.pop()
+            if element.name == name:
+                break
+        if not self.stack:
+            self._finish()
+
+    def _closes_outer(self, name):
+        # Thẻ đóng không khớp thẻ nào trong bảng: bs4 sẽ đóng luôn bảng nếu thẻ đó đang mở bên ngoài
+        if self.outer_tags is None:
+            self.outer_tags = set(_open_tags_before(self.html_text, self.start))
+        return name in self.outer_tags
+
+    def _finish(self):
+        self.stack = []
+        self.done = True
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        if self.done:
+            return
+        self._flush()
+        element = Element(tag, {key: '' if value is None else value for key, value in attrs})
+        if self.root is None:
+            if tag != 'table' or element.attrs.get('id') != self.table_id:
+                self._finish()
+                return
+            self.root = element
+        self._push(element)
+        if handle_empty_element and tag in VOID_ELEMENTS:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.already_closed.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if self.done:
+            return
+        if check_already_closed and tag in self.already_closed:
+            self.already_closed.remove(tag)
+            return
+        self._flush()
+        self._pop_to(tag)
+
+    def handle_data(self, data):
+        if not self.done:
+            self.pending.append(data)
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else "&%s" % name)
+
+    def handle_charref(self, name):
+        base, pattern = 10, DECIMAL_REFERENCE
+        if name.startswith(('x', 'X')):
+            name, base, pattern = name[1:], 16, HEX_REFERENCE
+        number, extra = None, ""
+        try:
+            number = int(name, base)
+        except ValueError:
+            match = pattern.search(name)
+            if match is not None:
+                number, extra = int(match.group(1), base), match.group(2)
+        if number is None:
+            extra = name
+        else:
+            self.handle_data(UnicodeDammit.numeric_character_reference(number)[0])
+        if extra:
+            self.handle_data(extra)
+
+    def _handle_other(self, data, text_type=None):
+        if self.done:
+            return
+        self._flush()
+        self.pending.append(data)
+        self._flush(text_type or 'other')
+
+    def handle_comment(self, data):
+        self._handle_other(data)
+
+    def handle_decl(self, decl):
+        self._handle_other(decl)
+
+    def handle_pi(self, data):
+        self._handle_other(data)
+
+    def unknown_decl(self, data):
+        if data.upper().startswith("CDATA["):
+            self._handle_other(data[len("CDATA["):], 'cdata')
+        else:
+            self._handle_other(data)
+
+
+def extract_table(html_text, table_id):
+    """Bảng <table id=table_id> đầu tiên trong trang dưới dạng Element, None nếu không có"""
+    for match in _table_start_pattern(table_id).finditer(html_text):
+        if _inside_raw_text(html_text, match.start()):
+            continue
+        parser = _TableParser(html_text, match.start(), table_id)
+        table = parser.root if parser.run_simple() else _TableParser(html_text, match.start(), table_id).run()
+        if table is not None:
+            return table
+    return None
+
+
+def page_title(html_text):
+    """Nội dung thẻ <title> (đã unescape), None nếu trang không có title"""
+    match = TITLE_PATTERN.search(html_text)
+    return html.unescape(match.group(1)) if match else None
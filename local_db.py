@@ -0,0 +1,50 @@
+"""File SQLite dùng chung giữa các worker gunicorn trên cùng máy (session_store, shared_cache).
+
+WAL cho phép các worker đọc trong lúc một worker đang ghi; synchronous=NORMAL bỏ fsync mỗi
+commit, chỉ mất vài giao dịch cuối khi cả máy sập (chấp nhận được với phiên/cache). Kết nối
+SQLite không dùng được qua nhiều thread hay qua fork (gunicorn preload) nên mỗi thread của mỗi
+process mở kết nối riêng, lazily ở lần dùng đầu tiên.
+
+Worker gevent: threading.local bị patch thành theo greenlet (mỗi request một greenlet) nên sẽ mở
+kết nối mới mỗi request; ở đây dùng threading.local gốc, các greenlet trên cùng thread dùng chung
+kết nối (mỗi lệnh SQLite chạy trọn, không nhường hub giữa chừng).
+"""
+import os
+import sqlite3
+import threading
+
+try:
+    from gevent.monkey import get_original
+    _thread_local = get_original('threading', 'local')
+except ImportError:
+    _thread_local = threading.local
+
+
+class LocalDB:
+    def __init__(self, path, schema, timeout=5):
+        self.path = path
+        self.schema = schema
+        self.timeout = timeout
+        self._local = _thread_local()
+        self._pid = None
+
+    def connection(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            self._local = _thread_local()
+            self._pid = pid
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # File chứa dữ liệu của sinh viên: chỉ user chạy app đọc được (-wal, -shm theo quyền file chính)
+        os.close(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600))
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(self.schema)
+        return conn
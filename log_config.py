@@ -0,0 +1,81 @@
+"""Logging của app: level theo từng module, message format lười và lấy mẫu log debug theo request.
+
+Thay cho các print [DEBUG]/[ERROR] trước đây. Mỗi module lấy logger bằng get_logger(__name__)
+và truyền tham số kiểu %s (log.debug("Found %d rows", n)), nên khi level bị tắt message không
+được format và không có gì ghi ra stdout.
+
+Cấu hình qua biến môi trường (configure() đọc một lần khi import app):
+  LOG_LEVEL=INFO                              level mặc định cho mọi module (production)
+  LOG_LEVELS=ictu_service=DEBUG,app=WARNING   level riêng cho từng module
+  LOG_DEBUG_SAMPLE_RATE=0.01                  tỉ lệ request được ghi toàn bộ log debug
+Request được lấy mẫu (sample_request() đầu mỗi request) ghi log debug của mọi module bất kể
+level, các request khác giữ nguyên level đã cấu hình.
+"""
+import contextvars
+import logging
+import os
+import random
+import sys
+
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+
+_debug_sampled = contextvars.ContextVar('debug_sampled', default=False)
+_sample_rate = 0.0
+_configured = False
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """Logger bật mọi level cho request đang được lấy mẫu, ngoài ra theo level của logger gốc"""
+
+    def isEnabledFor(self, level):
+        if self.logger.isEnabledFor(level):
+            return True
+        return _debug_sampled.get() and not self.logger.disabled
+
+    def log(self, level, msg, *args, **kwargs):
+        if self.isEnabledFor(level):
+            msg, kwargs = self.process(msg, kwargs)
+            # Gọi thẳng _log để không bị chặn lại bởi level của logger gốc khi request được lấy mẫu
+            self.logger._log(level, msg, args, **kwargs)
+
+
+def get_logger(name):
+    return SampledLogger(logging.getLogger(name), None)
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in spec.split(','):
+        name, _, level = item.strip().partition('=')
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure(environ=os.environ):
+    """Gắn handler ra stdout và đặt level theo biến môi trường (chỉ chạy lần đầu)"""
+    global _sample_rate, _configured
+    if _configured:
+        return
+    _configured = True
+    root = logging.getLogger()
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+    root.setLevel(environ.get('LOG_LEVEL', 'INFO').upper())
+    for name, level in _parse_levels(environ.get('LOG_LEVELS', '')).items():
+        logging.getLogger(name).setLevel(level)
+    _sample_rate = float(environ.get('LOG_DEBUG_SAMPLE_RATE', 0))
+
+
+def sample_request(rate=None):
+    """Quyết định request hiện tại có ghi log debug hay không (gọi đầu mỗi request)"""
+    rate = _sample_rate if rate is None else rate
+    sampled = rate > 0 and random.random() < rate
+    _debug_sampled.set(sampled)
+    return sampled
+
+
+def debug_sampled():
+    return _debug_sampled.get()
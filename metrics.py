@@ -0,0 +1,222 @@
+"""Metrics trong process, xuất ra dạng Prometheus text tại GET /metrics.
+
+Registry tự viết (không cần prometheus_client): Counter, Gauge, Histogram có label, và
+collector là hàm được gọi lúc scrape để đọc số liệu có sẵn (stats() của session pool,
+result cache) thay vì đếm hai lần. Mỗi worker gunicorn có registry riêng nên mỗi lần
+scrape chỉ thấy số liệu của worker nhận request.
+"""
+import bisect
+import contextlib
+import functools
+import threading
+import time
+
+# Bucket (giây) cho latency portal và thời gian parse
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: cần đúng các label {self.labelnames}, nhận {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+            if self.type == 'counter' and not self.labelnames:
+                self._values[()] = 0
+
+    def samples(self):
+        """[(hậu tố tên, [(label, giá trị)], value)] theo thứ tự label"""
+        with self._lock:
+            items = sorted(self._values.items())
+        return [('', list(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [số lần theo từng bucket (không cộng dồn), tổng, số lần]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        out = []
+        for key, (counts, total, count) in items:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                out.append(('_bucket', labels + [('le', _format_value(float(bound)))], cumulative))
+            out.append(('_sum', labels, total))
+            out.append(('_count', labels, count))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} đã được đăng ký")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collect):
+        """collect() trả về list (tên, kiểu, mô tả, [(dict label, giá trị)]), được gọi mỗi lần scrape"""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def reset(self):
+        """Xóa giá trị của mọi metric (các collector không bị ảnh hưởng)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        for collect in collectors:
+            for name, metric_type, documentation, samples in collect():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def timed(histogram, **labels):
+    """Decorator ghi thời gian chạy của hàm vào histogram"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+
+REGISTRY = Registry()
+
+PORTAL_REQUEST_SECONDS = REGISTRY.histogram(
+    'tkb_portal_request_seconds', 'Thời gian một request tới portal (tới khi đọc xong body)', ['page', 'method'])
+PORTAL_REQUEST_ERRORS = REGISTRY.counter(
+    'tkb_portal_request_errors_total', 'Request tới portal lỗi (timeout, lỗi kết nối...)', ['page', 'method', 'error'])
+PARSE_SECONDS = REGISTRY.histogram(
+    'tkb_parse_seconds', 'Thời gian parse/chuẩn hóa dữ liệu theo từng hàm', ['method'])
+AUTO_RELOGINS = REGISTRY.counter(
+    'tkb_auto_relogins_total', 'Số lần tự động đăng nhập lại khi session portal hết hạn', ['result'])
+VALIDATION_PROBES = REGISTRY.counter(
+    'tkb_validation_probes_total', 'Probe kiểm tra session: sent = đã gửi, saved = bỏ qua nhờ optimistic mode',
+    ['result'])
+TIMETABLE_FALLBACKS = REGISTRY.counter(
+    'tkb_timetable_excel_fallbacks_total', 'Số lần lấy TKB Excel lỗi và phải chuyển sang trang HTML')
+TIMETABLE_FORM_CACHE = REGISTRY.counter(
+    'tkb_timetable_form_cache_total',
+    'Form xuất Excel TKB: hit = POST thẳng bằng form đã lưu, miss = phải GET trang, stale = form đã lưu bị từ chối',
+    ['result'])
+PORTAL_RETRIES = REGISTRY.counter(
+    'tkb_portal_retries_total', 'Số lần thử lại request GET tới portal sau lỗi kết nối, timeout hoặc 5xx',
+    ['page', 'method'])
+PORTAL_BREAKER_REJECTIONS = REGISTRY.counter(
+    'tkb_portal_breaker_rejections_total', 'Request tới portal bị từ chối ngay vì circuit breaker đang mở')
+PORTAL_BREAKER_TRANSITIONS = REGISTRY.counter(
+    'tkb_portal_breaker_transitions_total', 'Số lần circuit breaker chuyển sang từng trạng thái', ['state'])
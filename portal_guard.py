@@ -0,0 +1,175 @@
+"""Bảo vệ các request tới portal: timeout theo latency thực tế, retry GET và circuit breaker.
+
+Portal là một host HTTP duy nhất và hay timeout. Với timeout cố định 30 giây, mỗi request khi
+portal sập giữ một thread của worker 30 giây và tải dồn lại. PortalGuard dùng chung cho mọi
+ICTUService trong process (gọi từ _send):
+
+  timeout   mỗi (method, trang) giữ latency của các request gần nhất; timeout = percentile
+            (PORTAL_TIMEOUT_PERCENTILE) x PORTAL_TIMEOUT_MULTIPLIER, trong khoảng
+            [PORTAL_TIMEOUT_MIN, timeout cố định cũ của lời gọi]. Chưa đủ mẫu thì dùng timeout cũ.
+            Chỉ request thành công được ghi mẫu; probe half-open dùng timeout cũ nên khi portal
+            chậm hẳn đi (mọi request timeout, mạch mở) latency mới vẫn được ghi nhận.
+  retry     chỉ GET (idempotent): lỗi kết nối, timeout, HTTP 5xx được thử lại tối đa
+            PORTAL_RETRIES lần, chờ backoff mũ có jitter, không vượt quá timeout cũ của lời gọi.
+  breaker   PORTAL_BREAKER_THRESHOLD lần lỗi liên tiếp thì mở mạch: mọi request bị từ chối ngay
+            (PortalUnavailableError của từng bản service, route trả 503 và result cache trả kết
+            quả cũ nếu có) trong PORTAL_BREAKER_OPEN_SECONDS giây. Sau đó half-open: đúng một
+            request thật được gửi làm probe, thành công thì đóng mạch, lỗi thì mở lại.
+
+Trạng thái xem tại /api/portal_status và trong /metrics.
+"""
+import collections
+import os
+import random
+import threading
+import time
+
+from log_config import get_logger
+from metrics import PORTAL_BREAKER_REJECTIONS, PORTAL_BREAKER_TRANSITIONS, PORTAL_RETRIES
+
+log = get_logger(__name__)
+
+BREAKER_THRESHOLD = int(os.environ.get('PORTAL_BREAKER_THRESHOLD', 5))
+BREAKER_OPEN_SECONDS = float(os.environ.get('PORTAL_BREAKER_OPEN_SECONDS', 30))
+RETRIES = int(os.environ.get('PORTAL_RETRIES', 2))
+RETRY_BACKOFF = float(os.environ.get('PORTAL_RETRY_BACKOFF', 0.2))
+RETRY_BACKOFF_MAX = float(os.environ.get('PORTAL_RETRY_BACKOFF_MAX', 2.0))
+TIMEOUT_MIN = float(os.environ.get('PORTAL_TIMEOUT_MIN', 2.0))
+TIMEOUT_PERCENTILE = float(os.environ.get('PORTAL_TIMEOUT_PERCENTILE', 99))
+TIMEOUT_MULTIPLIER = float(os.environ.get('PORTAL_TIMEOUT_MULTIPLIER', 3.0))
+TIMEOUT_MIN_SAMPLES = int(os.environ.get('PORTAL_TIMEOUT_MIN_SAMPLES', 20))
+LATENCY_WINDOW = int(os.environ.get('PORTAL_LATENCY_WINDOW', 200))
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+# Giá trị gauge tkb_portal_breaker_state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+RETRY_STATUSES = frozenset([500, 502, 503, 504])
+
+
+class PortalGuard:
+    def __init__(self, threshold=BREAKER_THRESHOLD, open_seconds=BREAKER_OPEN_SECONDS, retries=RETRIES,
+                 backoff=RETRY_BACKOFF, backoff_max=RETRY_BACKOFF_MAX, timeout_min=TIMEOUT_MIN,
+                 percentile=TIMEOUT_PERCENTILE, multiplier=TIMEOUT_MULTIPLIER, min_samples=TIMEOUT_MIN_SAMPLES,
+                 window=LATENCY_WINDOW):
+        self.threshold = threshold
+        self.open_seconds = open_seconds
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.timeout_min = timeout_min
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self.window = window
+        self._latencies = {}  # (method, trang) -> deque latency (giây)
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self.state = CLOSED
+        self.failures = 0  # lỗi liên tiếp
+        self._opened_at = 0.0
+        self._probe_started = None
+        self.rejected = 0
+
+    def allow(self):
+        """Request được gửi tới portal không; False khi mạch đang mở (hoặc half-open đã có probe)"""
+        if self.state == CLOSED:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN)
+            # Probe half-open không báo kết quả (lỗi ngoài dự kiến) quá lâu thì cho probe khác
+            if self.state == HALF_OPEN and (self._probe_started is None
+                                            or now - self._probe_started >= self.open_seconds):
+                self._probe_started = now
+                return True
+            if self.state == CLOSED:
+                return True
+            self.rejected += 1
+        PORTAL_BREAKER_REJECTIONS.inc()
+        return False
+
+    def retry_in(self):
+        """Số giây tới khi mạch được thử lại (0 nếu không mở)"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def timeout(self, method, page, default):
+        """Timeout cho request tới trang này: percentile latency x hệ số, không vượt default"""
+        adaptive = self._adaptive_timeout(method, page)
+        if adaptive is None or self.state == HALF_OPEN:
+            return default
+        return min(default, adaptive)
+
+    def record_success(self, method, page, seconds):
+        self._observe(method, page, seconds)
+        if self.state == CLOSED and not self.failures:
+            return
+        with self._lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                log.info("Portal hoạt động lại, đóng circuit breaker")
+                self._transition(CLOSED)
+
+    def record_failure(self, method, page):
+        """Ghi một lần lỗi (lỗi kết nối, timeout, HTTP 5xx)"""
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+                log.warning("Portal lỗi %d lần liên tiếp (%s %s), mở circuit breaker %.0fs",
+                            self.failures, method, page, self.open_seconds)
+                self._opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    def retry_delay(self, method, page, attempt, deadline):
+        """Thời gian chờ trước lần thử lại thứ attempt (1, 2...), None nếu không thử lại: không
+        phải GET, hết số lần, mạch đã mở hoặc không còn đủ thời gian trước deadline (monotonic)"""
+        if method != 'GET' or attempt > self.retries or self.state != CLOSED:
+            return None
+        delay = self._random.uniform(0, min(self.backoff_max, self.backoff * 2 ** (attempt - 1)))
+        if time.monotonic() + delay + self.timeout_min > deadline:
+            return None
+        PORTAL_RETRIES.inc(page=page, method=method)
+        return delay
+
+    def stats(self):
+        with self._lock:
+            pages = sorted(self._latencies)
+        timeouts = {}
+        for method, page in pages:
+            timeout = self._adaptive_timeout(method, page)
+            if timeout is not None:
+                timeouts[f"{method} {page}"] = round(timeout, 2)
+        return {
+            "state": self.state,
+            "consecutiveFailures": self.failures,
+            "retryIn": round(self.retry_in(), 1),
+            "rejected": self.rejected,
+            "threshold": self.threshold,
+            "openSeconds": self.open_seconds,
+            "timeouts": timeouts,
+        }
+
+    def _adaptive_timeout(self, method, page):
+        """percentile latency x hệ số (tối thiểu timeout_min), None khi chưa đủ mẫu"""
+        samples = self._latencies.get((method, page))
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        value = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+        return max(self.timeout_min, value * self.multiplier)
+
+    def _observe(self, method, page, seconds):
+        samples = self._latencies.get((method, page))
+        if samples is None:
+            samples = self._latencies.setdefault((method, page), collections.deque(maxlen=self.window))
+        samples.append(seconds)
+
+    def _transition(self, state):
+        self.state = state
+        self._probe_started = None
+        PORTAL_BREAKER_TRANSITIONS.inc(state=state)
+
+
+portal_guard = PortalGuard()
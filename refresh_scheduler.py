@@ -0,0 +1,198 @@
+"""Làm nóng result cache ngay sau khi đăng nhập và làm mới ở nền trước khi hết TTL.
+
+Sau /login, điểm, lịch thi và TKB tuần hiện tại được lấy trước trong nền nên lần mở trang đầu
+tiên không phải chờ portal. Mỗi lần route đọc một kết quả qua result cache, key đó được ghi nhận
+kèm hàm lấy dữ liệu; một thread nền quét định kỳ và lấy lại các kết quả sắp hết hạn
+(REFRESH_AHEAD giây) của người dùng còn hoạt động trong REFRESH_ACTIVE_WINDOW giây gần đây.
+
+Mọi lần lấy nền chạy trên một ThreadPoolExecutor chung REFRESH_CONCURRENCY thread, là ngân sách
+request tới portal của cả worker. Lần lấy nền đi qua ResultCache.fetch_entry nên request của người
+dùng gặp đúng key đang được lấy thì dùng chung kết quả đó (SingleFlight) thay vì gọi portal lần nữa;
+kết quả stale được trả cho người dùng thì revalidate() gửi lấy lại ở nền. Thread được tạo lazily
+ở request đầu tiên nên không có thread nào trong gunicorn master (preload_app).
+
+Job giữ tham chiếu tới ICTUService của người dùng, nên phải đi theo service trong SessionPool: pool
+gọi forget_service() khi service bị loại (LRU, idle TTL, logout), job bị bỏ và lần lấy nền đang chờ
+của service đó cũng không chạy (không làm mới / relogin cho service đã bị đóng).
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from log_config import get_logger
+
+log = get_logger(__name__)
+
+REFRESH_ENABLED = os.environ.get('REFRESH_ENABLED', '1') == '1'
+REFRESH_CONCURRENCY = int(os.environ.get('REFRESH_CONCURRENCY', 4))
+REFRESH_INTERVAL = float(os.environ.get('REFRESH_INTERVAL', 30))
+REFRESH_AHEAD = float(os.environ.get('REFRESH_AHEAD', 120))
+REFRESH_ACTIVE_WINDOW = float(os.environ.get('REFRESH_ACTIVE_WINDOW', 900))
+
+
+class RefreshScheduler:
+    """Lấy trước / làm mới các kết quả của ResultCache trong nền với số thread giới hạn"""
+
+    def __init__(self, cache, concurrency=REFRESH_CONCURRENCY, interval=REFRESH_INTERVAL, ahead=REFRESH_AHEAD,
+                 active_window=REFRESH_ACTIVE_WINDOW, enabled=REFRESH_ENABLED):
+        self.cache = cache
+        self.concurrency = concurrency
+        self.interval = interval
+        self.ahead = ahead
+        self.active_window = active_window
+        self.enabled = enabled
+        self._jobs = {}  # key -> (service, fetch, lần đọc cuối theo monotonic)
+        self._in_flight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self._executor = None
+        self._thread = None
+        self.prefetched = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.deferred = 0
+
+    def touch(self, service, resource, params, fetch):
+        """Ghi nhận người dùng vừa đọc kết quả này (gọi từ route), để scheduler làm mới nó trước khi hết hạn"""
+        if not self.enabled:
+            return
+        key = self.cache.make_key(service.last_username, resource, params)
+        with self._lock:
+            self._jobs[key] = (service, fetch, time.monotonic())
+        self._ensure_started()
+
+    def prefetch(self, service, jobs):
+        """Lấy trước [(resource, params, fetch)] của người dùng vừa đăng nhập, bỏ qua kết quả đã có trong cache"""
+        if not self.enabled:
+            return 0
+        submitted = 0
+        for resource, params, fetch in jobs:
+            self.touch(service, resource, params, fetch)
+            key = self.cache.make_key(service.last_username, resource, params)
+            entry = self.cache.peek(key)
+            if entry is not None and entry.expires_at > time.time():
+                continue
+            if self._submit(key, service, fetch, refresh=False):
+                submitted += 1
+        return submitted
+
+    def revalidate(self, service, resource, params, fetch):
+        """Lấy lại ở nền kết quả stale vừa được trả cho người dùng (stale-while-revalidate)"""
+        self.touch(service, resource, params, fetch)
+        return self._submit(self.cache.make_key(service.last_username, resource, params), service, fetch,
+                            refresh=True)
+
+    def forget(self, user):
+        """Bỏ theo dõi mọi kết quả của user (khi logout)"""
+        with self._lock:
+            for key in [key for key in self._jobs if key[0] == user]:
+                del self._jobs[key]
+
+    def forget_service(self, service):
+        """Bỏ theo dõi mọi kết quả lấy qua service (SessionPool gọi khi service bị loại khỏi pool)"""
+        with self._lock:
+            for key in [key for key, job in self._jobs.items() if job[0] is service]:
+                del self._jobs[key]
+
+    def run_once(self):
+        """Một lượt quét: gửi làm mới các kết quả sắp hết hạn của người dùng còn hoạt động, kết quả
+        hết hạn sớm nhất trước. Trả về số lần làm mới đã gửi."""
+        now = time.monotonic()
+        deadline = time.time() + self.ahead
+        due = []
+        with self._lock:
+            for key, (service, fetch, last_access) in list(self._jobs.items()):
+                entry = self.cache.peek(key)
+                if key in self._in_flight:
+                    continue
+                # Người dùng đã rời đi, hoặc kết quả không còn trong cache (lỗi / bị loại): không lấy lại
+                if now - last_access > self.active_window or entry is None:
+                    del self._jobs[key]
+                elif entry.expires_at <= deadline:
+                    due.append((entry.expires_at, key, service, fetch))
+        due.sort(key=lambda item: item[0])
+        submitted = 0
+        for _, key, service, fetch in due:
+            if self._submit(key, service, fetch, refresh=True):
+                submitted += 1
+        return submitted
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "tracked": len(self._jobs),
+                "inFlight": len(self._in_flight),
+                "concurrency": self.concurrency,
+                "prefetched": self.prefetched,
+                "refreshed": self.refreshed,
+                "failed": self.failed,
+                "deferred": self.deferred,
+            }
+
+    def _submit(self, key, service, fetch, refresh):
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            # Hàng đợi tối đa gấp đôi số thread: phần còn lại để lượt quét sau
+            if len(self._in_flight) >= self.concurrency * 2:
+                self.deferred += 1
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='cache-refresh')
+            future = self._executor.submit(self._fetch, key, service, fetch, refresh)
+            self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._done(key))
+        return True
+
+    def _done(self, key):
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def _fetch(self, key, service, fetch, refresh):
+        user, resource, params = key
+        with self._lock:
+            job = self._jobs.get(key)
+            # Service đã bị loại khỏi pool (forget_service) hoặc job đã thuộc service khác
+            if job is None or job[0] is not service:
+                return
+            # Service đã logout / đổi tài khoản thì bỏ
+            if not service.is_logged_in or service.last_username != user:
+                del self._jobs[key]
+                return
+        previous = self.cache.peek(key)
+        try:
+            value, entry = self.cache.fetch_entry(user, resource, dict(params), fetch, refresh=refresh)
+        except Exception as e:
+            log.warning("Lấy nền %s của %s lỗi: %s", resource, user, e)
+            self._count('failed')
+            return
+        # Portal lỗi: fetch_entry trả lại entry cũ (stale-if-error) hoặc kết quả lỗi không được cache
+        if entry is None or entry is previous:
+            log.info("Lấy nền %s của %s không thành công, giữ kết quả cũ", resource, user)
+            self._count('failed')
+        else:
+            self._count('refreshed' if refresh else 'prefetched')
+
+    def _count(self, counter):
+        # Các thread của executor cùng tăng bộ đếm
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='cache-refresh-scheduler', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                submitted = self.run_once()
+                if submitted:
+                    log.debug("Refresh scheduler: %d kết quả được làm mới", submitted)
+            except Exception as e:
+                log.exception("Refresh scheduler lỗi: %s", e)
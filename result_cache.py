@@ -0,0 +1,377 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# TTL mặc định theo loại dữ liệu (giây): điểm và lịch thi chỉ đổi vài lần mỗi học kỳ
+DEFAULT_TTLS = {
+    'scores': int(os.environ.get('CACHE_TTL_SCORES', 6 * 3600)),
+    'exams': int(os.environ.get('CACHE_TTL_EXAMS', 3600)),
+    'timetable': int(os.environ.get('CACHE_TTL_TIMETABLE', 1800)),
+    'timetable_html': int(os.environ.get('CACHE_TTL_TIMETABLE', 1800)),
+    # Dùng chung cho mọi người dùng (SharedResult)
+    'timetable_options': int(os.environ.get('CACHE_TTL_TIMETABLE_OPTIONS', 3600)),
+}
+# Sau khi hết TTL, kết quả cũ vẫn được giữ thêm tối đa chừng này giây (0 = tắt) để trả ngay
+# (đánh dấu stale) trong lúc lấy lại ở nền, hoặc khi portal timeout/lỗi
+DEFAULT_MAX_STALE = {
+    'scores': int(os.environ.get('CACHE_MAX_STALE_SCORES', 7 * 24 * 3600)),
+    'exams': int(os.environ.get('CACHE_MAX_STALE_EXAMS', 24 * 3600)),
+    'timetable': int(os.environ.get('CACHE_MAX_STALE_TIMETABLE', 24 * 3600)),
+    'timetable_html': int(os.environ.get('CACHE_MAX_STALE_TIMETABLE', 24 * 3600)),
+}
+# Tuần đã qua gần như không đổi nữa nên được giữ lâu hơn
+PAST_WEEK_TTL = int(os.environ.get('CACHE_TTL_PAST_WEEK', 7 * 24 * 3600))
+MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# SharedResult giữ kết quả lỗi chừng này giây (0 = tắt) để không dồn request vào portal đang lỗi
+ERROR_TTL = int(os.environ.get('CACHE_ERROR_TTL', 10))
+
+
+class CacheEntry:
+    __slots__ = ('value', 'size', 'stored_at', 'expires_at', 'stale_until', 'etag')
+
+    def __init__(self, value, size, ttl, etag=None, max_stale=0):
+        self.value = value
+        self.size = size
+        self.stored_at = time.time()
+        self.expires_at = self.stored_at + ttl
+        # Hết TTL nhưng chưa quá stale_until: vẫn trả được (stale) khi cần
+        self.stale_until = self.expires_at + max_stale
+        # Hash nội dung kết quả, dùng làm ETag của response (tính một lần khi lưu)
+        self.etag = etag
+
+    @property
+    def age(self):
+        return time.time() - self.stored_at
+
+    @property
+    def stale(self):
+        return self.expires_at <= time.time()
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Gộp các lời gọi cùng key đang chạy đồng thời: lời gọi đầu tiên chạy fn(), các lời gọi đến
+    trong lúc đó chờ và nhận chung kết quả (hoặc chung exception) thay vì gọi lại"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Trả về (kết quả, True nếu là kết quả của một lời gọi khác đang chạy)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class ResultCache:
+    """Cache kết quả đã parse theo (user, loại dữ liệu, tham số), LRU giới hạn theo byte.
+
+    Cache miss đi qua SingleFlight theo cùng key: nhiều tab hay frontend gọi trùng thì chỉ một
+    lần probe + fetch + parse, các request còn lại dùng chung kết quả.
+    Có `shared` (SharedCache) thì kết quả được ghi thêm vào đó, và khi không có (hoặc chỉ còn bản
+    stale) trong bộ nhớ thì đọc bản worker khác đã lấy trước khi gọi portal.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES, ttls=None, past_week_ttl=PAST_WEEK_TTL, max_stale=None, shared=None):
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_stale = dict(DEFAULT_MAX_STALE, **(max_stale or {}))
+        self.past_week_ttl = past_week_ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+        self.stale_on_error = 0
+        self.shared_hits = 0
+        self.shared = shared
+        self._flights = SingleFlight()
+
+    @staticmethod
+    def make_key(user, resource, params):
+        return (user, resource, tuple(sorted((k, v) for k, v in params.items() if v is not None)))
+
+    def get(self, key, allow_stale=False):
+        """Entry còn hạn của key; allow_stale=True thì trả cả entry đã hết TTL nhưng chưa quá max stale"""
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.time()
+            if entry is not None and entry.stale_until <= now:
+                self._remove_locked(key)
+                entry = None
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                return entry
+        if self.shared is not None:
+            # Worker khác có thể đã lấy kết quả (mới hơn)
+            shared = self._get_shared(key, entry.stored_at if entry is not None else 0)
+            if shared is not None:
+                entry = shared
+        if entry is None or (entry.stale and not allow_stale):
+            return None
+        return entry
+
+    def _get_shared(self, key, newer_than):
+        row = self.shared.get(key, newer_than)
+        if row is None:
+            return None
+        data, etag, stored_at, expires_at, stale_until = row
+        entry = CacheEntry(json.loads(data), len(data), 0, etag)
+        entry.stored_at, entry.expires_at, entry.stale_until = stored_at, expires_at, stale_until
+        if entry.size <= self.max_bytes:
+            self._insert(key, entry)
+        self._count('shared_hits')
+        return entry
+
+    def peek(self, key):
+        """Entry của key (kể cả đã hết hạn) mà không đổi thứ tự LRU, cho refresh scheduler"""
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, value, ttl):
+        data = json.dumps(value, ensure_ascii=False, default=str).encode('utf-8')
+        size = len(data)
+        if size > self.max_bytes:
+            return None
+        entry = CacheEntry(value, size, ttl, hashlib.blake2b(data, digest_size=16).hexdigest(),
+                           self.max_stale.get(key[1], 0))
+        self._insert(key, entry)
+        if self.shared is not None:
+            self.shared.put(key, data, entry)
+        return entry
+
+    def _insert(self, key, entry):
+        with self._lock:
+            if key in self._entries:
+                self._remove_locked(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                self._remove_locked(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_fetch(self, user, resource, params, fetch, refresh=False):
+        """Trả về kết quả trong cache, nếu không có (hoặc refresh=True) thì gọi fetch() và lưu lại"""
+        return self.fetch_entry(user, resource, params, fetch, refresh)[0]
+
+    def fetch_entry(self, user, resource, params, fetch, refresh=False, revalidate=None):
+        """Như get_or_fetch nhưng trả về (kết quả, CacheEntry); entry là None nếu kết quả không được cache.
+
+        Stale-while-revalidate: kết quả đã hết TTL nhưng chưa quá max stale được trả ngay (entry.stale)
+        và revalidate() được gọi để lấy lại ở nền; không có revalidate thì gọi fetch() như cache miss.
+        Stale-if-error: fetch() trả về lỗi mà còn kết quả cũ thì trả kết quả cũ.
+        """
+        key = self.make_key(user, resource, params)
+        entry = self.get(key, allow_stale=True)
+        if not refresh and entry is not None:
+            if not entry.stale:
+                self._count('hits')
+                return entry.value, entry
+            if revalidate is not None:
+                self._count('stale_hits')
+                revalidate()
+                return entry.value, entry
+        return self._flights.do(key, lambda: self._fetch_and_store(key, resource, fetch, entry))[0]
+
+    def _fetch_and_store(self, key, resource, fetch, stale_entry):
+        self._count('misses')
+        value = fetch()
+        # Chỉ cache kết quả thành công trọn vẹn (TKB nhiều tuần có tuần lỗi thì không cache)
+        if isinstance(value, dict) and not value.get('error') and not value.get('failedWeeks'):
+            return value, self.put(key, value, self.ttl_for(resource, value))
+        if stale_entry is not None and isinstance(value, dict) and value.get('error'):
+            self._count('stale_on_error')
+            return stale_entry.value, stale_entry
+        return value, None
+
+    def ttl_for(self, resource, value):
+        if resource == 'timetable' and self._is_past_week(value):
+            return self.past_week_ttl
+        return self.ttls.get(resource, 600)
+
+    @staticmethod
+    def _is_past_week(value):
+        """Tất cả buổi học trong kết quả đều đã qua (dựa vào to_date dd/mm/yyyy)"""
+        dates = []
+        for row in value.get('timetableData', []):
+            try:
+                dates.append(datetime.strptime(row.get('to_date', ''), '%d/%m/%Y').date())
+            except ValueError:
+                return False
+        return bool(dates) and max(dates) < datetime.now().date()
+
+    def invalidate_user(self, user):
+        """Xóa toàn bộ kết quả của một user (khi logout)"""
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == user]
+            for key in keys:
+                self._remove_locked(key)
+        if self.shared is not None:
+            self.shared.delete_user(user)
+        return len(keys)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "staleHits": self.stale_hits,
+                "staleOnError": self.stale_on_error,
+                # Trong số hits/staleHits, số lần lấy từ cache dùng chung giữa các worker
+                "sharedHits": self.shared_hits,
+                "coalesced": self._flights.coalesced,
+                "inFlight": self._flights.in_flight(),
+            }
+
+    def _count(self, counter):
+        # Các thread phục vụ request cùng tăng bộ đếm
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _remove_locked(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+
+def _is_session_error(value):
+    return isinstance(value, dict) and value.get('error') and value.get('status') == 401
+
+
+class SharedResult:
+    """Một kết quả dùng chung cho mọi người dùng của worker (ví dụ danh sách học kỳ/năm học/tuần).
+
+    Hết TTL thì chỉ một thread gọi fetch() (SingleFlight), các request đến cùng lúc chờ và dùng
+    luôn kết quả đó (hoặc cùng exception), nên số lần gọi portal tối đa một lần mỗi TTL dù có bao
+    nhiêu người dùng. Kết quả lỗi (trừ lỗi phiên 401, chỉ là của người gọi) được giữ error_ttl giây để các request ngay sau đó không gọi lại
+    portal đang lỗi. Có `shared` (SharedCache) thì các worker dùng chung kết quả thành công theo `key`.
+    """
+
+    def __init__(self, ttl, shared=None, key=None, error_ttl=ERROR_TTL):
+        self.ttl = ttl
+        self.shared = shared
+        self.key = key
+        self.error_ttl = error_ttl
+        self._entry = None
+        self._error = None
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.error_hits = 0
+        self.fetches = 0
+        self.coalesced = 0
+
+    def get_or_fetch(self, fetch, refresh=False):
+        if not refresh:
+            value = self._cached()
+            if value is not None:
+                return value
+        # Key theo refresh: request refresh chỉ gộp với các request refresh khác, không nhận kết quả
+        # của lượt fetch thường đã bắt đầu trước nó
+        value, coalesced = self._flights.do(refresh, lambda: self._fetch(fetch, refresh))
+        if coalesced:
+            self._count('coalesced')
+            if _is_session_error(value):
+                # Phiên portal hết hạn là của người gọi fetch() kia, không phải của request này
+                value = self._flights.do(refresh, lambda: self._fetch(fetch, refresh))[0]
+        return value
+
+    def _cached(self):
+        """Kết quả còn hạn (hoặc kết quả lỗi còn trong error_ttl), None nếu phải gọi fetch()"""
+        now = time.time()
+        entry = self._entry
+        if entry is not None and entry.expires_at > now:
+            self._count('hits')
+            return entry.value
+        error = self._error
+        if error is not None and error.expires_at > now:
+            self._count('error_hits')
+            return error.value
+        return None
+
+    def _fetch(self, fetch, refresh):
+        if not refresh:
+            # Lượt fetch trước vừa xong ngay trước khi request này vào SingleFlight
+            value = self._cached()
+            if value is not None:
+                return value
+            if self.shared is not None:
+                row = self.shared.get(self.key)
+                if row is not None and row[3] > time.time():
+                    data, etag, stored_at, expires_at = row[:4]
+                    entry = CacheEntry(json.loads(data), len(data), 0, etag)
+                    entry.stored_at, entry.expires_at, entry.stale_until = stored_at, expires_at, expires_at
+                    self._entry = entry
+                    self._count('hits')
+                    return entry.value
+        self._count('fetches')
+        value = fetch()
+        if isinstance(value, dict) and not value.get('error'):
+            self._entry = CacheEntry(value, 0, self.ttl)
+            self._error = None
+            if self.shared is not None:
+                self.shared.put(self.key, json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'),
+                                self._entry)
+        elif self.error_ttl > 0 and not _is_session_error(value):
+            self._error = CacheEntry(value, 0, self.error_ttl)
+        return value
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        entry = self._entry
+        return {
+            "cached": entry is not None and entry.expires_at > time.time(),
+            "age": round(entry.age, 1) if entry is not None else None,
+            "hits": self.hits,
+            "errorHits": self.error_hits,
+            "fetches": self.fetches,
+            "coalesced": self.coalesced,
+            "inFlight": self._flights.in_flight(),
+        }
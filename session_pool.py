@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+
+from log_config import get_logger
+
+log = get_logger(__name__)
+
+
+class SessionPool:
+    """Giữ một ICTUService cho mỗi người dùng (key = session id của Flask).
+
+    - Idle TTL: service không được dùng quá `idle_ttl` giây sẽ bị loại. Việc dọn chạy trong get()
+      (khi tạo service mới và ít nhất mỗi `sweep_interval` giây), không cần thread riêng.
+    - LRU: khi vượt `max_sessions`, service ít dùng gần đây nhất bị loại.
+    - on_remove(service) được gọi với mọi service bị loại (LRU, idle TTL, discard) trước khi đóng,
+      để những nơi còn giữ service (RefreshScheduler) bỏ nó.
+    """
+
+    def __init__(self, factory, max_sessions=500, idle_ttl=1800, sweep_interval=60, on_remove=None):
+        self.factory = factory
+        self.on_remove = on_remove
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+        self._entries = OrderedDict()  # sid -> [service, last_access]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, sid, create=True):
+        """Lấy service của sid, tạo mới nếu chưa có (khi create=True)"""
+        if not sid:
+            return None
+        expired = []
+        with self._lock:
+            service = self._get_locked(sid, time.monotonic(), expired)
+            if service is None and create:
+                self.misses += 1
+        if service is None and create:
+            # factory() (mở session HTTP, khôi phục phiên đã lưu...) chạy ngoài lock để không chặn
+            # request của người dùng khác; hai request cùng sid thì chỉ giữ service tạo trước
+            created = self.factory()
+            with self._lock:
+                now = time.monotonic()
+                service = self._get_locked(sid, now, expired)
+                if service is None:
+                    service = created
+                    self._entries[sid] = [service, now]
+                    expired.extend(self._evict_locked(now))
+                else:
+                    expired.append(created)
+        self._close(expired)
+        return service
+
+    def _get_locked(self, sid, now, expired):
+        """Service còn hạn của sid (đánh dấu vừa dùng), None nếu không có; service hết hạn và
+        kết quả dọn định kỳ được thêm vào expired"""
+        entry = self._entries.get(sid)
+        if entry and now - entry[1] > self.idle_ttl:
+            expired.append(self._entries.pop(sid)[0])
+            self.expirations += 1
+            entry = None
+        if entry:
+            self.hits += 1
+            entry[1] = now
+            self._entries.move_to_end(sid)
+        if now - self._last_sweep >= self.sweep_interval:
+            expired.extend(self._evict_locked(now))
+        return entry[0] if entry else None
+
+    def discard(self, sid):
+        """Loại bỏ service của sid (khi logout)"""
+        with self._lock:
+            entry = self._entries.pop(sid, None)
+        if entry:
+            self._close([entry[0]])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "liveSessions": len(self._entries),
+                "maxSessions": self.max_sessions,
+                "idleTtl": self.idle_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _evict_locked(self, now):
+        self._last_sweep = now
+        removed = []
+        # OrderedDict giữ thứ tự LRU: phần tử đầu là ít dùng gần đây nhất
+        while self._entries:
+            sid, (service, last_access) = next(iter(self._entries.items()))
+            if now - last_access > self.idle_ttl:
+                self.expirations += 1
+            elif len(self._entries) > self.max_sessions:
+                self.evictions += 1
+            else:
+                break
+            del self._entries[sid]
+            removed.append(service)
+        return removed
+
+    def _close(self, services):
+        for service in services:
+            try:
+                if self.on_remove is not None:
+                    self.on_remove(service)
+                service.close()
+            except Exception as e:
+                log.error("Đóng service bị loại khỏi pool thất bại: %s", e)
@@ -0,0 +1,154 @@
+"""Lưu phiên portal của từng người dùng (cookie, profile) vào SQLite, mã hóa bằng Fernet.
+
+Bản lưu file cũ dùng chung một file cho mọi người nên bị lẫn người dùng và đã bị tắt; mỗi lần
+deploy hay gunicorn recycle worker, mọi sinh viên phải đi lại toàn bộ luồng login nhiều request.
+Store này giữ một bản ghi cho mỗi phiên Flask (sid, không đoán được) kèm username. Mật khẩu không
+được lưu: cookie portal hết hạn thì người dùng đăng nhập lại qua /login. Mọi worker trên cùng máy
+dùng chung file (WAL), nên request rơi vào worker chưa có service của người dùng cũng khôi phục được.
+
+Nội dung được mã hóa bằng khóa lấy từ biến môi trường (không ghi ra đĩa), nên file DB bị lộ cùng
+thư mục data/ cũng không đọc được cookie.
+
+Cấu hình:
+  SESSION_STORE_PATH     file SQLite (mặc định data/sessions.sqlite3), rỗng = tắt store
+  SESSION_STORE_KEY      khóa Fernet (Fernet.generate_key()), bắt buộc; không đặt thì store tắt
+  SESSION_STORE_MAX_AGE  bản ghi không được cập nhật quá chừng này giây thì bị bỏ (mặc định 7 ngày)
+Cần thư viện cryptography; không có thì store tự tắt và app chạy như trước.
+"""
+import json
+import os
+import threading
+import time
+
+from local_db import LocalDB
+from log_config import get_logger
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:  # cryptography là tùy chọn
+    Fernet = InvalidToken = None
+
+log = get_logger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STORE_PATH = os.environ.get('SESSION_STORE_PATH', os.path.join(ROOT, 'data', 'sessions.sqlite3'))
+STORE_KEY = os.environ.get('SESSION_STORE_KEY')
+MAX_AGE = int(os.environ.get('SESSION_STORE_MAX_AGE', 7 * 24 * 3600))
+# Dọn bản ghi quá hạn sau mỗi chừng này lần lưu
+PRUNE_EVERY = 200
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS portal_sessions (
+    sid TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    data BLOB NOT NULL,
+    updated_at REAL NOT NULL
+);
+'''
+
+
+class SessionStore:
+    def __init__(self, path=STORE_PATH, key=STORE_KEY, max_age=MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.enabled = bool(path and key) and Fernet is not None
+        # Lý do store bị tắt dù có SESSION_STORE_PATH, app ghi warning lúc khởi động
+        self.disabled_reason = None
+        if path and Fernet is None:
+            self.disabled_reason = "chưa cài cryptography"
+        elif path and not key:
+            self.disabled_reason = "chưa đặt SESSION_STORE_KEY"
+        self._key = key
+        self._fernet = None
+        self._db = LocalDB(path, SCHEMA)
+        self._init_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.saved = 0
+        self.restored = 0
+        self.misses = 0
+        self.errors = 0
+
+    def save(self, sid, username, data):
+        """Lưu (ghi đè) phiên của sid: data là dict cookie / profile"""
+        if not self.enabled or not sid:
+            return False
+        try:
+            token = self._cipher().encrypt(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+            with self._db.connection() as conn:
+                conn.execute('INSERT OR REPLACE INTO portal_sessions (sid, username, data, updated_at) '
+                             'VALUES (?, ?, ?, ?)', (sid, username, token, time.time()))
+            with self._lock:
+                self.saved += 1
+                prune = self.saved % PRUNE_EVERY == 0
+            if prune:
+                self.prune()
+            return True
+        except Exception as e:
+            self._count('errors')
+            log.warning("Không lưu được phiên của %s: %s", username, e)
+            return False
+
+    def load(self, sid):
+        """Phiên đã lưu của sid: (username, data), None nếu không có, quá hạn hoặc không giải mã được"""
+        if not self.enabled or not sid:
+            return None
+        try:
+            row = self._db.connection().execute(
+                'SELECT username, data, updated_at FROM portal_sessions WHERE sid = ?', (sid,)).fetchone()
+            if row is None or time.time() - row[2] > self.max_age:
+                self._count('misses')
+                return None
+            data = json.loads(self._cipher().decrypt(row[1]))
+        except InvalidToken:
+            # Khóa đã đổi: bản ghi cũ không dùng được nữa
+            self._count('misses')
+            self.delete(sid)
+            return None
+        except Exception as e:
+            self._count('errors')
+            log.warning("Không đọc được phiên đã lưu: %s", e)
+            return None
+        self._count('restored')
+        return row[0], data
+
+    def delete(self, sid):
+        if not self.enabled or not sid:
+            return
+        try:
+            with self._db.connection() as conn:
+                conn.execute('DELETE FROM portal_sessions WHERE sid = ?', (sid,))
+        except Exception as e:
+            self._count('errors')
+            log.warning("Không xóa được phiên đã lưu: %s", e)
+
+    def prune(self):
+        """Xóa các bản ghi quá SESSION_STORE_MAX_AGE"""
+        with self._db.connection() as conn:
+            removed = conn.execute('DELETE FROM portal_sessions WHERE updated_at < ?',
+                                   (time.time() - self.max_age,)).rowcount
+        if removed:
+            log.info("Session store: xóa %d phiên quá hạn", removed)
+        return removed
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "saved": self.saved,
+            "restored": self.restored,
+            "misses": self.misses,
+            "errors": self.errors,
+        }
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _cipher(self):
+        if self._fernet is None:
+            with self._init_lock:
+                if self._fernet is None:
+                    self._fernet = Fernet(self._key)
+        return self._fernet
+
+
+session_store = SessionStore()
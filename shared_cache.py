@@ -0,0 +1,150 @@
+"""Tầng cache thứ hai dùng chung cho mọi worker gunicorn trên cùng máy (SQLite WAL).
+
+Mỗi worker có ResultCache / SharedResult riêng trong bộ nhớ, nên khi load balancer đưa người
+dùng sang worker khác thì kết quả vừa lấy ở worker kia bị bỏ phí và portal bị gọi lại. Kết quả
+đã parse được ghi thêm vào file này (JSON nén zlib, đúng chuỗi JSON ResultCache đã tạo để tính
+kích thước và ETag nên không phải serialize lần nữa) cùng TTL / max stale / ETag; worker miss
+trong bộ nhớ đọc ở đây trước khi gọi portal, nên ETag và tuổi kết quả giống nhau giữa các worker.
+
+Cấu hình:
+  SHARED_CACHE_PATH       file SQLite (mặc định data/cache.sqlite3), rỗng = tắt
+  SHARED_CACHE_MAX_BYTES  tổng kích thước (đã nén) tối đa, vượt thì bỏ các kết quả cũ nhất
+Kết quả quá max stale bị bỏ qua khi đọc và bị xóa sau mỗi PRUNE_EVERY lần ghi. Lỗi SQLite (khóa quá
+lâu, đĩa đầy...) chỉ được ghi log và đếm, request vẫn chạy như không có tầng này.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from local_db import LocalDB
+from log_config import get_logger
+
+log = get_logger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SHARED_CACHE_PATH = os.environ.get('SHARED_CACHE_PATH', os.path.join(ROOT, 'data', 'cache.sqlite3'))
+SHARED_CACHE_MAX_BYTES = int(os.environ.get('SHARED_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+# zlib mức 1: JSON kết quả nén còn ~1/5 mà tốn rất ít CPU
+COMPRESS_LEVEL = 1
+PRUNE_EVERY = 500
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    user TEXT NOT NULL,
+    data BLOB NOT NULL,
+    etag TEXT,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    stale_until REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_user ON results (user);
+CREATE INDEX IF NOT EXISTS results_stale_until ON results (stale_until);
+'''
+
+
+class SharedCache:
+    def __init__(self, path=SHARED_CACHE_PATH, max_bytes=SHARED_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = bool(path)
+        self._db = LocalDB(path, SCHEMA)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+
+    @staticmethod
+    def make_key(key):
+        """Key của ResultCache (user, loại dữ liệu, tham số) dạng chuỗi"""
+        return json.dumps(key, ensure_ascii=False, separators=(',', ':'))
+
+    def get(self, key, newer_than=0):
+        """(JSON bytes, etag, stored_at, expires_at, stale_until) của key nếu được lưu sau newer_than,
+        None nếu không có, quá max stale hoặc không mới hơn bản worker đang giữ"""
+        if not self.enabled:
+            return None
+        try:
+            row = self._db.connection().execute(
+                'SELECT data, etag, stored_at, expires_at, stale_until FROM results WHERE key = ? AND stored_at > ?',
+                (self.make_key(key), newer_than)).fetchone()
+            if row is None or row[4] <= time.time():
+                self._count('misses')
+                return None
+            data = zlib.decompress(row[0])
+        except (sqlite3.Error, zlib.error) as e:
+            self._error('đọc', e)
+            return None
+        self._count('hits')
+        return (data,) + tuple(row[1:])
+
+    def put(self, key, data, entry):
+        """Lưu JSON bytes của kết quả cùng etag / thời hạn của CacheEntry"""
+        if not self.enabled:
+            return
+        try:
+            with self._db.connection() as conn:
+                conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (self.make_key(key), key[0], zlib.compress(data, COMPRESS_LEVEL), entry.etag,
+                              entry.stored_at, entry.expires_at, entry.stale_until))
+        except sqlite3.Error as e:
+            self._error('ghi', e)
+            return
+        with self._lock:
+            self.writes += 1
+            prune = self.writes % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def delete_user(self, user):
+        if not self.enabled:
+            return
+        try:
+            with self._db.connection() as conn:
+                conn.execute('DELETE FROM results WHERE user = ?', (user,))
+        except sqlite3.Error as e:
+            self._error('xóa', e)
+
+    def prune(self):
+        """Xóa kết quả quá max stale, rồi bỏ các kết quả cũ nhất nếu vẫn vượt max_bytes"""
+        try:
+            with self._db.connection() as conn:
+                removed = conn.execute('DELETE FROM results WHERE stale_until <= ?', (time.time(),)).rowcount
+                total = conn.execute('SELECT COALESCE(SUM(LENGTH(data)), 0) FROM results').fetchone()[0]
+                while total > self.max_bytes:
+                    rows = conn.execute('SELECT key, LENGTH(data) FROM results ORDER BY stored_at LIMIT 100').fetchall()
+                    if not rows:
+                        break
+                    conn.executemany('DELETE FROM results WHERE key = ?', [(row[0],) for row in rows])
+                    total -= sum(row[1] for row in rows)
+                    removed += len(rows)
+        except sqlite3.Error as e:
+            self._error('dọn', e)
+            return 0
+        if removed:
+            log.debug("Shared cache: xóa %d kết quả", removed)
+        return removed
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "errors": self.errors,
+        }
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _error(self, action, error):
+        self._count('errors')
+        log.warning("Shared cache: lỗi khi %s: %s", action, error)
+
+
+shared_cache = SharedCache()
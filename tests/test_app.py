@@ -0,0 +1,120 @@
+"""Các route /api/* với một ICTUService giả (không gọi portal)."""
+import os
+
+os.environ['SHARED_CACHE_PATH'] = ''
+os.environ['SESSION_STORE_PATH'] = ''
+
+import pytest  # noqa: E402
+
+import app as app_module  # noqa: E402
+from app import _parse_weeks  # noqa: E402
+from result_cache import ResultCache  # noqa: E402
+
+
+class FakeService:
+    """Service đã đăng nhập, trả dữ liệu cố định và đếm số lần bị gọi"""
+
+    def __init__(self):
+        self.is_logged_in = True
+        self.last_username = 'sv001'
+        self.store_id = 'sid-1'
+        self.calls = []
+
+    def get_student_timetable_excel(self, **params):
+        self.calls.append(('timetable', params))
+        return {'error': False, 'timetableData': [{'subject': 'Toán', 'room': 'A1'}], 'totalRows': 1}
+
+    def get_student_timetable_weeks(self, semester, academic_year, weeks):
+        self.calls.append(('weeks', weeks))
+        return {'error': False, 'timetableData': [], 'totalRows': 0, 'weeks': weeks, 'failedWeeks': []}
+
+    def get_exam_schedule(self):
+        self.calls.append(('exams', {}))
+        return {'error': False, 'lichthiData': [{'maHP': 'TIN101', 'phongThi': 'C2'}]}
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = FakeService()
+    monkeypatch.setattr(app_module.session_pool, 'factory', lambda: service)
+    monkeypatch.setattr(app_module.refresher, 'enabled', False)
+    monkeypatch.setattr(app_module, 'result_cache', ResultCache())
+    yield service
+    app_module.session_pool.discard('sid-1')
+
+
+@pytest.fixture
+def client(service):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+        session['sid'] = 'sid-1'
+    return client
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, None),
+    ('', None),
+    ('7', None),
+    ('all', 'all'),
+    (' ALL ', 'all'),
+    ('3-5', ['3', '4', '5']),
+    ('1-3,7', ['1', '2', '3', '7']),
+    ('5,3,5', ['5', '3']),
+    ('2, 4 ,', ['2', '4']),
+    ('60', None),
+    ('1-60', [str(week) for week in range(1, 61)]),
+])
+def test_parse_weeks(value, expected):
+    assert _parse_weeks(value) == expected
+
+
+@pytest.mark.parametrize('value', ['0-3', '5-61', '8-3', '61,1', 'a-b', '3-', '1,x', ',', '-'])
+def test_parse_weeks_rejects(value):
+    with pytest.raises(ValueError):
+        _parse_weeks(value)
+
+
+def test_timetable_rejects_bad_weeks(client, service):
+    response = client.get('/api/timetable?week=1-99')
+    assert response.status_code == 400
+    assert response.get_json()['error'] is True
+    assert service.calls == []
+
+
+def test_timetable_week_range(client, service):
+    response = client.get('/api/timetable?week=2-3')
+    assert response.status_code == 200
+    assert response.get_json()['weeks'] == ['2', '3']
+    assert service.calls == [('weeks', ['2', '3'])]
+
+
+def test_if_none_match_returns_304(client, service):
+    first = client.get('/api/timetable')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag.startswith('W/')
+    second = client.get('/api/timetable', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == etag
+    # Lần thứ hai lấy từ result cache, không gọi lại portal
+    assert len(service.calls) == 1
+
+
+def test_if_none_match_mismatch_returns_body(client, service):
+    client.get('/api/lichthi')
+    response = client.get('/api/lichthi', headers={'If-None-Match': 'W/"other"'})
+    assert response.status_code == 200
+    assert response.get_json()['lichthiData'][0]['maHP'] == 'TIN101'
+
+
+def test_compact_has_its_own_etag(client, service):
+    etag = client.get('/api/timetable').headers['ETag']
+    compact = client.get('/api/timetable?format=compact', headers={'If-None-Match': etag})
+    assert compact.status_code == 200
+    assert compact.headers['ETag'] != etag
+    again = client.get('/api/timetable?format=compact', headers={'If-None-Match': compact.headers['ETag']})
+    assert again.status_code == 304
@@ -0,0 +1,111 @@
+"""extract_table phải dựng cây giống BeautifulSoup(html, 'html.parser') trên cùng bảng, kể cả với
+markup lỗi mà portal có thể trả về: thẻ không đóng, bảng lồng nhau, thẻ đóng lạc, comment, script,
+entity/charref."""
+import os
+
+import pytest
+from bs4 import BeautifulSoup, Tag
+
+from html_tables import STRING_CONTAINERS, extract_table, page_title
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fixtures')
+
+PAGES = {
+    'unclosed_td_tr': '<html><body><table id="t"><tr><td>1<td>Toán<tr><td>2<td>Lý</table><p>sau</p>',
+    'unclosed_table': '<div><table id="t"><tr><td>1</td><td>hết trang',
+    'nested_table': ('<table id="t"><tr><td>ngoài<table id="inner"><tr><td>trong</td></tr></table>'
+                     '</td><td>2</td></tr></table><table><tr><td>bảng khác</td></tr></table>'),
+    'nested_same_id': '<table id="t"><tr><td><table id="t"><tr><td>a</td></tr></table>b</td></tr></table>',
+    'stray_end_tags': '<table id="t"><tr><td>1</span></b></td></p><td>2</td></tr></tbody></table>',
+    'stray_end_closes_outer': '<div><span><table id="t"><tr><td>1</span><td>2</td></tr></table></span></div>',
+    'comments': ('<!-- <table id="t"><tr><td>trong comment</td></tr></table> -->'
+                 '<table id="t"><tr><td>1<!-- ẩn --></td><td><!-->2</td></tr></table>'),
+    'script': ('<script>var s = \'<table id="t"><tr><td>giả</td></tr></table>\';</script>'
+               '<table id="t"><tr><td>1<script>if (a < b) { x = "</td>"; }</script></td>'
+               '<td><style>td { color: red }</style>2</td></tr></table>'),
+    'entities': ('<table id="t"><tr><td>A &amp; B&nbsp;C</td><td>&lt;3 &copy &#39;x&#x27; &bogus;</td>'
+                 '<td title="a &amp; b">&#8364;&#128;</td></tr></table>'),
+    'bad_charrefs': '<table id="t"><tr><td>&#xZZ; &#1a; &#;</td><td>2</td></tr></table>',
+    'void_and_self_closing': '<table id="t"><tr><td>a<br>b<br/>c<img src=x></td><td/><td>d</td></tr></table>',
+    'whitespace': '<table id="t">\n  <tr>\n    <td>  1  </td>\n    <td>\n</td>\n  </tr>\n</table>',
+    'unquoted_and_upper': "<TABLE ID=t><TR><TD CLASS='x'>1</TD><td data-x=a.b>2</td></TR></TABLE>",
+    'cdata_and_pi': '<table id="t"><tr><td><![CDATA[x < y]]>1<?php echo 1 ?></td></tr></table>',
+}
+
+
+def _tree(node):
+    """(tên, thuộc tính, text, text strip) của mọi thẻ con cháu theo thứ tự tài liệu. Text của chính
+    thẻ script/style... không được giữ (các hàm _parse_* không đọc) nên không so."""
+    if isinstance(node, Tag):
+        tags = [node] + node.find_all(True)
+        return [(tag.name, {key: ' '.join(value) if isinstance(value, list) else value
+                            for key, value in tag.attrs.items()},
+                 *_texts(tag)) for tag in tags]
+    elements = [node] + list(node.iter_descendants())
+    return [(element.name, element.attrs, *_texts(element)) for element in elements]
+
+
+def _texts(node):
+    if node.name in STRING_CONTAINERS:
+        return None, None
+    return node.get_text(), node.get_text(strip=True)
+
+
+def _soup_table(html_text, table_id):
+    return BeautifulSoup(html_text, 'html.parser').find('table', id=table_id)
+
+
+@pytest.mark.parametrize('name', sorted(PAGES))
+def test_matches_beautifulsoup(name):
+    html_text = PAGES[name]
+    table = extract_table(html_text, 't')
+    assert table is not None
+    assert _tree(table) == _tree(_soup_table(html_text, 't'))
+
+
+@pytest.mark.parametrize('page, table_id', [
+    ('StudentMark.html', 'tblStudentMark'),
+    ('StudentMark.html', 'tblSumMark'),
+    ('StudentTimeTable.html', 'grdStudentTimeTable'),
+    ('StudentViewExamList.html', 'tblCourseList'),
+])
+def test_portal_fixtures(page, table_id):
+    with open(os.path.join(FIXTURES, page), encoding='utf-8') as f:
+        html_text = f.read()
+    assert _tree(extract_table(html_text, table_id)) == _tree(_soup_table(html_text, table_id))
+
+
+def test_unclosed_cells():
+    rows = extract_table(PAGES['unclosed_td_tr'], 't').find_all('tr')
+    assert [row.get_text() for row in rows] == ['1Toán2Lý', '2Lý']
+    assert 'sau' not in extract_table(PAGES['unclosed_td_tr'], 't').get_text()
+
+
+def test_nested_table():
+    table = extract_table(PAGES['nested_table'], 't')
+    assert [td.get_text() for td in table.find_all('td')] == ['ngoàitrong', 'trong', '2']
+    assert 'bảng khác' not in table.get_text()
+
+
+def test_comment_and_script_text_skipped():
+    text = extract_table(PAGES['comments'], 't').get_text()
+    assert 'ẩn' not in text and 'trong comment' not in text
+    assert extract_table(PAGES['script'], 't').get_text() == '12'
+
+
+def test_entities():
+    cells = [td.get_text() for td in extract_table(PAGES['entities'], 't').find_all('td')]
+    assert cells[0] == 'A & B\xa0C'
+    assert cells[1].startswith("<3 © 'x'")
+    assert cells[2] == '€€'
+    assert extract_table(PAGES['entities'], 't').find_all('td')[2].get('title') == 'a & b'
+
+
+def test_missing_table():
+    assert extract_table('<table id="khac"><tr><td>1</td></tr></table>', 't') is None
+    assert extract_table(PAGES['comments'].split('-->')[0] + '-->', 't') is None
+
+
+def test_page_title():
+    assert page_title('<html><head><TITLE>Lịch thi &amp; điểm</TITLE></head></html>') == 'Lịch thi & điểm'
+    assert page_title('<html></html>') is None
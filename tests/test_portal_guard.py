@@ -0,0 +1,168 @@
+"""PortalGuard: circuit breaker closed -> open -> half-open -> closed, retry chỉ với GET."""
+import pytest
+import requests
+
+import ictu_service
+import portal_guard as portal_guard_module
+from portal_guard import CLOSED, HALF_OPEN, OPEN, PortalGuard
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(portal_guard_module.time, 'monotonic', clock)
+    return clock
+
+
+def test_breaker_opens_after_threshold(clock):
+    guard = PortalGuard(threshold=3, open_seconds=10)
+    for _ in range(2):
+        guard.record_failure('GET', 'StudentMark')
+    assert guard.state == CLOSED and guard.allow()
+    guard.record_failure('GET', 'StudentMark')
+    assert guard.state == OPEN
+    assert not guard.allow()
+    assert guard.rejected == 1
+    assert guard.retry_in() == 10
+
+
+def test_success_resets_consecutive_failures(clock):
+    guard = PortalGuard(threshold=3, open_seconds=10)
+    guard.record_failure('GET', 'StudentMark')
+    guard.record_failure('GET', 'StudentMark')
+    guard.record_success('GET', 'StudentMark', 0.1)
+    guard.record_failure('GET', 'StudentMark')
+    assert guard.state == CLOSED and guard.failures == 1
+
+
+def test_half_open_probe_closes_on_success(clock):
+    guard = PortalGuard(threshold=1, open_seconds=10)
+    guard.record_failure('GET', 'StudentMark')
+    clock.now += 9
+    assert not guard.allow()
+    clock.now += 1
+    # Hết thời gian mở: đúng một request được đi qua làm probe
+    assert guard.allow()
+    assert guard.state == HALF_OPEN
+    assert not guard.allow()
+    guard.record_success('GET', 'StudentMark', 0.1)
+    assert guard.state == CLOSED and guard.failures == 0
+    assert guard.allow() and guard.allow()
+
+
+def test_half_open_probe_failure_reopens(clock):
+    guard = PortalGuard(threshold=5, open_seconds=10)
+    for _ in range(5):
+        guard.record_failure('GET', 'StudentMark')
+    clock.now += 10
+    assert guard.allow()
+    # Một lỗi khi half-open là đủ để mở lại, không chờ đủ threshold
+    guard.record_failure('GET', 'StudentMark')
+    assert guard.state == OPEN and not guard.allow()
+    assert guard.retry_in() == 10
+
+
+def test_half_open_allows_new_probe_when_probe_never_reports(clock):
+    guard = PortalGuard(threshold=1, open_seconds=10)
+    guard.record_failure('GET', 'StudentMark')
+    clock.now += 10
+    assert guard.allow()
+    clock.now += 5
+    assert not guard.allow()
+    clock.now += 5
+    assert guard.allow()
+
+
+def test_half_open_uses_default_timeout(clock):
+    guard = PortalGuard(threshold=1, open_seconds=10, min_samples=1, multiplier=3, timeout_min=0.5)
+    guard.record_success('GET', 'StudentMark', 1.0)
+    assert guard.timeout('GET', 'StudentMark', 30) == 3.0
+    guard.record_failure('GET', 'StudentMark')
+    clock.now += 10
+    guard.allow()
+    assert guard.timeout('GET', 'StudentMark', 30) == 30
+
+
+def test_retry_delay_only_for_get(clock):
+    guard = PortalGuard(retries=2, backoff=0.2, backoff_max=2.0, timeout_min=1.0)
+    deadline = clock.now + 30
+    assert 0 <= guard.retry_delay('GET', 'StudentMark', 1, deadline) <= 0.2
+    assert 0 <= guard.retry_delay('GET', 'StudentMark', 2, deadline) <= 0.4
+    assert guard.retry_delay('GET', 'StudentMark', 3, deadline) is None
+    assert guard.retry_delay('POST', 'StudentMark', 1, deadline) is None
+    # Không còn đủ thời gian cho một lần thử nữa trước deadline
+    assert guard.retry_delay('GET', 'StudentMark', 1, clock.now + 0.5) is None
+
+
+def test_no_retry_while_open(clock):
+    guard = PortalGuard(threshold=1)
+    guard.record_failure('GET', 'StudentMark')
+    assert guard.retry_delay('GET', 'StudentMark', 1, clock.now + 30) is None
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeSession:
+    """requests.Session giả: trả lần lượt các status (hoặc raise exception) và ghi lại method"""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.methods = []
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.methods.append(method)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(ictu_service, 'portal_guard', PortalGuard(threshold=10, retries=2, backoff=0))
+    service = ictu_service.ICTUService()
+    yield service
+    service.close()
+
+
+def test_send_retries_get(service):
+    service.session = FakeSession([503, requests.exceptions.ConnectionError(), 200])
+    response = service._send('GET', f"{service.base_url}/StudentMark.aspx")
+    assert response.status_code == 200
+    assert service.session.methods == ['GET', 'GET', 'GET']
+    assert ictu_service.portal_guard.failures == 0
+
+
+def test_send_does_not_retry_post(service):
+    service.session = FakeSession([503, 200])
+    response = service._send('POST', f"{service.base_url}/StudentMark.aspx")
+    assert response.status_code == 503
+    assert service.session.methods == ['POST']
+    service.session = FakeSession([requests.exceptions.Timeout()])
+    with pytest.raises(requests.exceptions.Timeout):
+        service._send('POST', f"{service.base_url}/StudentMark.aspx")
+    assert ictu_service.portal_guard.failures == 2
+
+
+def test_send_rejected_while_open(service):
+    guard = ictu_service.portal_guard
+    for _ in range(guard.threshold):
+        guard.record_failure('GET', 'StudentMark')
+    service.session = FakeSession([200])
+    with pytest.raises(ictu_service.PortalUnavailableError):
+        service._send('GET', f"{service.base_url}/StudentMark.aspx")
+    assert service.session.methods == []
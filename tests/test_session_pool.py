@@ -0,0 +1,150 @@
+"""SessionPool: LRU, idle TTL, dọn định kỳ, on_remove và tạo service ngoài lock."""
+import threading
+
+import pytest
+
+import session_pool
+from session_pool import SessionPool
+
+
+class FakeService:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(session_pool.time, 'monotonic', clock)
+    return clock
+
+
+def make_pool(**kwargs):
+    created, removed = [], []
+
+    def factory():
+        created.append(FakeService(f"s{len(created)}"))
+        return created[-1]
+
+    kwargs.setdefault('sweep_interval', 60)
+    pool = SessionPool(factory, on_remove=removed.append, **kwargs)
+    return pool, created, removed
+
+
+def test_get_reuses_service(clock):
+    pool, created, _ = make_pool()
+    service = pool.get('a')
+    assert pool.get('a') is service
+    assert pool.get('b', create=False) is None
+    assert pool.get(None) is None
+    assert len(created) == 1
+    assert pool.stats()['hits'] == 1 and pool.stats()['misses'] == 1
+
+
+def test_lru_eviction(clock):
+    pool, _, removed = make_pool(max_sessions=2)
+    a, b = pool.get('a'), pool.get('b')
+    clock.now += 1
+    pool.get('a')
+    c = pool.get('c')
+    # b ít dùng gần đây nhất nên bị loại, a vừa được dùng lại nên còn
+    assert removed == [b] and b.closed
+    assert pool.get('a', create=False) is a
+    assert pool.get('c', create=False) is c
+    assert pool.get('b', create=False) is None
+    assert pool.stats()['evictions'] == 1
+
+
+def test_idle_ttl(clock):
+    pool, created, removed = make_pool(idle_ttl=100)
+    old = pool.get('a')
+    clock.now += 101
+    new = pool.get('a')
+    assert new is not old
+    assert removed == [old] and old.closed
+    assert len(created) == 2
+    assert pool.stats()['expirations'] == 1
+
+
+def test_sweep_removes_idle_sessions_of_other_users(clock):
+    pool, _, removed = make_pool(idle_ttl=100, sweep_interval=60)
+    idle = pool.get('idle')
+    clock.now += 50
+    active = pool.get('active')
+    clock.now += 55
+    # Chưa tới lúc dọn: service hết hạn của người khác vẫn còn trong pool
+    assert pool.get('active') is active
+    assert removed == [] and pool.stats()['liveSessions'] == 2
+    clock.now += 10
+    assert pool.get('active') is active
+    assert removed == [idle] and idle.closed
+    assert pool.stats()['liveSessions'] == 1
+
+
+def test_discard_calls_on_remove(clock):
+    pool, _, removed = make_pool()
+    service = pool.get('a')
+    pool.discard('a')
+    pool.discard('missing')
+    assert removed == [service] and service.closed
+    assert pool.get('a', create=False) is None
+
+
+def test_factory_runs_outside_lock():
+    entered, release = threading.Event(), threading.Event()
+    services = []
+
+    def slow_factory():
+        services.append(FakeService(f"s{len(services)}"))
+        entered.set()
+        release.wait(5)
+        return services[-1]
+
+    pool = SessionPool(slow_factory)
+    results = {}
+    slow = threading.Thread(target=lambda: results.setdefault('a', pool.get('a')))
+    slow.start()
+    assert entered.wait(5)
+    # Trong lúc factory của 'a' đang chạy, request khác vẫn vào được pool
+    assert pool.get('b', create=False) is None
+    assert pool.stats()['liveSessions'] == 0
+    release.set()
+    slow.join(5)
+    assert results['a'] is services[0]
+
+
+def test_concurrent_create_keeps_one_service():
+    barrier = threading.Barrier(2)
+    created = []
+
+    def factory():
+        service = FakeService(f"s{len(created)}")
+        created.append(service)
+        barrier.wait(5)
+        return service
+
+    removed = []
+    pool = SessionPool(factory, on_remove=removed.append)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pool.get('a'))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(created) == 2
+    assert results[0] is results[1]
+    loser = next(service for service in created if service is not results[0])
+    assert loser.closed and removed == [loser]
+    assert pool.stats()['liveSessions'] == 1
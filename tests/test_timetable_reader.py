@@ -0,0 +1,79 @@
+"""So TimetableSheet với kết quả của cách đọc cũ bằng pandas (fixtures/timetable_reader_expected.json,
+sinh bằng bench/bench_timetable_reader.py --save-expected) để phần mô phỏng pandas không bị lệch."""
+import json
+import os
+
+import pytest
+
+from timetable_reader import TimetableSheet, build_timetable_data, compact_rows
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fixtures')
+
+with open(os.path.join(FIXTURES, 'timetable_reader_expected.json'), encoding='utf-8') as f:
+    EXPECTED = json.load(f)
+
+
+@pytest.fixture(params=sorted(EXPECTED))
+def case(request):
+    with open(os.path.join(FIXTURES, request.param), 'rb') as f:
+        return TimetableSheet(f.read()), EXPECTED[request.param]
+
+
+def test_major(case):
+    sheet, expected = case
+    assert sheet.major == expected['major']
+
+
+def test_columns(case):
+    sheet, expected = case
+    assert sheet.columns == expected['columns']
+
+
+def test_rows(case):
+    sheet, expected = case
+    assert len(sheet) == len(expected['rows'])
+    assert list(sheet.rows()) == expected['rows']
+
+
+def test_column(case):
+    sheet, expected = case
+    for name in expected['columns']:
+        assert sheet.column(name) == [row.get(name, '') for row in expected['rows']]
+
+
+def expand_compact(compact):
+    """Dựng lại danh sách dòng từ kết quả compact_rows (cách frontend đọc format=compact)"""
+    columns = compact['columns']
+    decoded = [[dictionary[code] for code in values] if dictionary is not None else values
+               for dictionary, values in zip(compact['dictionaries'], compact['data'])]
+    return [{name: decoded[j][i] for j, name in enumerate(columns)} for i in range(compact['rowCount'])]
+
+
+def test_compact_rows_round_trip(case):
+    sheet, _ = case
+    rows = build_timetable_data(sheet)
+    compact = compact_rows(rows)
+    assert compact['rowCount'] == len(rows)
+    assert all(len(values) == len(rows) for values in compact['data'])
+    assert expand_compact(compact) == rows
+
+
+def test_compact_rows_dictionary_and_missing_keys():
+    rows = [
+        {'subject': 'Toán', 'room': 'A1', 'week': 1},
+        {'room': 'A1', 'subject': 'Toán', 'week': 2},
+        {'subject': 'Toán', 'week': 3},
+        {'subject': 'Lý', 'room': 'A1', 'week': 4, 'note': 'x'},
+    ]
+    compact = compact_rows(rows)
+    assert compact['columns'] == ['subject', 'room', 'week', 'note']
+    # subject/room lặp lại nên dùng từ điển, week khác nhau ở mọi dòng thì giữ nguyên
+    subject, room, week, _ = compact['dictionaries']
+    assert subject == ['Toán', 'Lý'] and room == ['A1', None] and week is None
+    assert compact['data'][2] == [1, 2, 3, 4]
+    assert expand_compact(compact) == [{name: row.get(name) for name in compact['columns']} for row in rows]
+
+
+def test_compact_rows_empty():
+    assert compact_rows([]) == {'columns': [], 'dictionaries': [], 'data': [], 'rowCount': 0}
+    assert expand_compact(compact_rows([])) == []
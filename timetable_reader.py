@@ -0,0 +1,531 @@
+"""Đọc file Excel (.xls) thời khóa biểu của portal trong một lượt bằng xlrd.
+
+Trước đây file được đọc hai lần bằng pandas (15 dòng đầu để tìm header, rồi đọc lại
+toàn bộ). Module này mở workbook một lần, tìm dòng header và dòng "Ngành" trong cùng
+một lượt quét, rồi trả về từng dòng dạng dict mà không dựng DataFrame.
+
+Để timetableData giữ nguyên, giá trị các ô được chuyển thành chuỗi theo đúng quy tắc
+của pandas.read_excel + DataFrame.iterrows: kiểu dữ liệu suy ra theo cột (cột số có ô
+trống thành float nên 1 -> "1.0", chuỗi số trong cột số được chuyển thành số, các chuỗi
+"NA"/"nan"... là ô trống) và frame toàn cột số thì int bị đổi sang float.
+tests/test_timetable_reader.py so kết quả với fixtures/timetable_reader_expected.json, sinh từ
+pandas bằng bench/bench_timetable_reader.py --save-expected.
+"""
+import datetime
+import functools
+import re
+
+import xlrd
+
+from log_config import get_logger
+
+log = get_logger(__name__)
+
+HEADER_SCAN_ROWS = 15
+TIMETABLE_KEYWORDS = ['STT', 'Lớp học phần', 'Học phần', 'Thời gian', 'Địa điểm', 'Giảng viên', 'Thứ', 'Tiết học']
+MAJOR_PATTERN = re.compile(r'Ngành\s*:?\s*(.+)', re.IGNORECASE)
+
+# Các chuỗi pandas mặc định coi là NaN
+NA_STRINGS = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+])
+INT64_MIN, INT64_MAX, UINT64_MAX = -2 ** 63, 2 ** 63 - 1, 2 ** 64 - 1
+TRUE_STRINGS = frozenset(['True', 'TRUE', 'true'])
+FALSE_STRINGS = frozenset(['False', 'FALSE', 'false'])
+
+WEEK_PATTERN = re.compile(r'Tuần (\d+) \(((\d{2}/\d{2}/\d{4}) đến (\d{2}/\d{2}/\d{4}))\)')
+COURSE_CODE_PATTERN = re.compile(r'\(([^)]+)\)|\[([^\]]+)\]')
+CLASS_SUFFIX_PATTERN = re.compile(r'-\d+-\d+.*$')
+MEET_LINK_PATTERN = re.compile(r'(https?://)?(?:www\.)?meet\.google\.com/[^\s]+')
+LESSON_TYPE_PATTERN = re.compile(r'\(([A-Z]{2,3})\)')
+DIGITS_PATTERN = re.compile(r'\d+')
+
+# Ánh xạ tiết học sang thời gian cụ thể
+TIET_TIMES = {
+    1: {"start": "6:45", "end": "7:35"},
+    2: {"start": "7:40", "end": "8:30"},
+    3: {"start": "8:40", "end": "9:30"},
+    4: {"start": "9:40", "end": "10:30"},
+    5: {"start": "10:35", "end": "11:25"},
+    6: {"start": "13:00", "end": "13:50"},
+    7: {"start": "13:55", "end": "14:45"},
+    8: {"start": "14:55", "end": "15:45"},
+    9: {"start": "15:55", "end": "16:45"},
+    10: {"start": "16:50", "end": "17:40"},
+    11: {"start": "18:15", "end": "19:05"},
+    12: {"start": "19:10", "end": "20:00"},
+    13: {"start": "20:05", "end": "20:55"},
+    14: {"start": "20:20", "end": "21:10"},
+    15: {"start": "21:20", "end": "22:10"},
+}
+
+# Số giá trị khác nhau được nhớ cho mỗi phép chuẩn hóa (môn học lặp lại mỗi tuần)
+NORMALIZE_CACHE_SIZE = 4096
+
+_INT_RE = re.compile(r'\s*[+-]?\d+\s*\Z', re.ASCII)
+_FLOAT_RE = re.compile(r'\s*[+-]?(?:(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?|inf(?:inity)?)\s*\Z', re.ASCII | re.IGNORECASE)
+
+
+def _cell_value(value, ctype, datemode):
+    """Giá trị Python của một ô, giống pandas (_parse_cell của reader xlrd)"""
+    if ctype == xlrd.XL_CELL_NUMBER:
+        if value - value == 0:  # hữu hạn
+            as_int = int(value)
+            if as_int == value:
+                return as_int
+        return value
+    if ctype == xlrd.XL_CELL_DATE:
+        try:
+            dt = xlrd.xldate.xldate_as_datetime(value, datemode)
+        except OverflowError:
+            return value
+        # Excel không phân biệt ngày và giờ: ngày trùng mốc epoch được coi là chỉ có giờ
+        if (dt.year, dt.month, dt.day) == ((1904, 1, 1) if datemode else (1899, 12, 31)):
+            return dt.time()
+        return dt
+    if ctype == xlrd.XL_CELL_BOOLEAN:
+        return bool(value)
+    if ctype == xlrd.XL_CELL_ERROR:
+        return None
+    return value  # TEXT, EMPTY/BLANK ('')
+
+
+def _is_na(value):
+    return value is None or (value.__class__ is str and value in NA_STRINGS)
+
+
+def _to_number(value):
+    """Số mà pandas sẽ chuyển value thành khi suy ra cột số, None nếu không chuyển được"""
+    if isinstance(value, (int, float)):  # gồm cả bool
+        return value
+    if value.__class__ is str:
+        if _INT_RE.match(value):
+            return int(value)
+        if _FLOAT_RE.match(value):
+            return float(value)
+    return None
+
+
+class _Column:
+    """Một cột đã suy ra kiểu: kind ('int', 'float', 'bool', 'datetime', 'object') và chuỗi từng ô"""
+    __slots__ = ('kind', 'texts')
+
+    def __init__(self, values):
+        present = [v for v in values if not _is_na(v)]
+        has_na = len(present) < len(values)
+        if not present:
+            self.kind = 'float'
+            self.texts = [None] * len(values)
+            return
+
+        numbers = [_to_number(v) for v in present]
+        if None not in numbers:
+            if all(v.__class__ is bool for v in present) and not has_na:
+                self._fill('bool', values, present)
+                return
+            if has_na or any(n.__class__ is float for n in numbers):
+                self._fill('float', values, [float(n) for n in numbers])
+                return
+            # Số nguyên không vừa int64/uint64 thì pandas giữ cột object
+            if all(INT64_MIN <= n <= INT64_MAX for n in numbers) or all(0 <= n <= UINT64_MAX for n in numbers):
+                self._fill('int', values, [int(n) for n in numbers])
+                return
+
+        if all(v.__class__ is bool or v in TRUE_STRINGS or v in FALSE_STRINGS for v in present):
+            # Chuỗi "True"/"false"... được pandas chuyển thành bool
+            self._fill('bool' if not has_na else 'object', values,
+                       [v if v.__class__ is bool else v in TRUE_STRINGS for v in present])
+            return
+
+        if all(v.__class__ is datetime.datetime for v in present):
+            self._fill('datetime', values, present)
+            return
+
+        # Cột object: pandas chuyển bằng bảng băm nên các giá trị bằng nhau (1 và True)
+        # dùng chung chuỗi của giá trị gặp đầu tiên
+        seen = {}
+        texts = []
+        for v in values:
+            if _is_na(v):
+                texts.append(None)
+                continue
+            text = seen.get(v)
+            if text is None:
+                text = seen[v] = str(v)
+            texts.append(text)
+        self.kind = 'object'
+        self.texts = texts
+
+    def _fill(self, kind, values, converted):
+        it = iter(converted)
+        self.kind = kind
+        self.texts = [None if _is_na(v) else str(next(it)) for v in values]
+
+
+def _format_columns(rows, ncols):
+    """Chuỗi của từng ô (theo cột) giống str(cell) khi duyệt DataFrame tương ứng bằng iterrows (None = NaN)"""
+    if not rows:
+        return [[] for _ in range(ncols)]
+    columns = [_Column([row[c] for row in rows]) for c in range(ncols)]
+    kinds = {col.kind for col in columns}
+    # Frame chỉ gồm cột số: iterrows trả về mảng float nên số nguyên cũng thành "1.0"
+    if 'float' in kinds and kinds <= {'int', 'float'}:
+        for col in columns:
+            if col.kind == 'int':
+                col.texts = [None if t is None else str(float(int(t))) for t in col.texts]
+    return [col.texts for col in columns]
+
+
+def _format_rows(rows, ncols):
+    return [list(row) for row in zip(*_format_columns(rows, ncols))]
+
+
+def _column_names(header):
+    """Tên cột giống pandas: ô trống thành 'Unnamed: i', tên trùng thêm hậu tố .1, .2..."""
+    names = []
+    counts = {}
+    for i, value in enumerate(header):
+        name = f"Unnamed: {i}" if value is None or value == '' else value
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{name}.{count}"
+            count = counts.get(name, 0)
+        counts[name] = count + 1
+        names.append(name)
+    return names
+
+
+def _row_text(row):
+    return ' '.join(cell for cell in row if cell is not None)
+
+
+class TimetableSheet:
+    """Sheet đầu tiên của file TKB: dòng header, tên cột đã chuẩn hóa, ngành và các dòng dữ liệu"""
+
+    def __init__(self, content):
+        book = xlrd.open_workbook(file_contents=content, on_demand=True)
+        try:
+            sheet = book.sheet_by_index(0)
+            datemode = book.datemode
+            cells = [
+                [_cell_value(value, ctype, datemode)
+                 for value, ctype in zip(sheet.row_values(r), sheet.row_types(r))]
+                for r in range(sheet.nrows)
+            ]
+            self.ncols = sheet.ncols
+        finally:
+            book.release_resources()
+
+        # Tìm header và dòng "Ngành" trong cùng một lượt quét các dòng đầu
+        self.header_row_idx = None
+        self.major = ""
+        for i, row in enumerate(_format_rows(cells[:HEADER_SCAN_ROWS], self.ncols)):
+            row_text = _row_text(row)
+            if not self.major:
+                match = MAJOR_PATTERN.search(row_text.strip())
+                if match:
+                    self.major = match.group(1).strip()
+                    log.debug("Excel: Found major in header: %s", self.major)
+            if self.header_row_idx is None:
+                upper = row_text.upper()
+                keyword_count = sum(1 for keyword in TIMETABLE_KEYWORDS if keyword.upper() in upper)
+                if keyword_count >= 3:  # Tìm thấy hàng có ít nhất 3 keywords phù hợp
+                    self.header_row_idx = i
+                    log.debug("Excel: Found header row at index %s: %s keywords. Row content: %s...", i, keyword_count, upper[:100])
+
+        if self.header_row_idx is None:
+            log.warning("Excel: Could not find a suitable header row. Falling back to default.")
+            self.header_row_idx = 0
+
+        header = cells[self.header_row_idx] if cells else []
+        self._nrows = max(0, len(cells) - self.header_row_idx - 1)
+        self._data = _format_columns(cells[self.header_row_idx + 1:], self.ncols)
+        self.columns = self._rename_columns(_column_names(header))
+        first_rows = list(zip(*(col[:5] for col in self._data)))
+
+        if not self.major:
+            # Thử tìm trong các dòng dữ liệu đầu tiên
+            for row in first_rows:
+                match = MAJOR_PATTERN.search(_row_text(row).strip())
+                if match:
+                    self.major = match.group(1).strip()
+                    log.debug("Excel: Found major in main df: %s", self.major)
+                    break
+        if not self.major and 'Lớp học phần' in self.columns:
+            # Thử lấy từ cột "Lớp học phần" nếu có định dạng đặc biệt
+            for val in self._data[self.columns.index('Lớp học phần')][:5]:
+                if val is not None and 'ngành' in val.lower():
+                    match = MAJOR_PATTERN.search(val)
+                    if match:
+                        self.major = match.group(1).strip()
+                        log.debug("Excel: Found major in 'Lớp học phần': %s", self.major)
+                        break
+
+    @staticmethod
+    def _rename_columns(columns):
+        """Chuẩn hóa tên cột: cột chứa 'thứ' thành 'Thứ', 'Địa điểm' thành 'Phòng'"""
+        thu_col_name = None
+        for col in columns:
+            if 'thứ' in str(col).lower():
+                thu_col_name = col
+                break
+        rename = {'Địa điểm': 'Phòng'}
+        if thu_col_name:
+            log.debug("Excel: Found 'Thứ' column as '%s'", thu_col_name)
+            rename[thu_col_name] = 'Thứ'
+        else:
+            log.warning("Excel: Could not find a column for 'Thứ'. Date calculation might be incorrect.")
+        return [rename.get(col, col) for col in columns]
+
+    def __len__(self):
+        return self._nrows
+
+    def rows(self):
+        """Từng dòng dữ liệu dạng dict {tên cột: chuỗi đã strip}, ô trống là ''"""
+        columns = self.columns
+        for row in zip(*self._data):
+            yield {col: ('' if value is None else value.strip()) for col, value in zip(columns, row)}
+
+    def column(self, name):
+        """Toàn bộ giá trị của một cột (chuỗi đã strip, ô trống là ''), giống row_dict.get(name, '')
+        khi duyệt rows(): nếu trùng tên thì lấy cột sau cùng, không có cột thì toàn ''"""
+        for col, values in zip(reversed(self.columns), reversed(self._data)):
+            if col == name:
+                return ['' if value is None else value.strip() for value in values]
+        return [''] * self._nrows
+
+
+# --- Chuẩn hóa theo cột: mỗi hàm xử lý một giá trị, được nhớ lại vì cùng một môn
+# xuất hiện lặp lại ở mọi tuần trong học kỳ ---
+
+def _forward_fill(values):
+    """Ô trống lấy giá trị gần nhất phía trên (merged cell của cột Thứ)"""
+    filled = []
+    last = ""
+    for value in values:
+        if value:
+            last = value
+        filled.append(last)
+    return filled
+
+
+def _week_column(lop_hoc_phan):
+    """Thông tin tuần (week_number, ngày bắt đầu) áp dụng cho từng dòng, None với dòng tiêu đề tuần"""
+    weeks = []
+    current = ("", None)
+    for value in lop_hoc_phan:
+        lower = value.lower()
+        if 'tuần' in lower and 'đến' in lower:
+            week_match = WEEK_PATTERN.search(value)
+            if week_match:
+                try:
+                    start = datetime.datetime.strptime(week_match.group(3), '%d/%m/%Y')
+                except ValueError:
+                    start = None
+                current = (week_match.group(1), start)
+            weeks.append(None)
+        else:
+            weeks.append(current)
+    return weeks
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def split_course(lop_hoc_phan):
+    """(maHP, tenHP) từ "Tên học phần-1-25 (Mã HP)": mã là cặp ngoặc cuối cùng"""
+    all_matches = list(COURSE_CODE_PATTERN.finditer(lop_hoc_phan))
+    if not all_matches:
+        return '', lop_hoc_phan.strip()
+    match = all_matches[-1]
+    ten_hp = CLASS_SUFFIX_PATTERN.sub('', lop_hoc_phan[:match.start()].strip()).strip()
+    return (match.group(1) or match.group(2)).strip(), ten_hp
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def split_lecturer(raw):
+    """(giangVien, meetLink) từ ô "Giảng viên/ link meet" """
+    if '\n' in raw:
+        name, link_part = raw.split('\n', 1)
+        url_match = MEET_LINK_PATTERN.search(link_part.strip())
+        if url_match:
+            return name.strip(), _full_link(url_match.group(0))
+    url_match = MEET_LINK_PATTERN.search(raw)
+    if url_match:
+        return raw.replace(url_match.group(0), '').strip(), _full_link(url_match.group(0))
+    return raw.strip(), ''
+
+
+def _full_link(link):
+    return link if link.startswith('http') else 'https://' + link
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_thu(value):
+    """"2" / "2.0" -> "Thứ 2", giá trị khác giữ nguyên"""
+    value = value.strip()
+    if value and value.replace('.', '', 1).isdigit():
+        try:
+            return f"Thứ {int(float(value))}"
+        except ValueError:
+            return value
+    return value
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_tiet(value):
+    """(tiết đã chuẩn hóa "1-3", buổi học "6:45 - 9:30") từ ô "Tiết học" """
+    tiet = value.replace(' --> ', '-').replace('-->', '-').strip()
+    buoi_hoc = "Không xác định"
+    if tiet:
+        tiet_numbers = [int(s) for s in DIGITS_PATTERN.findall(tiet) if s.isdigit()]
+        if tiet_numbers:
+            start_time = TIET_TIMES.get(min(tiet_numbers), {}).get("start", "")
+            end_time = TIET_TIMES.get(max(tiet_numbers), {}).get("end", "")
+            if start_time and end_time:
+                buoi_hoc = f"{start_time} - {end_time}"
+    return tiet, buoi_hoc
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def subject_date(week_start, thu):
+    """Ngày học (dd/mm/yyyy) của "Thứ X" trong tuần bắt đầu từ week_start, '' nếu không tính được"""
+    if not week_start or not thu:
+        return ''
+    thu_digit_match = DIGITS_PATTERN.search(thu)
+    if not thu_digit_match:
+        return ''
+    # Map 'Thứ' to a 0-indexed day of the week (0=Monday, 6=Sunday)
+    day_of_week_index = int(thu_digit_match.group(0)) - 2
+    if 'chủ nhật' in thu.lower():
+        day_of_week_index = 6
+    if not 0 <= day_of_week_index <= 6:
+        return ''
+    days_to_add = (day_of_week_index - week_start.weekday() + 7) % 7
+    return (week_start + datetime.timedelta(days=days_to_add)).strftime('%d/%m/%Y')
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def lesson_type(thoi_gian, ghi_chu):
+    """Loại buổi học (LT, TH...) từ cột 'Thời gian', nếu không có thì từ 'Ghi chú'"""
+    match = LESSON_TYPE_PATTERN.search(thoi_gian) or LESSON_TYPE_PATTERN.search(ghi_chu)
+    return match.group(1) if match else ''
+
+
+def build_timetable_data(sheet):
+    """Chuyển các dòng của TimetableSheet thành timetableData (danh sách buổi học).
+
+    Xử lý theo cột: điền tiếp cột Thứ, xác định tuần của từng dòng, chọn dòng môn học
+    (STT là số và có Lớp học phần) rồi chuẩn hóa từng cột qua các hàm đã nhớ kết quả.
+    """
+    stt = sheet.column('STT')
+    lop_hoc_phan = sheet.column('Lớp học phần')
+    thu = [normalize_thu(value) for value in _forward_fill(sheet.column('Thứ'))]
+    weeks = _week_column(lop_hoc_phan)
+    selected = [i for i, week in enumerate(weeks)
+                if week is not None and lop_hoc_phan[i] and _is_number(stt[i])]
+    if not selected:
+        return []
+
+    def pick(values):
+        return [values[i] for i in selected]
+
+    courses = [split_course(value) for value in pick(lop_hoc_phan)]
+    lecturers = [split_lecturer(value) for value in pick(sheet.column('Giảng viên/ link meet'))]
+    tiets = [normalize_tiet(value) for value in pick(sheet.column('Tiết học'))]
+    ghi_chu = pick(sheet.column('Ghi chú'))
+    lesson_types = [lesson_type(t, g) for t, g in zip(pick(sheet.column('Thời gian')), ghi_chu)]
+    selected_thu = pick(thu)
+    selected_weeks = pick(weeks)
+    dates = [subject_date(start, t) for (_, start), t in zip(selected_weeks, selected_thu)]
+
+    columns = zip(pick(stt), pick(lop_hoc_phan), courses, pick(sheet.column('Số TC')), selected_thu, tiets,
+                  pick(sheet.column('Phòng')), lecturers, pick(sheet.column('Sĩ số')), pick(sheet.column('Số ĐK')),
+                  pick(sheet.column('Học phí')), ghi_chu, dates, selected_weeks, lesson_types)
+    return [
+        {
+            "stt": stt_value,
+            "lopHocPhan": lop,
+            "maHP": ma_hp,
+            "tenHP": ten_hp,
+            "soTC": so_tc,
+            "thu": thu_value,
+            "tiet": tiet,
+            "phong": phong,
+            "giangVien": giang_vien,
+            "meetLink": meet_link,
+            "siSo": si_so,
+            "soDK": so_dk,
+            "hocPhi": hoc_phi,
+            "ghiChu": note,
+            "from_date": date,
+            "to_date": date,
+            "week_number": week_number,
+            "lesson_type": lesson,
+            "thoiGian": thu_value,
+            "buoiHoc": buoi_hoc,
+        }
+        for (stt_value, lop, (ma_hp, ten_hp), so_tc, thu_value, (tiet, buoi_hoc), phong, (giang_vien, meet_link),
+             si_so, so_dk, hoc_phi, note, date, (week_number, _), lesson) in columns
+    ]
+
+
+def _lesson_order(row):
+    """Khóa sắp xếp buổi học: ngày học (dd/mm/yyyy), buổi không có ngày xếp cuối, rồi tiết bắt đầu"""
+    day, _, rest = row['from_date'].partition('/')
+    month, _, year = rest.partition('/')
+    date = (0, year, month, day) if year else (1, '', '', '')
+    first_tiet = DIGITS_PATTERN.search(row['tiet'])
+    return date, int(first_tiet.group(0)) if first_tiet else 0
+
+
+def merge_timetable_rows(row_lists):
+    """Gộp timetableData của nhiều lần xuất Excel (mỗi lần một tuần): bỏ buổi học trùng
+    (cùng lớp học phần, ngày, tiết, phòng) và sắp theo ngày học rồi tiết"""
+    seen = set()
+    merged = []
+    for rows in row_lists:
+        for row in rows:
+            key = (row['lopHocPhan'], row['from_date'], row['tiet'], row['phong'], row['week_number'])
+            if key not in seen:
+                seen.add(key)
+                merged.append(row)
+    merged.sort(key=_lesson_order)
+    return merged
+
+
+def compact_rows(rows):
+    """timetableData dạng cột cho format=compact: mỗi cột một mảng giá trị, cột có nhiều giá trị
+    lặp lại (môn học, phòng, giảng viên... giống nhau mỗi tuần) được mã hóa bằng từ điển.
+
+    Trả về {columns, dictionaries, data, rowCount}: data[j][i] là giá trị cột columns[j] của dòng i,
+    hoặc chỉ số trong dictionaries[j] nếu dictionaries[j] khác null. Khóa thiếu ở một dòng là null.
+    """
+    columns = list(dict.fromkeys(name for row in rows for name in row))
+    keys = tuple(columns)
+    if all(tuple(row) == keys for row in rows):
+        # Các dòng cùng tạo từ một mẫu dict nên thường cùng thứ tự khóa: chuyển vị bằng zip
+        column_values = zip(*(row.values() for row in rows)) if rows else ()
+    else:
+        column_values = ([row.get(name) for row in rows] for name in columns)
+    dictionaries = []
+    data = []
+    for values in column_values:
+        # Từ điển chỉ có lợi khi số giá trị khác nhau ít hơn hẳn số dòng
+        distinct = list(dict.fromkeys(values))
+        if len(distinct) * 2 <= len(values):
+            index = {value: code for code, value in enumerate(distinct)}
+            dictionaries.append(distinct)
+            data.append(list(map(index.__getitem__, values)))
+        else:
+            dictionaries.append(None)
+            data.append(list(values))
+    return {'columns': columns, 'dictionaries': dictionaries, 'data': data, 'rowCount': len(rows)}
@@ -0,0 +1,105 @@
+"""Trace nhẹ theo từng request API, xuất ra header Server-Timing và khối JSON ?trace=1.
+
+Đầu mỗi request app gọi start_request(); trace được giữ trong một contextvar nên ICTUService
+chỉ cần bọc các bước bằng span('fetch', 'GET StudentMark.aspx') hoặc @traced('parse', ...)
+mà không phải truyền trace qua tham số. Khi request không có trace (ngoài /api/*, warmup,
+bench) span() gần như không tốn gì.
+
+Các span dùng trong app:
+  auth       kiểm tra đăng nhập (probe / relogin nếu có)
+  fetch      mỗi request tới portal, desc = "METHOD trang"
+  parse      mỗi hàm parse/đọc Excel, desc = tên hàm
+  normalize  chuẩn hóa dữ liệu (bảng TKB, dữ liệu trả về cho frontend)
+  serialize  tạo JSON response
+"""
+import contextlib
+import contextvars
+import functools
+import time
+
+_current = contextvars.ContextVar('trace', default=None)
+
+
+class Trace:
+    """Các span của một request: (tên, mô tả, bắt đầu, thời gian) tính theo perf_counter"""
+
+    __slots__ = ('started', 'spans')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add(self, name, started, duration, desc=None):
+        # list.append là atomic, span từ thread khác (các tuần TKB chạy song song, threadpool parse) ghi thẳng vào đây
+        self.spans.append((name, desc, started, duration))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Giá trị header Server-Timing (ms), kết thúc bằng span total"""
+        parts = []
+        for name, desc, _, duration in self.spans:
+            part = f"{name};dur={duration * 1000:.1f}"
+            if desc:
+                part += ';desc="' + str(desc).replace('\\', '\\\\').replace('"', '\\"') + '"'
+            parts.append(part)
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ', '.join(parts)
+
+    def as_dict(self):
+        """Khối 'trace' trả về khi gọi API với ?trace=1"""
+        return {
+            'totalMs': round(self.elapsed() * 1000, 2),
+            'spans': [
+                {
+                    'name': name,
+                    'desc': desc,
+                    'startMs': round((started - self.started) * 1000, 2),
+                    'durMs': round(duration * 1000, 2),
+                }
+                for name, desc, started, duration in sorted(self.spans, key=lambda span: span[2])
+            ],
+        }
+
+
+def start_request(enabled=True):
+    """Bắt đầu trace cho request hiện tại (hoặc tắt trace nếu enabled=False), gọi đầu mỗi request"""
+    trace = Trace() if enabled else None
+    _current.set(trace)
+    return trace
+
+
+def current():
+    return _current.get()
+
+
+def record(name, started, desc=None):
+    """Ghi span từ một mốc perf_counter đã đo sẵn tới bây giờ"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, started, time.perf_counter() - started, desc)
+
+
+@contextlib.contextmanager
+def span(name, desc=None):
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, started, time.perf_counter() - started, desc)
+
+
+def traced(name, desc=None):
+    """Decorator ghi cả hàm thành một span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, desc):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
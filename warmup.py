@@ -0,0 +1,86 @@
+"""Khởi động nóng cho gunicorn: parse thử các trang mẫu trong fixtures/ trước khi nhận request.
+
+Lần parse đầu tiên của một process phải import bs4/xlrd, biên dịch regex, dựng bộ
+nhớ đệm của html.parser... Chạy warm_up() trong gunicorn master (preload_app) thì
+chi phí này chỉ trả một lần và các worker fork ra dùng chung bộ nhớ (copy-on-write).
+
+Các lần parse thử cũng được ghi vào metrics (tkb_parse_seconds...); warm_up() xóa chúng
+khi xong để worker không kế thừa số liệu không phải của request thật.
+"""
+import gc
+import os
+import time
+
+from ictu_service import ICTUService
+from log_config import get_logger
+from metrics import REGISTRY
+
+log = get_logger(__name__)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def _read(name, mode='r'):
+    with open(os.path.join(FIXTURES_DIR, name), mode, **({} if 'b' in mode else {'encoding': 'utf-8'})) as f:
+        return f.read()
+
+
+def warm_up():
+    """Parse từng fixture một lần bằng một ICTUService tạm (không gửi request nào), trả về thời gian (giây) từng bước"""
+    service = ICTUService()
+    steps = [
+        ('login', lambda: service._build_login_form(_read('login.html'), 'warmup', 'warmup')),
+        ('profile', lambda: service._parse_profile(_read('Home.html'))),
+        ('scores', lambda: service._parse_scores(_read('StudentMark.html'))),
+        ('exams', lambda: service._parse_exam_schedule(_read('StudentViewExamList.html'))),
+        ('timetable_html', lambda: service._parse_timetable_html(_read('StudentTimeTable.html'))),
+        ('timetable_form', lambda: service._build_timetable_form(
+            _read('StudentTimeTable.html'), f"{service.base_url}/Reports/Form/StudentTimeTable.aspx")),
+        ('timetable_excel', lambda: service._parse_timetable_excel(_read('timetable.xls', 'rb'))),
+    ]
+    timings = {}
+    try:
+        for name, step in steps:
+            started = time.perf_counter()
+            try:
+                result = step()
+                if isinstance(result, dict) and result.get('error'):
+                    log.warning("Warmup %s: %s", name, result.get('message'))
+            except Exception as e:
+                log.warning("Warmup %s failed: %s", name, e)
+            timings[name] = time.perf_counter() - started
+    finally:
+        service.close()
+        # Chạy trước khi nhận request (master hoặc worker mới), nên mọi giá trị lúc này đều do warmup
+        REGISTRY.reset()
+    total = sum(timings.values())
+    log.info("Warmup done in %.0f ms: %s", total * 1000,
+             ", ".join(f"{name} {elapsed * 1000:.0f} ms" for name, elapsed in timings.items()))
+    return timings
+
+
+def freeze_heap():
+    """Dọn rác rồi chuyển mọi object hiện có sang vùng 'permanent' của gc, để GC trong worker
+    không chạm vào (và không làm bẩn các trang nhớ dùng chung với master)"""
+    gc.collect()
+    gc.freeze()
+    return gc.get_freeze_count()
+
+
+def memory_usage(pid='self'):
+    """RSS / PSS / USS (KB) của một process theo /proc (Linux), {} nếu không đọc được"""
+    fields = {'Rss': 'rss', 'Pss': 'pss', 'Private_Clean': 'uss', 'Private_Dirty': 'uss'}
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in fields:
+                    usage[fields[key]] = usage.get(fields[key], 0) + int(value.split()[0])
+    except (OSError, ValueError):
+        pass
+    return usage
+
+
+def format_memory(usage):
+    return " ".join(f"{key.upper()}={value / 1024:.1f}MB" for key, value in usage.items()) or "n/a"